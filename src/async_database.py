@@ -0,0 +1,650 @@
+"""Supabase data access for the cogs.
+
+Every query goes through the shared PostgREST client in utils.postgrest, so
+cogs can await them directly on the event loop. Row helpers, TWITCH_INDEX,
+the timezone/birthday caches and music storage live in database.py.
+
+Reads of the tables in REPLICATED_TABLES are served from the local replica
+(utils.replica) once it has synced them, and mutations are written through
+to it after Supabase accepts them. Frequent small mutations (settings,
+embed pages, timezones, birthdays, music tracks) go through the
+write-behind queue instead: they return once the write is journaled
+locally and reach Supabase in coalesced batches. Reads of the queued
+tables that aren't replicated (embeds, birthday channels) have the queued
+writes overlaid, so they never trail a command's own write.
+"""
+import asyncio
+import database
+from database import (
+    TWITCH_INDEX,
+    format_supabase_error,
+    default_guild_settings,
+    parse_guild_settings_row,
+    build_guild_settings_row,
+)
+from utils.postgrest import postgrest, eq, neq, ilike, in_
+from utils.replica import replica, REPLICATED_TABLES
+from utils.write_behind import write_behind
+
+
+def _on_replica_change(table: str) -> None:
+    if table == "user_timezones":
+        database.TIMEZONES_CACHE = None
+    elif table == "user_birthdays":
+        database.BIRTHDAYS_CACHE = None
+
+replica.on_change = _on_replica_change
+
+
+async def _get_row(table: str, pk) -> dict | None:
+    """One row by primary key, from the replica once the table has synced.
+
+    Before that it is read from Supabase and kept locally; if Supabase fails
+    a local copy is served when there is one, otherwise the error is raised.
+    """
+    if replica.ready(table):
+        return replica.get(table, pk)
+    try:
+        rows = await postgrest.select(table, filters={REPLICATED_TABLES[table]: eq(pk)})
+    except Exception:
+        local = replica.get(table, pk)
+        if local is None:
+            raise
+        return local
+    if rows:
+        await replica.put(table, rows)
+        return rows[0]
+    await replica.remove(table, [pk])
+    return None
+
+async def _all_rows(table: str) -> list:
+    """Every row of a replicated table; the first call syncs the table into the replica."""
+    if not replica.ready(table):
+        await replica.sync_table(table)
+    return replica.all(table)
+
+
+async def init_db():
+    try:
+        await postgrest.select("guild_settings", "guild_id", limit=1)
+        print("Connected to Supabase successfully.")
+    except Exception as e:
+        print(f"Error connecting to Supabase: {format_supabase_error(e)}")
+
+async def close_db():
+    await postgrest.close()
+
+
+# ==================== Guild Settings Functions ====================
+
+async def fetch_guild_settings(guild_id: int) -> dict | None:
+    """Fetch one guild's settings (uncached).
+
+    Returns defaults when the guild has no row, and None when the request fails
+    so callers can keep serving what they already have.
+    """
+    try:
+        row = await _get_row("guild_settings", guild_id)
+    except Exception as e:
+        print(f"Error fetching guild settings: {format_supabase_error(e)}")
+        return None
+
+    if row is None:
+        return default_guild_settings()
+    return parse_guild_settings_row(row)
+
+async def fetch_guild_settings_bulk(guild_ids: list) -> dict[str, dict] | None:
+    """Fetch settings for many guilds in one query (uncached).
+
+    Guilds without a row are omitted; returns None when the request fails.
+    """
+    ids = [str(g) for g in guild_ids]
+    if not ids:
+        return {}
+    if replica.ready("guild_settings"):
+        return {gid: parse_guild_settings_row(row) for gid, row in replica.get_many("guild_settings", ids).items()}
+    try:
+        rows = await postgrest.select("guild_settings", filters={"guild_id": in_(ids)})
+        await replica.put("guild_settings", rows)
+    except Exception as e:
+        print(f"Error fetching guild settings: {format_supabase_error(e)}")
+        return None
+    return {str(row["guild_id"]): parse_guild_settings_row(row) for row in rows}
+
+async def save_guild_settings(guild_id: int, settings: dict) -> bool:
+    """Upsert a guild's settings row (uncached)."""
+    try:
+        await write_behind.upsert("guild_settings", build_guild_settings_row(guild_id, settings))
+        return True
+    except Exception as e:
+        print(f"Error saving guild settings: {format_supabase_error(e)}")
+        return False
+
+
+# ==================== Users Table Functions ====================
+
+async def get_user(discord_id: str) -> dict | None:
+    """Get a user by Discord ID."""
+    try:
+        return await _get_row("users", discord_id)
+    except Exception as e:
+        print(f"Error fetching user: {format_supabase_error(e)}")
+        return None
+
+async def get_all_users_with_twitch() -> list:
+    """Get all users with linked Twitch accounts."""
+    try:
+        return [{"discord_id": u["discord_id"], "twitch_username": u["twitch_username"]}
+                for u in await _all_rows("users") if u.get("twitch_username") is not None]
+    except Exception as e:
+        print(f"Error fetching Twitch users: {format_supabase_error(e)}")
+        return []
+
+async def get_all_users_with_youtube() -> list:
+    """Get all users with linked YouTube accounts."""
+    try:
+        return [{"discord_id": u["discord_id"], "youtube_channel": u["youtube_channel"]}
+                for u in await _all_rows("users") if u.get("youtube_channel") is not None]
+    except Exception as e:
+        print(f"Error fetching YouTube users: {format_supabase_error(e)}")
+        return []
+
+async def get_twitch_links() -> list | None:
+    """Get discord_id, twitch_id and twitch_username for every user with a twitch_id; None on error."""
+    try:
+        return [{"discord_id": u["discord_id"], "twitch_id": u["twitch_id"], "twitch_username": u.get("twitch_username")}
+                for u in await _all_rows("users") if u.get("twitch_id") is not None]
+    except Exception as e:
+        print(f"Error fetching Twitch links: {format_supabase_error(e)}")
+        return None
+
+async def bulk_update_twitch_usernames(changes: list) -> int:
+    """Apply (discord_id, twitch_id, twitch_username) changes with batched upserts; returns rows written."""
+    written = 0
+    try:
+        for i in range(0, len(changes), 500):
+            chunk = changes[i:i + 500]
+            rows = [{"discord_id": str(d), "twitch_username": login} for d, _, login in chunk]
+            await postgrest.upsert("users", rows)
+            await replica.put("users", rows)
+            for discord_id, twitch_id, login in chunk:
+                TWITCH_INDEX.update("users", discord_id, twitch_id, login)
+            written += len(chunk)
+    except Exception as e:
+        print(f"Error bulk updating Twitch usernames: {format_supabase_error(e)}")
+    return written
+
+async def upsert_user(discord_id: str, twitch_username: str = None, youtube_channel: str = None, twitch_id: str = None):
+    """Insert or update a user, preserving fields that aren't being set."""
+    try:
+        existing = await get_user(discord_id) or {}
+        data = {"discord_id": str(discord_id)}
+        for field, value in (("twitch_username", twitch_username),
+                             ("youtube_channel", youtube_channel),
+                             ("twitch_id", twitch_id)):
+            if value is not None:
+                data[field] = value
+            elif existing.get(field):
+                data[field] = existing[field]
+
+        await replica.put("users", await postgrest.upsert("users", data, returning="*"))
+        TWITCH_INDEX.set("users", discord_id, data.get("twitch_id"), data.get("twitch_username"))
+    except Exception as e:
+        print(f"Error upserting user: {format_supabase_error(e)}")
+
+async def update_user_twitch(discord_id: str, twitch_username: str = None, twitch_id: str = None):
+    """Update Twitch fields for a user."""
+    try:
+        data = {}
+        if twitch_username is not None:
+            data["twitch_username"] = twitch_username
+        if twitch_id is not None:
+            data["twitch_id"] = twitch_id
+
+        if data:
+            await replica.put("users", await postgrest.update("users", data, {"discord_id": eq(discord_id)}, returning="*"))
+            TWITCH_INDEX.update("users", discord_id, twitch_id, twitch_username)
+    except Exception as e:
+        print(f"Error updating user Twitch: {format_supabase_error(e)}")
+
+async def update_twitch_username_by_id(twitch_id: str, twitch_username: str):
+    """Update twitch_username for all users with a given twitch_id."""
+    try:
+        rows = await postgrest.update("users", {"twitch_username": twitch_username}, {"twitch_id": eq(twitch_id)}, returning="*")
+        await replica.put("users", rows)
+        TWITCH_INDEX.rename(twitch_id, twitch_username)
+        return True
+    except Exception as e:
+        print(f"Error updating Twitch username by ID: {format_supabase_error(e)}")
+        return False
+
+async def clear_user_twitch(discord_id: str):
+    """Clear Twitch fields for a user."""
+    try:
+        rows = await postgrest.update("users", {"twitch_username": None, "twitch_id": None}, {"discord_id": eq(discord_id)}, returning="*")
+        await replica.put("users", rows)
+        TWITCH_INDEX.remove("users", discord_id)
+    except Exception as e:
+        print(f"Error clearing user Twitch: {format_supabase_error(e)}")
+
+async def clear_user_youtube(discord_id: str):
+    """Clear YouTube field for a user."""
+    try:
+        rows = await postgrest.update("users", {"youtube_channel": None}, {"discord_id": eq(discord_id)}, returning="*")
+        await replica.put("users", rows)
+    except Exception as e:
+        print(f"Error clearing user YouTube: {format_supabase_error(e)}")
+
+
+# ==================== Streamers Table Functions ====================
+
+async def get_streamer(discord_id: str) -> dict | None:
+    """Get a streamer by Discord ID."""
+    try:
+        rows = await postgrest.select("streamers", filters={"discord_id": eq(discord_id)})
+        return rows[0] if rows else None
+    except Exception as e:
+        print(f"Error fetching streamer: {format_supabase_error(e)}")
+        return None
+
+async def streamer_exists(discord_id: str) -> bool | None:
+    """Whether a streamer row exists for this Discord ID; None when the request fails."""
+    try:
+        return bool(await postgrest.select("streamers", "discord_id", filters={"discord_id": eq(discord_id)}, limit=1))
+    except Exception as e:
+        print(f"Error checking streamer: {format_supabase_error(e)}")
+        return None
+
+async def get_streamer_by_twitch_id(twitch_id: str) -> dict | None:
+    """Get a streamer by Twitch ID."""
+    try:
+        rows = await postgrest.select("streamers", filters={"twitch_id": eq(twitch_id)})
+        return rows[0] if rows else None
+    except Exception as e:
+        print(f"Error fetching streamer by Twitch ID: {format_supabase_error(e)}")
+        return None
+
+async def upsert_streamer(discord_id: str, twitch_id: str, twitch_username: str, access_token: str, refresh_token: str):
+    """Insert or update a streamer."""
+    try:
+        await postgrest.upsert("streamers", {
+            "discord_id": str(discord_id),
+            "twitch_id": twitch_id,
+            "twitch_username": twitch_username,
+            "access_token": access_token,
+            "refresh_token": refresh_token
+        })
+        TWITCH_INDEX.set("streamers", discord_id, twitch_id, twitch_username)
+    except Exception as e:
+        print(f"Error upserting streamer: {format_supabase_error(e)}")
+
+async def delete_streamer_by_twitch_id(twitch_id: str) -> str | None:
+    """Delete a streamer by Twitch ID and return the discord_id."""
+    try:
+        rows = await postgrest.delete("streamers", {"twitch_id": eq(twitch_id)}, returning="discord_id")
+        if rows:
+            discord_id = rows[0]["discord_id"]
+            TWITCH_INDEX.remove("streamers", discord_id)
+            return discord_id
+        return None
+    except Exception as e:
+        print(f"Error deleting streamer by Twitch ID: {format_supabase_error(e)}")
+        return None
+
+async def delete_streamer_by_discord_id(discord_id: str) -> str | None:
+    """Delete a streamer by Discord ID and return the twitch_id."""
+    try:
+        rows = await postgrest.delete("streamers", {"discord_id": eq(discord_id)}, returning="twitch_id")
+        if rows:
+            TWITCH_INDEX.remove("streamers", discord_id)
+            return rows[0]["twitch_id"]
+        return None
+    except Exception as e:
+        print(f"Error deleting streamer by Discord ID: {format_supabase_error(e)}")
+        return None
+
+async def update_streamer_tokens(discord_id: str, access_token: str, refresh_token: str):
+    """Update OAuth tokens for a streamer."""
+    try:
+        await postgrest.update("streamers", {
+            "access_token": access_token,
+            "refresh_token": refresh_token
+        }, {"discord_id": eq(discord_id)})
+    except Exception as e:
+        print(f"Error updating streamer tokens: {format_supabase_error(e)}")
+
+
+# ==================== Discord ID Lookup Functions ====================
+
+async def get_discord_ids_by_twitch(twitch_identifier: str) -> list:
+    """Get Discord IDs from Twitch identifier (ID or username).
+
+    Answered from TWITCH_INDEX when possible; on a miss the four lookups
+    run concurrently instead of one after another.
+    """
+    if not twitch_identifier:
+        return []
+
+    cached = TWITCH_INDEX.lookup(twitch_identifier)
+    if cached is not None:
+        return cached
+
+    identifier = str(twitch_identifier)
+    discord_ids = []
+    try:
+        if identifier.isdigit():
+            results = await asyncio.gather(
+                postgrest.select("streamers", "discord_id", {"twitch_id": eq(identifier)}),
+                postgrest.select("users", "discord_id", {"twitch_id": eq(identifier)}),
+            )
+            discord_ids.extend(r["discord_id"] for rows in results for r in rows if r.get("discord_id"))
+
+        # If no results, search by username (case-insensitive)
+        if not discord_ids:
+            results = await asyncio.gather(
+                postgrest.select("users", "discord_id", {"twitch_username": ilike(identifier)}),
+                postgrest.select("streamers", "discord_id", {"twitch_username": ilike(identifier)}),
+            )
+            discord_ids.extend(r["discord_id"] for rows in results for r in rows if r.get("discord_id"))
+    except Exception as e:
+        print(f"Error looking up Discord IDs by Twitch: {format_supabase_error(e)}")
+
+    seen = set()
+    return [d for d in discord_ids if not (d in seen or seen.add(d))]
+
+async def load_twitch_index() -> bool:
+    """Load every linked Twitch identity into TWITCH_INDEX, e.g. on startup."""
+    try:
+        linked = {"or": "(twitch_id.not.is.null,twitch_username.not.is.null)"}
+        users, streamers = await asyncio.gather(
+            _all_rows("users"),
+            postgrest.select_all("streamers", "discord_id,twitch_id,twitch_username", linked, order="discord_id"),
+        )
+        users = [u for u in users if u.get("twitch_id") or u.get("twitch_username")]
+        TWITCH_INDEX.load({"users": users, "streamers": streamers})
+        return True
+    except Exception as e:
+        print(f"Error loading Twitch identity index: {format_supabase_error(e)}")
+        return False
+
+
+# ==================== User Timezone Functions ====================
+
+async def get_user_timezone(discord_id: str) -> dict | None:
+    """Get a user's timezone info."""
+    if database.TIMEZONES_CACHE is not None:
+        for tz in database.TIMEZONES_CACHE:
+            if tz.get("discord_id") == str(discord_id):
+                return tz
+        return None  # Cache is full table, so if not found, it doesn't exist
+
+    try:
+        return await _get_row("user_timezones", discord_id)
+    except Exception as e:
+        print(f"Error fetching user timezone: {format_supabase_error(e)}")
+        return None
+
+async def set_user_timezone(discord_id: str, city: str, country: str, timezone: str, country_code: str = None):
+    """Set a user's timezone."""
+    try:
+        await write_behind.upsert("user_timezones", {
+            "discord_id": str(discord_id),
+            "city": city,
+            "country": country,
+            "timezone": timezone,
+            "country_code": country_code or ""
+        })
+        database.TIMEZONES_CACHE = None
+        return True
+    except Exception as e:
+        print(f"Error setting user timezone: {format_supabase_error(e)}")
+        return False
+
+async def remove_user_timezone(discord_id: str) -> bool:
+    """Remove a user's timezone."""
+    try:
+        await write_behind.delete("user_timezones", discord_id)
+        database.TIMEZONES_CACHE = None
+        return True
+    except Exception as e:
+        print(f"Error removing user timezone: {format_supabase_error(e)}")
+        return False
+
+async def get_all_user_timezones() -> list:
+    """Get all users with timezones set."""
+    if database.TIMEZONES_CACHE is not None:
+        return database.TIMEZONES_CACHE
+    try:
+        database.TIMEZONES_CACHE = await _all_rows("user_timezones")
+        return database.TIMEZONES_CACHE
+    except Exception as e:
+        print(f"Error fetching all user timezones: {format_supabase_error(e)}")
+        return []
+
+
+# ==================== Embed Tracking Functions ====================
+
+async def _save_embed(table: str, guild_id: str, channel_id: str, message_id: str, page: int) -> bool:
+    await write_behind.upsert(table, {
+        "guild_id": str(guild_id),
+        "channel_id": str(channel_id),
+        "message_id": str(message_id),
+        "page": page
+    })
+    return True
+
+async def save_timezone_embed(guild_id: str, channel_id: str, message_id: str, page: int = 0):
+    """Save a timezone embed for tracking (persists across restarts)."""
+    try:
+        return await _save_embed("timezone_embeds", guild_id, channel_id, message_id, page)
+    except Exception as e:
+        print(f"Error saving timezone embed: {format_supabase_error(e)}")
+        return False
+
+async def update_timezone_embed_page(guild_id: str, page: int):
+    """Update the page number for a timezone embed."""
+    try:
+        await write_behind.update("timezone_embeds", guild_id, {"page": page})
+        return True
+    except Exception as e:
+        print(f"Error updating timezone embed page: {format_supabase_error(e)}")
+        return False
+
+async def remove_timezone_embed(guild_id: str):
+    """Remove a timezone embed from tracking."""
+    try:
+        await write_behind.delete("timezone_embeds", guild_id)
+        return True
+    except Exception as e:
+        print(f"Error removing timezone embed: {format_supabase_error(e)}")
+        return False
+
+async def get_all_timezone_embeds() -> list:
+    """Get all tracked timezone embeds."""
+    try:
+        # Embed moves and page flips may still be queued
+        before = write_behind.pending_rows("timezone_embeds")
+        return write_behind.overlay("timezone_embeds", await postgrest.select("timezone_embeds"), before)
+    except Exception as e:
+        print(f"Error fetching timezone embeds: {format_supabase_error(e)}")
+        return []
+
+async def save_birthday_embed(guild_id: str, channel_id: str, message_id: str, page: int = 0):
+    """Save a birthday embed for tracking (persists across restarts)."""
+    try:
+        return await _save_embed("birthday_embeds", guild_id, channel_id, message_id, page)
+    except Exception as e:
+        print(f"Error saving birthday embed: {format_supabase_error(e)}")
+        return False
+
+async def update_birthday_embed_page(guild_id: str, page: int):
+    """Update the page number for a birthday embed."""
+    try:
+        await write_behind.update("birthday_embeds", guild_id, {"page": page})
+        return True
+    except Exception as e:
+        print(f"Error updating birthday embed page: {format_supabase_error(e)}")
+        return False
+
+async def remove_birthday_embed(guild_id: str):
+    """Remove a birthday embed from tracking."""
+    try:
+        await write_behind.delete("birthday_embeds", guild_id)
+        return True
+    except Exception as e:
+        print(f"Error removing birthday embed: {format_supabase_error(e)}")
+        return False
+
+async def get_all_birthday_embeds() -> list:
+    """Get all tracked birthday embeds."""
+    try:
+        # Embed moves and page flips may still be queued
+        before = write_behind.pending_rows("birthday_embeds")
+        return write_behind.overlay("birthday_embeds", await postgrest.select("birthday_embeds"), before)
+    except Exception as e:
+        print(f"Error fetching birthday embeds: {format_supabase_error(e)}")
+        return []
+
+
+# ==================== User Birthday Functions ====================
+
+async def get_user_birthday(discord_id: str) -> dict | None:
+    """Get a user's birthday info."""
+    if database.BIRTHDAYS_CACHE is not None:
+        for bday in database.BIRTHDAYS_CACHE:
+            if bday.get("discord_id") == str(discord_id):
+                return bday
+        return None
+
+    try:
+        return await _get_row("user_birthdays", discord_id)
+    except Exception as e:
+        print(f"Error fetching user birthday: {format_supabase_error(e)}")
+        return None
+
+async def set_user_birthday(discord_id: str, display_name: str, day: int, month: int) -> bool:
+    """Set a user's birthday."""
+    try:
+        await write_behind.upsert("user_birthdays", {
+            "discord_id": str(discord_id),
+            "display_name": display_name,
+            "day": day,
+            "month": month
+        })
+        database.BIRTHDAYS_CACHE = None
+        return True
+    except Exception as e:
+        print(f"Error setting user birthday: {format_supabase_error(e)}")
+        return False
+
+async def remove_user_birthday(discord_id: str) -> bool:
+    """Remove a user's birthday."""
+    try:
+        await write_behind.delete("user_birthdays", discord_id)
+        database.BIRTHDAYS_CACHE = None
+        return True
+    except Exception as e:
+        print(f"Error removing user birthday: {format_supabase_error(e)}")
+        return False
+
+async def get_all_user_birthdays() -> list:
+    """Get all users with birthdays set."""
+    if database.BIRTHDAYS_CACHE is not None:
+        return database.BIRTHDAYS_CACHE
+    try:
+        database.BIRTHDAYS_CACHE = await _all_rows("user_birthdays")
+        return database.BIRTHDAYS_CACHE
+    except Exception as e:
+        print(f"Error fetching all user birthdays: {format_supabase_error(e)}")
+        return []
+
+async def update_birthday_announced(discord_id: str, year: int) -> bool:
+    """Mark a user's birthday as announced for the given year."""
+    try:
+        await write_behind.update("user_birthdays", discord_id, {"last_announced_year": year})
+        database.BIRTHDAYS_CACHE = None
+        return True
+    except Exception as e:
+        print(f"Error updating birthday announced: {format_supabase_error(e)}")
+        return False
+
+async def get_birthdays_to_announce(day: int, month: int, year: int) -> list:
+    """Get birthdays that match day/month and haven't been announced this year."""
+    try:
+        if replica.ready("user_birthdays"):
+            # neq in SQL also skips NULLs, so never-announced rows don't match either
+            return [b for b in replica.all("user_birthdays")
+                    if b.get("day") == day and b.get("month") == month
+                    and b.get("last_announced_year") is not None and b["last_announced_year"] != year]
+        return await postgrest.select("user_birthdays", filters={
+            "day": eq(day), "month": eq(month), "last_announced_year": neq(year)
+        })
+    except Exception as e:
+        print(f"Error fetching birthdays to announce: {format_supabase_error(e)}")
+        return []
+
+
+# ==================== Birthday Channel Functions ====================
+
+async def get_birthday_channel(guild_id: str) -> str | None:
+    """Get the birthday announcement channel for a guild."""
+    try:
+        before = write_behind.pending_rows("birthday_channels")
+        rows = await postgrest.select("birthday_channels", "guild_id,channel_id", {"guild_id": eq(guild_id)})
+        rows = write_behind.overlay("birthday_channels", rows, before, pk=guild_id)
+        return rows[0]["channel_id"] if rows else None
+    except Exception as e:
+        print(f"Error fetching birthday channel: {format_supabase_error(e)}")
+        return None
+
+async def set_birthday_channel(guild_id: str, channel_id: str) -> bool:
+    """Set the birthday announcement channel for a guild."""
+    try:
+        await write_behind.upsert("birthday_channels", {"guild_id": str(guild_id), "channel_id": str(channel_id)})
+        return True
+    except Exception as e:
+        print(f"Error setting birthday channel: {format_supabase_error(e)}")
+        return False
+
+async def remove_birthday_channel(guild_id: str) -> bool:
+    """Remove the birthday announcement channel for a guild."""
+    try:
+        await write_behind.delete("birthday_channels", guild_id)
+        return True
+    except Exception as e:
+        print(f"Error removing birthday channel: {format_supabase_error(e)}")
+        return False
+
+
+# ==================== Music Library Functions ====================
+
+async def get_all_music_tracks() -> list:
+    """Fetch all music tracks."""
+    try:
+        return await _all_rows("music_tracks")
+    except Exception as e:
+        print(f"Error fetching music tracks from Supabase: {format_supabase_error(e)}")
+        return []
+
+async def upsert_music_track(track: dict) -> bool:
+    """Insert or update a music track record."""
+    try:
+        await write_behind.upsert("music_tracks", database.build_music_track_row(track))
+        return True
+    except Exception as e:
+        print(f"Error saving music track to Supabase database: {format_supabase_error(e)}")
+        return False
+
+async def delete_music_track(track_id: str, filename: str = None) -> bool:
+    """Delete a music track record, then its file from the storage bucket.
+
+    Storage still goes through supabase-py, on a worker thread.
+    """
+    try:
+        await write_behind.delete("music_tracks", track_id)
+    except Exception as e:
+        print(f"Error deleting music track from Supabase: {format_supabase_error(e)}")
+        return False
+    if filename:
+        await asyncio.to_thread(database.remove_music_storage, filename)
+    return True
@@ -0,0 +1,72 @@
+"""Micro-benchmark: regex alternation vs Aho-Corasick for the moderation filter.
+
+Run from src/:  python -m benchmarks.moderation_filter_bench
+"""
+import random
+import re
+import string
+import time
+from utils.aho_corasick import AhoCorasickMatcher
+
+PATTERN_COUNTS = (10, 1_000, 50_000)
+MESSAGE_LENGTHS = (40, 200, 2000)
+MESSAGES_PER_RUN = 200
+
+
+def random_word(rng, min_len=3, max_len=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_message(rng, length):
+    words = []
+    size = 0
+    while size < length:
+        word = random_word(rng, 1, 9)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def build_regex(patterns):
+    # Same construction as the old Moderation.get_compiled_regex
+    words = tuple(sorted(set(p.lower() for p in patterns if p)))
+    return re.compile("|".join(re.escape(w) for w in words), re.IGNORECASE)
+
+
+def time_per_message(search, messages, budget=1.0):
+    """Average µs per search; stops early once `budget` seconds have been spent."""
+    start = time.perf_counter()
+    done = 0
+    for msg in messages:
+        search(msg)
+        done += 1
+        if time.perf_counter() - start > budget:
+            break
+    return (time.perf_counter() - start) / done * 1e6
+
+
+def main():
+    rng = random.Random(1234)
+    print(f"{'patterns':>9} {'msg len':>8} {'regex µs':>10} {'aho µs':>10} {'speedup':>8}   build regex/aho (ms)")
+    for count in PATTERN_COUNTS:
+        # Longer tokens avoid accidental matches so every scan runs to the end (worst case)
+        patterns = [random_word(rng, 6, 14) for _ in range(count)]
+
+        t0 = time.perf_counter()
+        regex = build_regex(patterns)
+        t1 = time.perf_counter()
+        matcher = AhoCorasickMatcher(patterns)
+        t2 = time.perf_counter()
+
+        for length in MESSAGE_LENGTHS:
+            messages = [make_message(rng, length) for _ in range(MESSAGES_PER_RUN)]
+            regex_us = time_per_message(lambda m: regex.search(m.lower()), messages)
+            aho_us = time_per_message(matcher.search, messages)
+            print(
+                f"{count:>9} {length:>8} {regex_us:>10.1f} {aho_us:>10.1f} {regex_us / aho_us:>7.1f}x"
+                f"   {(t1 - t0) * 1e3:.0f}/{(t2 - t1) * 1e3:.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
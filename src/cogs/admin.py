@@ -4,7 +4,8 @@ from discord.utils import escape_markdown
 from dotenv import load_dotenv
 import asyncio
 import config
-from database import get_all_users_with_twitch, get_all_users_with_youtube
+from async_database import get_all_users_with_twitch, get_all_users_with_youtube
+from utils import metrics
 
 load_dotenv()
 
@@ -97,7 +98,7 @@ class Admin(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def twitchusers(self, ctx):
         """List all users with linked Twitch accounts."""
-        rows = get_all_users_with_twitch()
+        rows = await get_all_users_with_twitch()
         
         entries = []
         for row in rows:
@@ -119,7 +120,7 @@ class Admin(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def youtubeusers(self, ctx):
         """List all users with linked YouTube accounts."""
-        rows = get_all_users_with_youtube()
+        rows = await get_all_users_with_youtube()
         
         entries = []
         for row in rows:
@@ -162,5 +163,15 @@ class Admin(commands.Cog):
         config.LOG_CHANNEL_ID = None
         await ctx.send("✅ Global log channel has been reset.")
 
+    @commands.command()
+    @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
+    async def botstats(self, ctx):
+        """Show internal cache and queue metrics."""
+        embed = discord.Embed(title="📊 Bot Metrics", color=discord.Color.purple())
+        for name, values in metrics.snapshot().items():
+            lines = [f"`{key}`: {value}" for key, value in values.items()]
+            embed.add_field(name=name, value="\n".join(lines) or "—", inline=False)
+        await ctx.send(embed=embed)
+
 async def setup(bot):
     await bot.add_cog(Admin(bot))
\ No newline at end of file
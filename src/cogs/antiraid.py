@@ -1,12 +1,16 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
+import asyncio
 import time
 import datetime
 from dotenv import load_dotenv
-from collections import defaultdict, deque
-from database import get_guild_settings, save_guild_settings
+from utils.settings_store import settings_store
 from utils.helpers import log_to_channel
+from utils.channel_edits import channel_edits
+from utils.timewindows import SlidingWindowCounter
+from utils.ratelimit import AsyncTokenBucket
+from utils import metrics
 import config
 
 load_dotenv()
@@ -17,65 +21,268 @@ def role_check(*role_ids):
         return any(role.id in role_ids for role in ctx.author.roles)
     return commands.check(predicate)
 
+RAID_NORMAL = "normal"
+RAID_SUSPECTED = "suspected"
+RAID_LOCKED = "locked"
+RAID_COOLDOWN = "cooldown"
+
+class _RaidState:
+    """Raid incident state for one guild: normal -> suspected -> locked -> cooldown -> normal."""
+
+    __slots__ = ("phase", "since", "last_burst", "previous_delays", "busy")
+
+    def __init__(self, now: float):
+        self.phase = RAID_NORMAL
+        self.since = now
+        self.last_burst = now
+        self.previous_delays = {}   # channel_id -> slowmode delay before the lockdown
+        self.busy = False           # lockdown sweep or lift in flight
+
+class _PendingTimeout:
+    """One member's merged join timeout: the longest requested duration and every reason."""
+
+    __slots__ = ("member", "seconds", "policies", "reasons")
+
+    def __init__(self, member):
+        self.member = member
+        self.seconds = 0
+        self.policies = []
+        self.reasons = []
+
+    def add(self, seconds: int, policy: str, reason: str):
+        self.seconds = max(self.seconds, seconds)
+        self.policies.append(policy)
+        self.reasons.append(reason)
+
 class AntiRaid(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.join_logs = defaultdict(lambda: deque(maxlen=200))
+        # Recent join times per guild; each join costs O(1) amortised
+        self.join_counter = SlidingWindowCounter(config.RAID_TRACKER_MAX_GUILDS, config.RAID_JOIN_LOG_SIZE)
+        # guild_id -> _RaidState, only for guilds that are not in the normal phase
+        self.raid_states = {}
+        self.lockdowns_applied = 0
+        # (guild_id, member_id) -> _PendingTimeout, applied in batches by apply_join_timeouts
+        self.pending_timeouts = {}
+        self._timeout_semaphore = asyncio.Semaphore(config.JOIN_TIMEOUT_CONCURRENCY)
+        self._timeout_bucket = AsyncTokenBucket(config.JOIN_TIMEOUT_RATE, burst=config.JOIN_TIMEOUT_CONCURRENCY)
+        self.timeouts_applied = 0
+        metrics.register("antiraid", self.stats)
+        self.advance_raid_states.start()
+        self.apply_join_timeouts.start()
+    
+    def cog_unload(self):
+        self.advance_raid_states.cancel()
+        self.apply_join_timeouts.cancel()
+    
+    def stats(self) -> dict:
+        phases = {}
+        for state in self.raid_states.values():
+            phases[state.phase] = phases.get(state.phase, 0) + 1
+        return {
+            **self.join_counter.stats(),
+            **phases,
+            "lockdowns_applied": self.lockdowns_applied,
+            "pending_timeouts": len(self.pending_timeouts),
+            "timeouts_applied": self.timeouts_applied,
+        }
+    
+    def lockdown_active(self, guild_id: int) -> bool:
+        """Whether an automatic raid lockdown currently owns this guild's slowmode."""
+        state = self.raid_states.get(guild_id)
+        return state is not None and state.phase in (RAID_LOCKED, RAID_COOLDOWN)
     
     @commands.Cog.listener()
     async def on_member_join(self, member):
         """Handle member join events for anti-raid."""
         guild_id = member.guild.id
-        settings = get_guild_settings(guild_id)
-        now = time.time()
-        self.join_logs[guild_id].append(now)
+        settings = settings_store.peek(guild_id)
 
-        # Account age enforcement
+        # Account age and raid mode both queue a timeout; the batch applies one edit per member
         min_age_days = settings.get("min_account_age_days", config.DEFAULT_ACCOUNT_AGE_DAYS)
         account_age_days = (discord.utils.utcnow() - member.created_at).days
         if account_age_days < min_age_days:
-            try:
-                until = discord.utils.utcnow() + datetime.timedelta(seconds=300)
-                await member.edit(timed_out_until=until, reason="Account too new (anti-raid)")
-                await log_to_channel(self.bot, f"⚠️ {member.mention} auto-timed out (account {account_age_days}d < {min_age_days}d).")
-            except Exception:
-                pass
-
-        # Raid mode toggle
+            self._queue_timeout(member, config.ACCOUNT_AGE_TIMEOUT_SECONDS, "account age", f"Account too new ({account_age_days}d < {min_age_days}d)")
         if settings.get("antiraid_enabled", False):
-            try:
-                until = discord.utils.utcnow() + datetime.timedelta(seconds=600)
-                await member.edit(timed_out_until=until, reason="Raid mode active")
-                await log_to_channel(self.bot, f"🚨 {member.mention} auto-timed out (raid mode active).")
-            except Exception:
-                pass
+            self._queue_timeout(member, config.RAID_MODE_TIMEOUT_SECONDS, "raid mode", "Raid mode active")
 
         # Burst join detection
         join_window = settings.get("join_window", config.DEFAULT_JOIN_WINDOW)
-        join_threshold = settings.get("join_threshold", config.DEFAULT_JOIN_THRESHOLD)
-        joins_recent = [t for t in self.join_logs[guild_id] if now - t < join_window]
-
-        if len(joins_recent) >= join_threshold:
-            await log_to_channel(self.bot, f"🚨 Raid suspected: {len(joins_recent)} joins in {join_window}s in {member.guild.name}. Lockdown applied.")
-            for ch in member.guild.text_channels:
-                try:
-                    await ch.edit(slowmode_delay=30, reason="Anti-raid triggered")
-                except Exception:
-                    pass
-            await log_to_channel(self.bot, "⏱️ Auto-lockdown applied (30s slowmode).")
+        join_threshold = min(settings.get("join_threshold", config.DEFAULT_JOIN_THRESHOLD), config.RAID_JOIN_LOG_SIZE)
+        now = time.monotonic()
+        joins_recent = self.join_counter.hit(guild_id, now, join_window)
+        await self._record_join_burst(member.guild, joins_recent, join_threshold, join_window, now)
+    
+    def _queue_timeout(self, member, seconds: int, policy: str, reason: str):
+        key = (member.guild.id, member.id)
+        pending = self.pending_timeouts.get(key)
+        if pending is None:
+            pending = self.pending_timeouts[key] = _PendingTimeout(member)
+        pending.add(seconds, policy, reason)
+    
+    async def _apply_timeout(self, pending: _PendingTimeout, applied: list, failed: list):
+        async with self._timeout_semaphore:
+            await self._timeout_bucket.acquire()
+            try:
+                until = discord.utils.utcnow() + datetime.timedelta(seconds=pending.seconds)
+                await pending.member.edit(timed_out_until=until, reason=f"Anti-raid: {'; '.join(pending.reasons)}")
+                applied.append(pending)
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    self._timeout_bucket.pause(getattr(e, "retry_after", 1.0) or 1.0)
+                failed.append((pending, e))
+            except Exception as e:
+                failed.append((pending, e))
+    
+    @tasks.loop(seconds=config.JOIN_TIMEOUT_BATCH_INTERVAL)
+    async def apply_join_timeouts(self):
+        """Apply queued join timeouts concurrently and log one summary per batch."""
+        if not self.pending_timeouts:
+            return
+        batch = list(self.pending_timeouts.values())
+        self.pending_timeouts.clear()
+        
+        started = time.monotonic()
+        applied, failed = [], []
+        await asyncio.gather(*(self._apply_timeout(pending, applied, failed) for pending in batch))
+        elapsed = time.monotonic() - started
+        self.timeouts_applied += len(applied)
+        
+        if applied:
+            policy_counts = {}
+            for pending in applied:
+                for policy in pending.policies:
+                    policy_counts[policy] = policy_counts.get(policy, 0) + 1
+            breakdown = ", ".join(f"{policy}: {count}" for policy, count in policy_counts.items())
+            summary = f"🚨 Timed out {len(applied)} account{'s' if len(applied) != 1 else ''} in {elapsed:.1f}s ({breakdown})"
+            if failed:
+                summary += f"; {len(failed)} failed"
+            if len(applied) <= config.JOIN_TIMEOUT_LOG_MENTIONS:
+                summary += ": " + ", ".join(pending.member.mention for pending in applied)
+        else:
+            summary = f"⚠️ Failed to time out all {len(failed)} queued account{'s' if len(failed) != 1 else ''}"
+        await log_to_channel(self.bot, summary + ".")
+        for pending, e in failed[:config.JOIN_TIMEOUT_LOG_MENTIONS]:
+            await log_to_channel(self.bot, f"⚠️ Failed to time out {pending.member.mention}: {e}")
+    
+    @apply_join_timeouts.before_loop
+    async def before_apply_join_timeouts(self):
+        await self.bot.wait_until_ready()
+    
+    async def _record_join_burst(self, guild, joins_recent: int, join_threshold: int, join_window: int, now: float):
+        """Advance the guild's raid state for the current join count."""
+        state = self.raid_states.get(guild.id)
+        
+        if joins_recent >= join_threshold:
+            if state is None:
+                state = self.raid_states[guild.id] = _RaidState(now)
+            state.last_burst = now
+            if state.phase == RAID_COOLDOWN:
+                # Same incident: the lockdown is still in place, just stop the cooldown clock
+                state.phase = RAID_LOCKED
+                state.since = now
+                await log_to_channel(self.bot, f"🚨 Join burst resumed in {guild.name}; lockdown stays in place.")
+            elif state.phase in (RAID_NORMAL, RAID_SUSPECTED):
+                state.phase = RAID_LOCKED
+                state.since = now
+                await log_to_channel(self.bot, f"🚨 Raid suspected: {joins_recent} joins in {join_window}s in {guild.name}. Lockdown applied.")
+                await self._apply_lockdown(guild, state)
+            return
+        
+        if joins_recent >= join_threshold * config.RAID_SUSPECT_RATIO:
+            if state is None:
+                state = self.raid_states[guild.id] = _RaidState(now)
+            if state.phase == RAID_NORMAL:
+                state.phase = RAID_SUSPECTED
+                state.since = now
+                await log_to_channel(self.bot, f"⚠️ Elevated join rate in {guild.name}: {joins_recent} joins in {join_window}s.")
+            if state.phase == RAID_SUSPECTED:
+                state.last_burst = now
+    
+    async def _apply_lockdown(self, guild, state: _RaidState):
+        """Raise every text channel to the lockdown slowmode, remembering what to restore."""
+        state.busy = True
+        try:
+            edits = []
+            for ch in guild.text_channels:
+                # Channels already slower than the lockdown are left alone
+                if ch.slowmode_delay < config.RAID_LOCKDOWN_SLOWMODE:
+                    state.previous_delays[ch.id] = ch.slowmode_delay
+                    edits.append((ch, config.RAID_LOCKDOWN_SLOWMODE))
+            result = await channel_edits.set_slowmode(edits, reason="Anti-raid triggered")
+            for ch, _, _ in result.failed:
+                state.previous_delays.pop(ch.id, None)
+            self.lockdowns_applied += 1
+            summary = f"⏱️ Auto-lockdown applied ({config.RAID_LOCKDOWN_SLOWMODE}s slowmode): {len(result.changed)} channels changed"
+            if result.failed:
+                summary += f", {len(result.failed)} failed"
+            await log_to_channel(self.bot, f"{summary} in {result.elapsed:.1f}s.")
+        finally:
+            state.busy = False
+    
+    async def _lift_lockdown(self, guild, state: _RaidState):
+        """Restore the slowmode delays recorded when the lockdown was applied."""
+        state.busy = True
+        try:
+            edits = []
+            for channel_id, delay in state.previous_delays.items():
+                ch = guild.get_channel(channel_id)
+                # Leave channels a moderator has changed since the lockdown
+                if ch and ch.slowmode_delay == config.RAID_LOCKDOWN_SLOWMODE:
+                    edits.append((ch, delay))
+            result = await channel_edits.set_slowmode(edits, reason="Anti-raid lockdown lifted")
+            summary = f"✅ Raid lockdown lifted in {guild.name}: {len(result.changed)} channels restored"
+            if result.failed:
+                summary += f", {len(result.failed)} failed"
+            await log_to_channel(self.bot, f"{summary}.")
+        finally:
+            state.busy = False
+    
+    @tasks.loop(seconds=config.RAID_STATE_CHECK_INTERVAL)
+    async def advance_raid_states(self):
+        """Move guilds through suspected/locked/cooldown once their join bursts die down."""
+        now = time.monotonic()
+        for guild_id, state in list(self.raid_states.items()):
+            if state.busy:
+                continue
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                del self.raid_states[guild_id]
+                continue
+            join_window = settings_store.peek(guild_id).get("join_window", config.DEFAULT_JOIN_WINDOW)
+            quiet_for = now - state.last_burst
+            
+            if state.phase == RAID_SUSPECTED and quiet_for >= join_window:
+                del self.raid_states[guild_id]
+            elif state.phase == RAID_LOCKED and quiet_for >= join_window:
+                state.phase = RAID_COOLDOWN
+                state.since = now
+                await log_to_channel(self.bot, f"🕒 Join burst over in {guild.name}; lifting lockdown in {config.RAID_COOLDOWN_SECONDS}s if it stays quiet.")
+            elif state.phase == RAID_COOLDOWN and now - state.since >= config.RAID_COOLDOWN_SECONDS:
+                await self._lift_lockdown(guild, state)
+                if state.phase == RAID_COOLDOWN:
+                    del self.raid_states[guild_id]
+                else:
+                    # A new burst arrived while the lift was in flight
+                    await self._apply_lockdown(guild, state)
+        self.join_counter.sweep(now, config.RAID_COOLDOWN_SECONDS)
+    
+    @advance_raid_states.before_loop
+    async def before_advance_raid_states(self):
+        await self.bot.wait_until_ready()
     
     @commands.command()
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def antiraid(self, ctx, action: str = None):
         """Toggle anti-raid mode."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         if action == "enable":
             settings["antiraid_enabled"] = True
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("✅ Anti-raid mode enabled. New joins will be auto-timed out.")
         elif action == "disable":
             settings["antiraid_enabled"] = False
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("❌ Anti-raid mode disabled.")
         elif action == "status":
             state = "enabled" if settings.get("antiraid_enabled", False) else "disabled"
@@ -104,14 +311,14 @@ class AntiRaid(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         if action.value == "enable":
             settings["antiraid_enabled"] = True
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("✅ Anti-raid mode enabled. New joins will be auto-timed out.")
         elif action.value == "disable":
             settings["antiraid_enabled"] = False
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("❌ Anti-raid mode disabled.")
         elif action.value == "status":
             state = "enabled" if settings.get("antiraid_enabled", False) else "disabled"
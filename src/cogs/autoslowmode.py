@@ -1,11 +1,13 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import time
-import asyncio
+import heapq
 from dotenv import load_dotenv
-from database import get_guild_settings, save_guild_settings
+from utils.settings_store import settings_store
 from utils.helpers import log_to_channel
+from utils.timewindows import EwmaRate
+from utils.channel_edits import channel_edits
 import config
 
 load_dotenv()
@@ -16,13 +18,81 @@ def role_check(*role_ids):
         return any(role.id in role_ids for role in ctx.author.roles)
     return commands.check(predicate)
 
+class _SlowmodeThresholds:
+    """A guild's time_configs parsed and sorted once per settings version."""
+
+    __slots__ = ("levels",)
+
+    def __init__(self, settings: dict):
+        configs = settings.get("time_configs", config.DEFAULT_TIME_CONFIGS)
+        # (message limit, delay), highest limit first
+        self.levels = sorted(((int(k), int(v)) for k, v in configs.items()), reverse=True)
+
+    def delay_for(self, msg_count: float) -> int:
+        for limit, delay in self.levels:
+            if msg_count >= limit:
+                return delay
+        return 0
+
+    def target_delay(self, msg_count: float, current: int) -> int:
+        """Delay for msg_count, stepping down only once traffic clears the hysteresis band."""
+        target = self.delay_for(msg_count)
+        if target >= current:
+            return target
+        entry_limits = [limit for limit, delay in self.levels if delay == current]
+        if entry_limits and msg_count >= min(entry_limits) * (1 - config.SLOWMODE_HYSTERESIS):
+            return current
+        return target
+
+    def escalate_at(self, current: int) -> float:
+        """Smallest message count that would raise the delay above `current`."""
+        limits = [limit for limit, delay in self.levels if delay > current]
+        return min(limits) if limits else float("inf")
+
+class _ChannelRate:
+    """Smoothed message rate for one channel plus the count that should trigger an early check."""
+
+    __slots__ = ("frequency", "rate", "escalate_at")
+
+    def __init__(self, frequency: int, escalate_at: float):
+        self.frequency = frequency
+        self.rate = EwmaRate(frequency * config.SLOWMODE_EWMA_HALFLIFE_RATIO)
+        self.escalate_at = escalate_at
+
+    def estimate(self, now: float) -> float:
+        """Smoothed message rate expressed as messages per check window."""
+        return self.rate.rate(now) * self.frequency
+
+class _GuildSlowmodeState:
+    """Evaluation timer and per-channel rate estimators for one guild."""
+
+    __slots__ = ("next_eval", "last_eval", "channels", "applied", "evaluating")
+
+    def __init__(self, next_eval: float):
+        self.next_eval = next_eval
+        self.last_eval = 0.0
+        self.channels = {}   # channel_id -> _ChannelRate
+        self.applied = {}    # channel_id -> slowmode delay last set by this cog
+        self.evaluating = False
+
 class AutoSlowmode(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.message_cache = {}
-        self.previous_delays = {}
-        self.last_updated = 0
-        self.update_lock = asyncio.Lock()
+        self.guild_states = {}
+        # Min-heap of (next_eval, guild_id); entries whose time no longer matches the guild's state are stale
+        self.schedule = []
+        self.evaluate_due_guilds.start()
+    
+    def cog_unload(self):
+        self.evaluate_due_guilds.cancel()
+    
+    @staticmethod
+    def _check_frequency(settings: dict) -> int:
+        return max(1, int(settings.get("check_frequency", config.DEFAULT_CHECK_FREQUENCY)))
+    
+    def _schedule_guild(self, guild_id: int, state: _GuildSlowmodeState, when: float):
+        state.next_eval = when
+        heapq.heappush(self.schedule, (when, guild_id))
     
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -33,30 +103,61 @@ class AutoSlowmode(commands.Cog):
         if not guild:
             return
             
-        guild_settings = get_guild_settings(guild.id)
+        guild_settings = settings_store.peek(guild.id)
         if guild_settings and guild_settings.get("autoslow_enabled", True):
             ch_id = message.channel.id
             bl = guild_settings.get("blacklisted_channels", [])
             if ch_id in bl:
                 return
             
-            self.message_cache[ch_id] = self.message_cache.get(ch_id, 0) + 1
-            if time.time() >= self.last_updated + guild_settings.get("check_frequency", config.DEFAULT_CHECK_FREQUENCY):
-                if not self.update_lock.locked():
-                    self.bot.loop.create_task(self.update_slowmode_batched())
+            now = time.monotonic()
+            frequency = self._check_frequency(guild_settings)
+            state = self.guild_states.get(guild.id)
+            if state is None:
+                state = self.guild_states[guild.id] = _GuildSlowmodeState(now + frequency)
+                self._schedule_guild(guild.id, state, now + frequency)
+            
+            channel_rate = state.channels.get(ch_id)
+            if channel_rate is None or channel_rate.frequency != frequency:
+                thresholds = settings_store.derive(guild.id, "slowmode_thresholds", _SlowmodeThresholds)
+                current = state.applied.get(ch_id, getattr(message.channel, "slowmode_delay", 0))
+                channel_rate = state.channels[ch_id] = _ChannelRate(frequency, thresholds.escalate_at(current))
+            channel_rate.rate.add(now)
+            
+            # A burst that would raise the delay pulls the guild's evaluation forward
+            if channel_rate.estimate(now) >= channel_rate.escalate_at and not state.evaluating:
+                due = max(now, state.last_eval + config.SLOWMODE_MIN_EVAL_INTERVAL)
+                if due < state.next_eval:
+                    self._schedule_guild(guild.id, state, due)
+    
+    @tasks.loop(seconds=1)
+    async def evaluate_due_guilds(self):
+        """Start an evaluation for every guild whose own timer has expired."""
+        now = time.monotonic()
+        while self.schedule and self.schedule[0][0] <= now:
+            due, guild_id = heapq.heappop(self.schedule)
+            state = self.guild_states.get(guild_id)
+            if state is None or state.next_eval != due or state.evaluating:
+                continue
+            state.evaluating = True
+            self.bot.loop.create_task(self.update_guild_slowmode(guild_id, state))
+    
+    @evaluate_due_guilds.before_loop
+    async def before_evaluate_due_guilds(self):
+        await self.bot.wait_until_ready()
     
     @commands.command()
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def autoslow(self, ctx, action: str = None):
         """Enable, disable, or check status of auto-slowmode."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         if action == "enable":
             settings["autoslow_enabled"] = True
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("✅ Auto-slowmode enabled.")
         elif action == "disable":
             settings["autoslow_enabled"] = False
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("❌ Auto-slowmode disabled.")
         elif action == "status":
             await ctx.send(f"Auto-slowmode is {'enabled' if settings['autoslow_enabled'] else 'disabled'}.")
@@ -67,19 +168,19 @@ class AutoSlowmode(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def autoslow_blacklist(self, ctx, action: str = None, channel: discord.TextChannel = None):
         """Manage auto-slowmode blacklist."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         bl = settings.get("blacklisted_channels", [])
         if action == "add" and channel:
             if channel.id not in bl: 
                 bl.append(channel.id)
             settings["blacklisted_channels"] = bl
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"✅ Added {channel.mention} to auto-slowmode blacklist.")
         elif action == "remove" and channel:
             if channel.id in bl: 
                 bl.remove(channel.id)
             settings["blacklisted_channels"] = bl
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"❌ Removed {channel.mention} from auto-slowmode blacklist.")
         elif action == "list":
             if not bl: 
@@ -110,14 +211,14 @@ class AutoSlowmode(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         if action.value == "enable":
             settings["autoslow_enabled"] = True
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("✅ Auto-slowmode enabled.")
         elif action.value == "disable":
             settings["autoslow_enabled"] = False
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("❌ Auto-slowmode disabled.")
         elif action.value == "status":
             state = "enabled" if settings.get("autoslow_enabled", True) else "disabled"
@@ -134,7 +235,7 @@ class AutoSlowmode(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         bl = settings.get("blacklisted_channels", [])
         if action.value == "add":
             if not channel:
@@ -143,7 +244,7 @@ class AutoSlowmode(commands.Cog):
             if channel.id not in bl:
                 bl.append(channel.id)
             settings["blacklisted_channels"] = bl
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"✅ Added {channel.mention} to auto-slowmode blacklist.")
         elif action.value == "remove":
             if not channel:
@@ -152,7 +253,7 @@ class AutoSlowmode(commands.Cog):
             if channel.id in bl:
                 bl.remove(channel.id)
             settings["blacklisted_channels"] = bl
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"❌ Removed {channel.mention} from auto-slowmode blacklist.")
         elif action.value == "list":
             if not bl:
@@ -170,9 +271,9 @@ class AutoSlowmode(commands.Cog):
             for pair in pairs:
                 limit, delay = pair.split(":")
                 configs[int(limit.strip())] = int(delay.strip())
-            settings = get_guild_settings(ctx.guild.id)
+            settings = await settings_store.get_guild_settings(ctx.guild.id)
             settings["time_configs"] = configs
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"✅ Thresholds updated: {configs}")
         except Exception as e:
             await ctx.send(f"Error parsing thresholds: {e}")
@@ -181,61 +282,70 @@ class AutoSlowmode(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def set_check_frequency(self, ctx, seconds: int):
         """Set check frequency for auto-slowmode."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         settings["check_frequency"] = seconds
-        save_guild_settings(ctx.guild.id, settings)
+        await settings_store.save_guild_settings(ctx.guild.id, settings)
         await ctx.send(f"✅ Check frequency set to {seconds} seconds.")
     
-    async def update_slowmode_batched(self):
-        """Update slowmode for channels in batch."""
-        async with self.update_lock:
-            if not self.message_cache:
-                self.last_updated = time.time()
+    async def update_guild_slowmode(self, guild_id: int, state: _GuildSlowmodeState):
+        """Evaluate one guild's active channels and apply any slowmode changes."""
+        try:
+            guild = self.bot.get_guild(guild_id)
+            settings = settings_store.peek(guild_id)
+            if not guild or not settings.get("autoslow_enabled", True):
+                state.channels.clear()
+                return
+            
+            # An automatic raid lockdown owns the slowmode until it is lifted
+            antiraid = self.bot.get_cog("AntiRaid")
+            if antiraid and antiraid.lockdown_active(guild_id):
                 return
             
+            now = time.monotonic()
+            state.last_eval = now
+            bl = settings.get("blacklisted_channels", [])
+            thresholds = settings_store.derive(guild_id, "slowmode_thresholds", _SlowmodeThresholds)
+            
             changes = []
-            for channel_id, msg_count in list(self.message_cache.items()):
-                ch = self.bot.get_channel(channel_id)
-                if not ch or not isinstance(ch, discord.TextChannel):
+            for channel_id, channel_rate in list(state.channels.items()):
+                ch = guild.get_channel(channel_id)
+                if not ch or not isinstance(ch, discord.TextChannel) or channel_id in bl:
+                    del state.channels[channel_id]
+                    state.applied.pop(channel_id, None)
                     continue
                 
-                guild_id = ch.guild.id
-                settings = get_guild_settings(guild_id)
-                if not settings.get("autoslow_enabled", True):
-                    continue
-                
-                bl = settings.get("blacklisted_channels", [])
-                if channel_id in bl:
-                    continue
-                
-                configs = settings.get("time_configs", config.DEFAULT_TIME_CONFIGS)
-                parsed_configs = {int(k): int(v) for k, v in configs.items()}
-                delay = 0
-                for limit in sorted(parsed_configs.keys(), reverse=True):
-                    if msg_count >= limit:
-                        delay = parsed_configs[limit]
-                        break
-                
-                prev = self.previous_delays.get(channel_id, None)
-                if prev != delay:
+                msg_count = channel_rate.estimate(now)
+                current = state.applied.get(channel_id, ch.slowmode_delay)
+                delay = thresholds.target_delay(msg_count, current)
+                channel_rate.escalate_at = thresholds.escalate_at(delay)
+                if current != delay:
                     changes.append((ch, delay, msg_count))
+                elif msg_count < 0.5:
+                    # Quiet channel already at the right delay: stop tracking it
+                    del state.channels[channel_id]
+                    state.applied.pop(channel_id, None)
             
             if not changes:
-                self.message_cache = {}
-                self.last_updated = time.time()
                 return
             
-            for channel_obj, delay, msg_count in changes:
-                try:
-                    await channel_obj.edit(slowmode_delay=delay, reason="Auto slowmode adjustment")
-                    self.previous_delays[channel_obj.id] = delay
-                    await log_to_channel(self.bot, f"⏱️ Set slowmode for #{channel_obj.name} to {delay}s (messages: {msg_count})")
-                except Exception as e:
-                    await log_to_channel(self.bot, f"⚠️ Failed to set slowmode for #{channel_obj.name}: {e}")
-                await asyncio.sleep(config.SLOWMODE_EDIT_DELAY)
-            
-            self.message_cache = {}
-            self.last_updated = time.time()
+            counts = {ch.id: msg_count for ch, _, msg_count in changes}
+            result = await channel_edits.set_slowmode(
+                [(ch, delay) for ch, delay, _ in changes],
+                reason="Auto slowmode adjustment"
+            )
+            for channel_obj, delay in result.changed:
+                state.applied[channel_obj.id] = delay
+                await log_to_channel(self.bot, f"⏱️ Set slowmode for #{channel_obj.name} to {delay}s (messages: ~{counts[channel_obj.id]:.0f})")
+            for channel_obj, delay in result.skipped:
+                state.applied[channel_obj.id] = delay
+            for channel_obj, _, e in result.failed:
+                await log_to_channel(self.bot, f"⚠️ Failed to set slowmode for #{channel_obj.name}: {e}")
+        finally:
+            state.evaluating = False
+            if state.channels:
+                self._schedule_guild(guild_id, state, time.monotonic() + self._check_frequency(settings_store.peek(guild_id)))
+            else:
+                self.guild_states.pop(guild_id, None)
 
 async def setup(bot):
     await bot.add_cog(AutoSlowmode(bot))
\ No newline at end of file
@@ -3,7 +3,7 @@ from discord import app_commands
 from discord.ext import commands, tasks
 from datetime import datetime
 import asyncio
-from database import (
+from async_database import (
     get_user_birthday, set_user_birthday, remove_user_birthday, get_all_user_birthdays,
     save_birthday_embed, update_birthday_embed_page, remove_birthday_embed, get_all_birthday_embeds,
     get_birthdays_to_announce, update_birthday_announced, get_birthday_channel, set_birthday_channel,
@@ -56,13 +56,13 @@ class Birthday(commands.Cog):
                 current_page = self.updating_messages[guild_id].get("page", 0)
                 if current_page != 0:
                     self.updating_messages[guild_id]["page"] = 0
-                    update_birthday_embed_page(str(guild_id), 0)
+                    await update_birthday_embed_page(str(guild_id), 0)
 
                     guild = self.bot.get_guild(guild_id)
                     if guild:
                         try:
                             message = self.updating_messages[guild_id]["message"]
-                            embed, _ = self.create_birthdays_embed(guild, 0)
+                            embed, _ = await self.create_birthdays_embed(guild, 0)
                             await message.edit(embed=embed)
                         except Exception as e:
                             print(f"Error resetting birthday page: {e}")
@@ -73,7 +73,7 @@ class Birthday(commands.Cog):
         self.page_reset_tasks[guild_id] = asyncio.create_task(reset_page())
 
     async def load_persisted_embeds(self):
-        embeds = get_all_birthday_embeds()
+        embeds = await get_all_birthday_embeds()
         loaded_count = 0
 
         for embed_data in embeds:
@@ -85,12 +85,12 @@ class Birthday(commands.Cog):
 
                 guild = self.bot.get_guild(guild_id)
                 if not guild:
-                    remove_birthday_embed(str(guild_id))
+                    await remove_birthday_embed(str(guild_id))
                     continue
 
                 channel = guild.get_channel(channel_id)
                 if not channel:
-                    remove_birthday_embed(str(guild_id))
+                    await remove_birthday_embed(str(guild_id))
                     continue
 
                 try:
@@ -101,9 +101,9 @@ class Birthday(commands.Cog):
                     }
                     loaded_count += 1
                 except discord.NotFound:
-                    remove_birthday_embed(str(guild_id))
+                    await remove_birthday_embed(str(guild_id))
                 except discord.Forbidden:
-                    remove_birthday_embed(str(guild_id))
+                    await remove_birthday_embed(str(guild_id))
             except Exception as e:
                 print(f"Error loading birthday embed for guild {embed_data.get('guild_id')}: {e}")
 
@@ -132,7 +132,7 @@ class Birthday(commands.Cog):
         delta = birthday_this_year.date() - today.date()
         return delta.days
     
-    def create_birthdays_embed(self, guild, page: int = 0) -> tuple[discord.Embed, int]:
+    async def create_birthdays_embed(self, guild, page: int = 0) -> tuple[discord.Embed, int]:
         USERS_PER_PAGE = 10
         
         embed = discord.Embed(
@@ -140,7 +140,7 @@ class Birthday(commands.Cog):
             color=discord.Color.purple()
         )
         
-        all_birthdays = get_all_user_birthdays()
+        all_birthdays = await get_all_user_birthdays()
         
         if not all_birthdays:
             embed.description = "No birthdays set yet!\nUse `/setbirthday` to add yours!"
@@ -191,26 +191,23 @@ class Birthday(commands.Cog):
 
     @tasks.loop(hours=1)
     async def update_birthday_embeds(self):
-        # Pre-fetch birthdays in a background thread to prevent blocking the event loop
-        await asyncio.to_thread(get_all_user_birthdays)
-        
         for guild_id, data in list(self.updating_messages.items()):
             try:
                 guild = self.bot.get_guild(guild_id)
                 if guild:
                     message = data["message"]
                     page = data.get("page", 0)
-                    embed, _ = self.create_birthdays_embed(guild, page)
+                    embed, _ = await self.create_birthdays_embed(guild, page)
                     await message.edit(embed=embed)
             except discord.NotFound:
                 del self.updating_messages[guild_id]
-                remove_birthday_embed(str(guild_id))
+                await remove_birthday_embed(str(guild_id))
             except Exception as e:
                 print(f"Error updating birthday embed: {e}")
 
     @tasks.loop(minutes=5)
     async def check_birthdays(self):
-        all_birthdays = await asyncio.to_thread(get_all_user_birthdays)
+        all_birthdays = await get_all_user_birthdays()
         current_utc = datetime.now(pytz.UTC)
         
         for bday_data in all_birthdays:
@@ -219,7 +216,7 @@ class Birthday(commands.Cog):
             month = bday_data["month"]
             last_year = bday_data.get("last_announced_year", 0)
             
-            tz_data = get_user_timezone(discord_id)
+            tz_data = await get_user_timezone(discord_id)
             if tz_data and tz_data.get("timezone"):
                 user_tz_str = tz_data["timezone"]
             else:
@@ -241,7 +238,7 @@ class Birthday(commands.Cog):
 
     async def announce_birthday(self, discord_id: str, year: int, timezone_str: str):
         """Send birthday announcement to the configured channel."""
-        success = update_birthday_announced(discord_id, year)
+        success = await update_birthday_announced(discord_id, year)
         if not success:
             return
 
@@ -257,7 +254,7 @@ class Birthday(commands.Cog):
             if not member:
                 continue
                 
-            channel_id = get_birthday_channel(str(guild.id))
+            channel_id = await get_birthday_channel(str(guild.id))
             if not channel_id:
                 continue
                 
@@ -285,7 +282,7 @@ class Birthday(commands.Cog):
                 data = self.updating_messages[guild.id]
                 message = data["message"]
                 page = data.get("page", 0)
-                embed, total_pages = self.create_birthdays_embed(guild, page)
+                embed, total_pages = await self.create_birthdays_embed(guild, page)
                 await message.edit(embed=embed)
                 
                 if total_pages > 1:
@@ -296,7 +293,7 @@ class Birthday(commands.Cog):
                         await message.add_reaction("➡️")
             except discord.NotFound:
                 del self.updating_messages[guild.id]
-                remove_birthday_embed(str(guild.id))
+                await remove_birthday_embed(str(guild.id))
             except Exception as e:
                 print(f"Error refreshing birthday embed: {e}")
 
@@ -335,7 +332,7 @@ class Birthday(commands.Cog):
         if not guild:
             return
         
-        _, total_pages = self.create_birthdays_embed(guild, current_page)
+        _, total_pages = await self.create_birthdays_embed(guild, current_page)
         
         if emoji == "⬅️":
             new_page = max(0, current_page - 1)
@@ -344,8 +341,8 @@ class Birthday(commands.Cog):
         
         if new_page != current_page:
             self.updating_messages[guild_id]["page"] = new_page
-            update_birthday_embed_page(str(guild_id), new_page)
-            embed, _ = self.create_birthdays_embed(guild, new_page)
+            await update_birthday_embed_page(str(guild_id), new_page)
+            embed, _ = await self.create_birthdays_embed(guild, new_page)
             
             try:
                 await data["message"].edit(embed=embed)
@@ -387,7 +384,7 @@ class Birthday(commands.Cog):
             )
             return
         
-        success = set_user_birthday(
+        success = await set_user_birthday(
             str(interaction.user.id),
             interaction.user.display_name,
             day,
@@ -404,7 +401,7 @@ class Birthday(commands.Cog):
     @app_commands.command(name="mybirthday", description="Show your birthday")
     async def mybirthday(self, interaction: discord.Interaction):
         """Show your birthday."""
-        bday_data = get_user_birthday(str(interaction.user.id))
+        bday_data = await get_user_birthday(str(interaction.user.id))
         
         if not bday_data:
             await interaction.response.send_message(
@@ -423,7 +420,7 @@ class Birthday(commands.Cog):
         if member is None:
             member = interaction.user
         
-        bday_data = get_user_birthday(str(member.id))
+        bday_data = await get_user_birthday(str(member.id))
         
         if not bday_data:
             if member == interaction.user:
@@ -444,7 +441,7 @@ class Birthday(commands.Cog):
     @app_commands.command(name="removebirthday", description="Remove your birthday setting")
     async def removebirthday(self, interaction: discord.Interaction):
         """Remove your birthday setting."""
-        bday_data = get_user_birthday(str(interaction.user.id))
+        bday_data = await get_user_birthday(str(interaction.user.id))
         
         if not bday_data:
             await interaction.response.send_message(
@@ -453,7 +450,7 @@ class Birthday(commands.Cog):
             )
             return
         
-        success = remove_user_birthday(str(interaction.user.id))
+        success = await remove_user_birthday(str(interaction.user.id))
         
         if success:
             await interaction.response.send_message("✅ Your birthday has been removed.")
@@ -466,7 +463,7 @@ class Birthday(commands.Cog):
     @app_commands.describe(channel="The text channel to send announcements to")
     async def setbirthdaychannel(self, interaction: discord.Interaction, channel: discord.TextChannel):
         """Set the channel where birthday announcements will be sent."""
-        success = set_birthday_channel(str(interaction.guild.id), str(channel.id))
+        success = await set_birthday_channel(str(interaction.guild.id), str(channel.id))
         
         if success:
             await interaction.response.send_message(f"✅ Birthday announcements will now be sent to {channel.mention}")
@@ -477,7 +474,7 @@ class Birthday(commands.Cog):
     @slash_role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def allbirthdays(self, interaction: discord.Interaction):
         """Show an auto-updating embed with all upcoming birthdays."""
-        embed, total_pages = self.create_birthdays_embed(interaction.guild, page=0)
+        embed, total_pages = await self.create_birthdays_embed(interaction.guild, page=0)
         await interaction.response.send_message(embed=embed)
         
         interaction_response = await interaction.original_response()
@@ -488,7 +485,7 @@ class Birthday(commands.Cog):
             "page": 0
         }
         
-        save_birthday_embed(
+        await save_birthday_embed(
             str(interaction.guild.id),
             str(interaction.channel.id),
             str(message.id),
@@ -1,8 +1,7 @@
 import discord
 from discord.ext import commands
-import asyncio
 from utils.helpers import log_to_channel
-import config
+from utils.channel_edits import channel_edits
 
 class Lockdown(commands.Cog):
     def __init__(self, bot):
@@ -16,17 +15,29 @@ class Lockdown(commands.Cog):
             description=description,
             color=color
         )
-        await ctx.send(embed=embed)
+        status = await ctx.send(embed=embed)
         
-        for ch in ctx.guild.channels:
-            if isinstance(ch, discord.TextChannel):
-                try:
-                    await ch.edit(slowmode_delay=delay, reason=description)
-                except discord.Forbidden:
-                    await log_to_channel(self.bot, f"⚠️ Missing permission for #{ch.name}")
-                except discord.HTTPException as e:
-                    await log_to_channel(self.bot, f"⚠️ Failed to set slowmode for #{ch.name}: {e}")
-                await asyncio.sleep(config.SLOWMODE_EDIT_DELAY)
+        async def report_progress(done, total):
+            embed.set_footer(text=f"Updating channels… {done}/{total}")
+            await status.edit(embed=embed)
+        
+        channels = [(ch, delay) for ch in ctx.guild.channels if isinstance(ch, discord.TextChannel)]
+        result = await channel_edits.set_slowmode(channels, reason=description, on_progress=report_progress)
+        
+        for ch, _, error in result.failed:
+            if isinstance(error, discord.Forbidden):
+                await log_to_channel(self.bot, f"⚠️ Missing permission for #{ch.name}")
+            else:
+                await log_to_channel(self.bot, f"⚠️ Failed to set slowmode for #{ch.name}: {error}")
+        
+        embed.set_footer(text=(
+            f"{len(result.changed)} updated, {len(result.skipped)} already set, "
+            f"{len(result.failed)} failed in {result.elapsed:.1f}s"
+        ))
+        try:
+            await status.edit(embed=embed)
+        except discord.HTTPException:
+            pass
     
     @commands.command()
     @commands.has_permissions(manage_channels=True)
@@ -1,11 +1,15 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 import time
 import asyncio
-import re
-from database import get_guild_settings, save_guild_settings
+from collections import deque
+from utils.settings_store import settings_store
+from utils.moderation_filter import ModerationFilter
 from utils.helpers import log_to_channel
+from utils.timewindows import SlidingWindowCounter, ExpiringDict
+from utils.lru import LRUCache
+from utils import metrics
 from dotenv import load_dotenv
 import config
 
@@ -19,30 +23,31 @@ def role_check(*role_ids):
 class Moderation(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.user_message_logs = {}
-        # Track reactions: key = (channel_id, message_id, user_id, emoji_str), value = timestamp
-        self.reaction_timestamps = {}
-        self.compiled_regex_cache = {}
+        # Recent message times per (guild_id, user_id), bounded in keys and events
+        self.user_message_logs = SlidingWindowCounter(config.SPAM_TRACKER_MAX_KEYS, config.SPAM_TRACKER_MAX_EVENTS)
+        # Track reactions: key = (channel_id, message_id, user_id, emoji_str), value = timestamp.
+        # Entries expire after the quick-reaction window so unremoved reactions don't pile up.
+        self.reaction_timestamps = ExpiringDict(config.QUICK_REACTION_WINDOW, config.REACTION_TRACKER_MAX_ENTRIES)
+        # message_id -> (author_id, author_name) for recent messages in the watched channel
+        self.message_authors = LRUCache(config.REACTION_AUTHOR_CACHE_SIZE)
+        self.pending_reaction_logs = deque(maxlen=config.QUICK_REACTION_LOG_BUFFER)
+        self.dropped_reaction_logs = 0
+        self._reaction_log_channel = None
+        metrics.register("spam_tracker", self.user_message_logs.stats)
+        metrics.register("reaction_tracker", self.reaction_timestamps.stats)
+        metrics.register("reaction_author_cache", self.message_authors.stats)
+        self.sweep_spam_tracker.start()
+        self.flush_reaction_logs.start()
 
-    def get_compiled_regex(self, guild_id: int, key_type: str, word_list: list):
-        if not word_list:
-            return None
-        cache_key = (guild_id, key_type)
-        words_tuple = tuple(sorted(set(w.lower() for w in word_list if w)))
-        if not words_tuple:
-            return None
-        if cache_key in self.compiled_regex_cache:
-            cached_tuple, cached_re = self.compiled_regex_cache[cache_key]
-            if cached_tuple == words_tuple:
-                return cached_re
+    def cog_unload(self):
+        self.sweep_spam_tracker.cancel()
+        self.flush_reaction_logs.cancel()
+
+    @tasks.loop(minutes=5)
+    async def sweep_spam_tracker(self):
+        """Forget users who have not chatted recently."""
+        self.user_message_logs.sweep(time.time(), config.SPAM_TRACKER_IDLE_SECONDS)
 
-        pattern = r'|'.join(re.escape(w) for w in words_tuple)
-        if not pattern:
-            return None
-        compiled = re.compile(pattern, re.IGNORECASE)
-        self.compiled_regex_cache[cache_key] = (words_tuple, compiled)
-        return compiled
-    
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
         """Track when a user adds a reaction in the watched channel."""
@@ -56,7 +61,8 @@ class Moderation(commands.Cog):
         
         # Store the timestamp for this reaction
         key = (payload.channel_id, payload.message_id, payload.user_id, str(payload.emoji))
-        self.reaction_timestamps[key] = time.time()
+        now = time.time()
+        self.reaction_timestamps.set(key, now, now)
     
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
@@ -70,52 +76,80 @@ class Moderation(commands.Cog):
             return
         
         key = (payload.channel_id, payload.message_id, payload.user_id, str(payload.emoji))
-        add_time = self.reaction_timestamps.pop(key, None)
+        now = time.time()
+        add_time = self.reaction_timestamps.pop(key, now)
         
         if add_time is None:
             return
         
-        # Check if reaction was removed within 2 seconds
-        elapsed = time.time() - add_time
-        if elapsed <= 2.0:
+        # Expired entries are already gone, so anything left is within the window
+        elapsed = now - add_time
+        if elapsed <= config.QUICK_REACTION_WINDOW:
             await self._log_quick_reaction(payload, elapsed)
     
+    def _remember_message_author(self, message):
+        self.message_authors.set(message.id, (message.author.id, message.author.name))
+
+    async def _get_message_author(self, channel_id: int, message_id: int):
+        """Return (author_id, author_name), preferring caches over a REST fetch."""
+        author = self.message_authors.get(message_id)
+        if author:
+            return author
+
+        message = discord.utils.get(self.bot.cached_messages, id=message_id)
+        if message is None:
+            channel = self.bot.get_channel(channel_id)
+            if not channel:
+                try:
+                    channel = await self.bot.fetch_channel(channel_id)
+                except (discord.NotFound, discord.Forbidden):
+                    return None
+            try:
+                message = await channel.fetch_message(message_id)
+            except (discord.NotFound, discord.Forbidden):
+                return None
+
+        self._remember_message_author(message)
+        return message.author.id, message.author.name
+
+    async def _get_reaction_log_channel(self):
+        if self._reaction_log_channel is None:
+            channel = self.bot.get_channel(config.REACTION_LOG_CHANNEL_ID)
+            if not channel:
+                try:
+                    channel = await self.bot.fetch_channel(config.REACTION_LOG_CHANNEL_ID)
+                except (discord.NotFound, discord.Forbidden):
+                    return None
+            self._reaction_log_channel = channel
+        return self._reaction_log_channel
+
     async def _log_quick_reaction(self, payload: discord.RawReactionActionEvent, elapsed: float):
-        """Log when a user quickly adds and removes a reaction on another user's message."""
+        """Queue a log entry when a user quickly adds and removes a reaction on another user's message."""
         if not config.REACTION_LOG_CHANNEL_ID:
             return
         
-        log_channel = self.bot.get_channel(config.REACTION_LOG_CHANNEL_ID)
-        if not log_channel:
-            try:
-                log_channel = await self.bot.fetch_channel(config.REACTION_LOG_CHANNEL_ID)
-            except (discord.NotFound, discord.Forbidden):
-                return
-        
-        # Fetch the message to get the author
-        channel = self.bot.get_channel(payload.channel_id)
-        if not channel:
-            try:
-                channel = await self.bot.fetch_channel(payload.channel_id)
-            except (discord.NotFound, discord.Forbidden):
-                return
-        
-        try:
-            message = await channel.fetch_message(payload.message_id)
-        except (discord.NotFound, discord.Forbidden):
+        author = await self._get_message_author(payload.channel_id, payload.message_id)
+        if author is None:
             return
+        author_id, author_name = author
         
         # Only log if the reactor is not the message author (reacting to someone else's message)
-        if payload.user_id == message.author.id:
+        if payload.user_id == author_id:
             return
         
-        # Fetch the user who reacted
-        try:
-            reactor = await self.bot.fetch_user(payload.user_id)
-        except discord.NotFound:
-            reactor = None
+        # Resolve the reactor from the member/user caches before falling back to the API
+        guild = self.bot.get_guild(payload.guild_id) if payload.guild_id else None
+        reactor = (guild.get_member(payload.user_id) if guild else None) or self.bot.get_user(payload.user_id)
+        if reactor is None:
+            try:
+                reactor = await self.bot.fetch_user(payload.user_id)
+            except discord.HTTPException:
+                reactor = None
         
         reactor_name = f"{reactor.mention} ({reactor.name})" if reactor else f"User ID: {payload.user_id}"
+        channel = self.bot.get_channel(payload.channel_id)
+        channel_name = channel.name if channel else payload.channel_id
+        jump_url = f"https://discord.com/channels/{payload.guild_id or '@me'}/{payload.channel_id}/{payload.message_id}"
         
         embed = discord.Embed(
             title="⚡ Quick Reaction Detected",
@@ -124,17 +158,40 @@ class Moderation(commands.Cog):
         )
         embed.add_field(name="Reactor", value=reactor_name, inline=True)
         embed.add_field(name="Emoji", value=str(payload.emoji), inline=True)
-        embed.add_field(name="Message Author", value=f"{message.author.mention} ({message.author.name})", inline=True)
-        embed.add_field(name="Message", value=f"[Jump to message]({message.jump_url})", inline=False)
-        embed.set_footer(text=f"Channel: #{channel.name}")
+        embed.add_field(name="Message Author", value=f"<@{author_id}> ({author_name})", inline=True)
+        embed.add_field(name="Message", value=f"[Jump to message]({jump_url})", inline=False)
+        embed.set_footer(text=f"Channel: #{channel_name}")
         
-        try:
-            await log_channel.send(embed=embed)
-        except discord.HTTPException:
-            pass
+        if len(self.pending_reaction_logs) == self.pending_reaction_logs.maxlen:
+            self.dropped_reaction_logs += 1
+        self.pending_reaction_logs.append(embed)
+
+    @tasks.loop(seconds=config.QUICK_REACTION_LOG_INTERVAL)
+    async def flush_reaction_logs(self):
+        """Send queued quick-reaction embeds, up to 10 per message."""
+        if not self.pending_reaction_logs:
+            return
+        log_channel = await self._get_reaction_log_channel()
+        if log_channel is None:
+            self.pending_reaction_logs.clear()
+            return
+        
+        while self.pending_reaction_logs:
+            batch = [self.pending_reaction_logs.popleft() for _ in range(min(10, len(self.pending_reaction_logs)))]
+            content = None
+            if not self.pending_reaction_logs and self.dropped_reaction_logs:
+                content = f"⚠️ {self.dropped_reaction_logs} more quick reaction(s) were not logged (buffer full)."
+                self.dropped_reaction_logs = 0
+            try:
+                await log_channel.send(content=content, embeds=batch)
+            except discord.HTTPException:
+                pass
         
     @commands.Cog.listener()
     async def on_message(self, message):
+        if config.REACTION_WATCH_CHANNEL_ID and message.channel.id == config.REACTION_WATCH_CHANNEL_ID:
+            self._remember_message_author(message)
+        
         if message.author.bot:
             return
         
@@ -155,24 +212,21 @@ class Moderation(commands.Cog):
                         return
 
         guild = message.guild
-        guild_settings = get_guild_settings(guild.id) if guild else None
+        guild_settings = settings_store.peek(guild.id) if guild else None
         
         if guild_settings and guild_settings.get("moderation_enabled", False):
-            content = message.content
-            content_lower = content.lower() if content else ""
+            content = message.content or ""
             author = message.author
             current_time = time.time()
             
-            bad_words = guild_settings.get("bad_words", config.DEFAULT_BAD_WORDS)
-            if bad_words:
-                bad_words_re = self.get_compiled_regex(guild.id, "bad_words", bad_words)
-                if bad_words_re and bad_words_re.search(content_lower):
-                    try: 
-                        await message.delete()
-                    except: 
-                        pass
-                    await self.warn_user(author, "Inappropriate language.")
-                    return
+            guild_filter = settings_store.derive(guild.id, "moderation_filter", ModerationFilter.from_settings)
+            if guild_filter.has_bad_word(content):
+                try: 
+                    await message.delete()
+                except: 
+                    pass
+                await self.warn_user(author, "Inappropriate language.")
+                return
 
             # caps_threshold = float(guild_settings.get("caps_threshold", config.DEFAULT_CAPS_THRESHOLD))
             # if content and len(content) > 10:
@@ -187,16 +241,13 @@ class Moderation(commands.Cog):
             #             await self.warn_user(author, "Too many capital letters.")
             #             return
 
-            banned_links = guild_settings.get("banned_links", config.DEFAULT_BANNED_LINKS)
-            if banned_links:
-                banned_links_re = self.get_compiled_regex(guild.id, "banned_links", banned_links)
-                if banned_links_re and banned_links_re.search(content_lower):
-                    try: 
-                        await message.delete()
-                    except: 
-                        pass
-                    await self.warn_user(author, "Posting invite or banned links.")
-                    return
+            if guild_filter.has_banned_link(content):
+                try: 
+                    await message.delete()
+                except: 
+                    pass
+                await self.warn_user(author, "Posting invite or banned links.")
+                return
             
             spam_window = int(guild_settings.get("spam_window", config.DEFAULT_SPAM_WINDOW))
             spam_threshold = int(guild_settings.get("spam_threshold", config.DEFAULT_SPAM_THRESHOLD))
@@ -212,14 +263,14 @@ class Moderation(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def moderation(self, ctx, action: str = None):
         """Enable or disable moderation."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         if action == "enable":
             settings["moderation_enabled"] = True
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("✅ Moderation enabled.")
         elif action == "disable":
             settings["moderation_enabled"] = False
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send("❌ Moderation disabled.")
         else:
             await ctx.send("Usage: /moderation enable|disable")
@@ -228,20 +279,20 @@ class Moderation(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def badword(self, ctx, action: str = None, *, word: str = None):
         """Manage bad words list."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         words = settings.get("bad_words", config.DEFAULT_BAD_WORDS)
         if action == "add" and word:
             lw = word.lower()
             if lw not in words:
                 words.append(lw)
             settings["bad_words"] = words
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"✅ Added bad word: {word}")
         elif action == "remove" and word:
             if word.lower() in words: 
                 words.remove(word.lower())
             settings["bad_words"] = words
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"❌ Removed bad word: {word}")
         elif action == "list":
             await ctx.send("Bad words: " + ", ".join(words))
@@ -252,20 +303,20 @@ class Moderation(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def bannedlink(self, ctx, action: str = None, *, link: str = None):
         """Manage banned links list."""
-        settings = get_guild_settings(ctx.guild.id)
+        settings = await settings_store.get_guild_settings(ctx.guild.id)
         links = settings.get("banned_links", config.DEFAULT_BANNED_LINKS)
         if action == "add" and link:
             ll = link.lower()
             if ll not in links:
                 links.append(ll)
             settings["banned_links"] = links
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"✅ Added banned link: {link}")
         elif action == "remove" and link:
             if link.lower() in links: 
                 links.remove(link.lower())
             settings["banned_links"] = links
-            save_guild_settings(ctx.guild.id, settings)
+            await settings_store.save_guild_settings(ctx.guild.id, settings)
             await ctx.send(f"❌ Removed banned link: {link}")
         elif action == "list":
             await ctx.send("Banned links: " + ", ".join(links))
@@ -292,14 +343,14 @@ class Moderation(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         if action.value == "enable":
             settings["moderation_enabled"] = True
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("✅ Moderation enabled.")
         else:
             settings["moderation_enabled"] = False
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message("❌ Moderation disabled.")
 
     @app_commands.command(name="badword", description="Manage the server bad words filter list")
@@ -313,7 +364,7 @@ class Moderation(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         words = settings.get("bad_words", config.DEFAULT_BAD_WORDS)
         if action.value == "add":
             if not word:
@@ -323,7 +374,7 @@ class Moderation(commands.Cog):
             if lw not in words:
                 words.append(lw)
             settings["bad_words"] = words
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"✅ Added bad word: {word}")
         elif action.value == "remove":
             if not word:
@@ -332,7 +383,7 @@ class Moderation(commands.Cog):
             if word.lower() in words:
                 words.remove(word.lower())
             settings["bad_words"] = words
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"❌ Removed bad word: {word}")
         elif action.value == "list":
             await interaction.response.send_message("Bad words: " + ", ".join(words))
@@ -348,7 +399,7 @@ class Moderation(commands.Cog):
         if not self._check_mod_perms(interaction):
             await interaction.response.send_message("❌ You need Administrator or Moderator permissions.", ephemeral=True)
             return
-        settings = get_guild_settings(interaction.guild_id)
+        settings = await settings_store.get_guild_settings(interaction.guild_id)
         links = settings.get("banned_links", config.DEFAULT_BANNED_LINKS)
         if action.value == "add":
             if not link:
@@ -358,7 +409,7 @@ class Moderation(commands.Cog):
             if ll not in links:
                 links.append(ll)
             settings["banned_links"] = links
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"✅ Added banned link: {link}")
         elif action.value == "remove":
             if not link:
@@ -367,7 +418,7 @@ class Moderation(commands.Cog):
             if link.lower() in links:
                 links.remove(link.lower())
             settings["banned_links"] = links
-            save_guild_settings(interaction.guild_id, settings)
+            await settings_store.save_guild_settings(interaction.guild_id, settings)
             await interaction.response.send_message(f"❌ Removed banned link: {link}")
         elif action.value == "list":
             await interaction.response.send_message("Banned links: " + ", ".join(links))
@@ -426,11 +477,8 @@ class Moderation(commands.Cog):
     
     def is_spam(self, guild_id, user_id, current_time, spam_window, spam_threshold):
         """Check if message is spam."""
-        key = (guild_id, user_id)
-        message_times = self.user_message_logs.get(key, [])
-        message_times.append(current_time)
-        self.user_message_logs[key] = [t for t in message_times if current_time - t < spam_window]
-        return len(self.user_message_logs[key]) >= spam_threshold
+        recent = self.user_message_logs.hit((guild_id, user_id), current_time, spam_window)
+        return recent >= spam_threshold
 
 async def setup(bot):
     await bot.add_cog(Moderation(bot))
\ No newline at end of file
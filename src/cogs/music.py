@@ -15,6 +15,7 @@ import concurrent.futures
 from datetime import timedelta
 import sys
 import database
+import async_database
 
 try:
     import yt_dlp
@@ -84,7 +85,7 @@ async def extract_info_subprocess_async(url_or_query: str, ydl_opts: dict) -> di
     )
 
 
-def load_music_index() -> dict:
+async def load_music_index() -> dict:
     data = {"tracks": {}, "next_id": 1}
     if os.path.exists(MUSIC_INDEX_FILE):
         try:
@@ -99,7 +100,7 @@ def load_music_index() -> dict:
 
     # Sync/merge with Supabase cloud database
     try:
-        cloud_tracks = database.get_all_music_tracks()
+        cloud_tracks = await async_database.get_all_music_tracks()
         max_id = int(data.get("next_id", 1)) - 1
         for ct in cloud_tracks:
             tid = str(ct.get("track_id"))
@@ -966,7 +967,7 @@ class Music(commands.Cog):
 
         await ctx.defer()
 
-        index = load_music_index()
+        index = await load_music_index()
         track_id = str(index.get("next_id", 1))
         index["next_id"] = int(track_id) + 1
 
@@ -995,7 +996,7 @@ class Music(commands.Cog):
         save_music_index(index)
 
         # Background sync to Supabase database table & storage bucket
-        asyncio.create_task(asyncio.to_thread(database.upsert_music_track, index["tracks"][track_id]))
+        asyncio.create_task(async_database.upsert_music_track(index["tracks"][track_id]))
         asyncio.create_task(asyncio.to_thread(database.upload_music_storage, clean_name, filepath))
 
         embed = discord.Embed(
@@ -1016,7 +1017,7 @@ class Music(commands.Cog):
         """Show uploaded local music tracks."""
         if ctx.interaction:
             await ctx.defer()
-        index = load_music_index()
+        index = await load_music_index()
         all_tracks = list(index.get("tracks", {}).values())
 
         is_admin = ctx.author.guild_permissions.administrator or (ctx.guild and ctx.author == ctx.guild.owner)
@@ -1065,7 +1066,7 @@ class Music(commands.Cog):
         """Delete an uploaded track."""
         if ctx.interaction:
             await ctx.defer()
-        index = load_music_index()
+        index = await load_music_index()
         tracks = index.get("tracks", {})
 
         target_id = None
@@ -1101,7 +1102,7 @@ class Music(commands.Cog):
         save_music_index(index)
 
         # Sync deletion to Supabase
-        asyncio.create_task(asyncio.to_thread(database.delete_music_track, target_id, deleted_filename))
+        asyncio.create_task(async_database.delete_music_track(target_id, deleted_filename))
 
         await ctx.send(f"🗑️ Successfully deleted track **#{target_id} — {deleted_title}**.")
 
@@ -1111,7 +1112,7 @@ class Music(commands.Cog):
         """Toggle an uploaded track's privacy status."""
         if ctx.interaction:
             await ctx.defer()
-        index = load_music_index()
+        index = await load_music_index()
         tracks = index.get("tracks", {})
 
         target_id = None
@@ -1137,7 +1138,7 @@ class Music(commands.Cog):
         save_music_index(index)
 
         # Sync privacy status to Supabase
-        asyncio.create_task(asyncio.to_thread(database.upsert_music_track, track_info))
+        asyncio.create_task(async_database.upsert_music_track(track_info))
 
         status = "🔒 **Private** (Only you can play/browse)" if track_info["is_private"] else "🌐 **Public** (Shared with server)"
         await ctx.send(f"✅ Privacy updated for track **#{target_id} — {track_info['title']}**:\nNew Status: {status}")
@@ -1151,7 +1152,7 @@ class Music(commands.Cog):
         """Rename an uploaded track."""
         if ctx.interaction:
             await ctx.defer()
-        index = load_music_index()
+        index = await load_music_index()
         tracks = index.get("tracks", {})
 
         target_id = None
@@ -1182,7 +1183,7 @@ class Music(commands.Cog):
         save_music_index(index)
 
         # Sync new title to Supabase
-        asyncio.create_task(asyncio.to_thread(database.upsert_music_track, track_info))
+        asyncio.create_task(async_database.upsert_music_track(track_info))
 
         await ctx.send(f"✏️ Successfully renamed track **#{target_id}**:\n**Old Title:** `{old_title}`\n**New Title:** `{clean_new_title}`")
 
@@ -1250,7 +1251,7 @@ class Music(commands.Cog):
                 return await ctx.send("❌ Unsupported attachment format! Please attach an audio file.")
 
             # Save temporarily or into library
-            index = load_music_index()
+            index = await load_music_index()
             track_id = str(index.get("next_id", 1))
             index["next_id"] = int(track_id) + 1
             clean_name = f"{track_id}_{int(time.time())}_{attachment.filename}"
@@ -1273,7 +1274,7 @@ class Music(commands.Cog):
                 save_music_index(index)
 
                 # Background sync to Supabase
-                asyncio.create_task(asyncio.to_thread(database.upsert_music_track, index["tracks"][track_id]))
+                asyncio.create_task(async_database.upsert_music_track(index["tracks"][track_id]))
                 asyncio.create_task(asyncio.to_thread(database.upload_music_storage, clean_name, filepath))
 
                 tracks_to_add.append({
@@ -1290,7 +1291,7 @@ class Music(commands.Cog):
 
         # 2. Check query against local library or YouTube
         if query:
-            index = load_music_index()
+            index = await load_music_index()
             local_match = None
 
             # Check if query matches ID (#1 or 1)
@@ -6,7 +6,7 @@ import asyncio
 import pytz
 from geopy.geocoders import Nominatim
 from timezonefinder import TimezoneFinder
-from database import (
+from async_database import (
     get_user_timezone, set_user_timezone, remove_user_timezone, get_all_user_timezones,
     save_timezone_embed, update_timezone_embed_page, remove_timezone_embed, get_all_timezone_embeds
 )
@@ -47,13 +47,13 @@ class Timezone(commands.Cog):
                 current_page = self.updating_messages[guild_id].get("page", 0)
                 if current_page != 0:  # Only reset if not already on page 1
                     self.updating_messages[guild_id]["page"] = 0
-                    update_timezone_embed_page(str(guild_id), 0)
+                    await update_timezone_embed_page(str(guild_id), 0)
                     
                     guild = self.bot.get_guild(guild_id)
                     if guild:
                         try:
                             message = self.updating_messages[guild_id]["message"]
-                            embed, _ = self.create_times_embed(guild, 0)
+                            embed, _ = await self.create_times_embed(guild, 0)
                             await message.edit(embed=embed)
                         except Exception as e:
                             print(f"Error resetting page: {e}")
@@ -67,7 +67,7 @@ class Timezone(commands.Cog):
     
     async def load_persisted_embeds(self):
         """Load persisted embed tracking from database on startup."""
-        embeds = get_all_timezone_embeds()
+        embeds = await get_all_timezone_embeds()
         loaded_count = 0
         
         for embed_data in embeds:
@@ -80,13 +80,13 @@ class Timezone(commands.Cog):
                 guild = self.bot.get_guild(guild_id)
                 if not guild:
                     # Guild no longer accessible, clean up
-                    remove_timezone_embed(str(guild_id))
+                    await remove_timezone_embed(str(guild_id))
                     continue
                 
                 channel = guild.get_channel(channel_id)
                 if not channel:
                     # Channel no longer exists, clean up
-                    remove_timezone_embed(str(guild_id))
+                    await remove_timezone_embed(str(guild_id))
                     continue
                 
                 try:
@@ -98,10 +98,10 @@ class Timezone(commands.Cog):
                     loaded_count += 1
                 except discord.NotFound:
                     # Message was deleted, clean up
-                    remove_timezone_embed(str(guild_id))
+                    await remove_timezone_embed(str(guild_id))
                 except discord.Forbidden:
                     # No permission to access, clean up
-                    remove_timezone_embed(str(guild_id))
+                    await remove_timezone_embed(str(guild_id))
             except Exception as e:
                 print(f"Error loading embed for guild {embed_data.get('guild_id')}: {e}")
         
@@ -173,7 +173,7 @@ class Timezone(commands.Cog):
         except Exception:
             return 0
     
-    def create_times_embed(self, guild, page: int = 0) -> tuple[discord.Embed, int]:
+    async def create_times_embed(self, guild, page: int = 0) -> tuple[discord.Embed, int]:
         """Create an embed showing all users' times, sorted by timezone.
         
         Returns tuple of (embed, total_pages).
@@ -185,7 +185,7 @@ class Timezone(commands.Cog):
             color=discord.Color.blue()
         )
         
-        all_timezones = get_all_user_timezones()
+        all_timezones = await get_all_user_timezones()
         
         if not all_timezones:
             embed.description = "No timezones set yet!\nUse `/settime <location>` to add yours!"
@@ -259,8 +259,6 @@ class Timezone(commands.Cog):
     @tasks.loop(minutes=1)
     async def update_time_embeds(self):
         """Update all active time embed messages."""
-        # Pre-fetch timezones in a background thread to prevent blocking the event loop
-        await asyncio.to_thread(get_all_user_timezones)
         
         for guild_id, data in list(self.updating_messages.items()):
             try:
@@ -268,12 +266,12 @@ class Timezone(commands.Cog):
                 if guild:
                     message = data["message"]
                     page = data.get("page", 0)
-                    embed, _ = self.create_times_embed(guild, page)
+                    embed, _ = await self.create_times_embed(guild, page)
                     await message.edit(embed=embed)
             except discord.NotFound:
                 # Message was deleted, clean up from memory and database
                 del self.updating_messages[guild_id]
-                remove_timezone_embed(str(guild_id))
+                await remove_timezone_embed(str(guild_id))
             except Exception as e:
                 print(f"Error updating time embed: {e}")
     
@@ -284,7 +282,7 @@ class Timezone(commands.Cog):
                 data = self.updating_messages[guild.id]
                 message = data["message"]
                 page = data.get("page", 0)
-                embed, total_pages = self.create_times_embed(guild, page)
+                embed, total_pages = await self.create_times_embed(guild, page)
                 await message.edit(embed=embed)
                 
                 # Add pagination reactions if needed and not already present
@@ -296,7 +294,7 @@ class Timezone(commands.Cog):
                         await message.add_reaction("➡️")
             except discord.NotFound:
                 del self.updating_messages[guild.id]
-                remove_timezone_embed(str(guild.id))
+                await remove_timezone_embed(str(guild.id))
             except Exception as e:
                 print(f"Error refreshing time embed: {e}")
     
@@ -345,7 +343,7 @@ class Timezone(commands.Cog):
         if not guild:
             return
         
-        _, total_pages = self.create_times_embed(guild, current_page)
+        _, total_pages = await self.create_times_embed(guild, current_page)
         
         # Calculate new page
         if emoji == "⬅️":
@@ -357,8 +355,8 @@ class Timezone(commands.Cog):
         if new_page != current_page:
             self.updating_messages[guild_id]["page"] = new_page
             # Persist page change to database
-            update_timezone_embed_page(str(guild_id), new_page)
-            embed, _ = self.create_times_embed(guild, new_page)
+            await update_timezone_embed_page(str(guild_id), new_page)
+            embed, _ = await self.create_times_embed(guild, new_page)
             
             try:
                 await data["message"].edit(embed=embed)
@@ -404,7 +402,7 @@ class Timezone(commands.Cog):
         timezone = location_info["timezone"]
         country_code = location_info["country_code"]
         
-        success = set_user_timezone(str(interaction.user.id), city, country, timezone, country_code)
+        success = await set_user_timezone(str(interaction.user.id), city, country, timezone, country_code)
         
         if success:
             current_time = self.get_current_time(timezone)
@@ -419,7 +417,7 @@ class Timezone(commands.Cog):
     @app_commands.command(name="mytime", description="Show your current local time")
     async def mytime(self, interaction: discord.Interaction):
         """Show your current local time."""
-        tz_data = get_user_timezone(str(interaction.user.id))
+        tz_data = await get_user_timezone(str(interaction.user.id))
         
         if not tz_data:
             await interaction.response.send_message(f"❌ {interaction.user.mention}, you haven't set your timezone yet. Use `/settime` to set it.", ephemeral=True)
@@ -442,7 +440,7 @@ class Timezone(commands.Cog):
         if member is None:
             member = interaction.user
         
-        tz_data = get_user_timezone(str(member.id))
+        tz_data = await get_user_timezone(str(member.id))
         
         if not tz_data:
             if member == interaction.user:
@@ -464,13 +462,13 @@ class Timezone(commands.Cog):
     @app_commands.command(name="removetime", description="Remove your timezone setting")
     async def removetime(self, interaction: discord.Interaction):
         """Remove your timezone setting."""
-        tz_data = get_user_timezone(str(interaction.user.id))
+        tz_data = await get_user_timezone(str(interaction.user.id))
         
         if not tz_data:
             await interaction.response.send_message(f"ℹ️ {interaction.user.mention}, you don't have a timezone set.", ephemeral=True)
             return
         
-        success = remove_user_timezone(str(interaction.user.id))
+        success = await remove_user_timezone(str(interaction.user.id))
         
         if success:
             await interaction.response.send_message(f"✅ {interaction.user.mention}, your timezone has been removed.")
@@ -483,7 +481,7 @@ class Timezone(commands.Cog):
     @slash_role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def alltimes(self, interaction: discord.Interaction):
         """Show an auto-updating embed with all users' local times."""
-        embed, total_pages = self.create_times_embed(interaction.guild, page=0)
+        embed, total_pages = await self.create_times_embed(interaction.guild, page=0)
         await interaction.response.send_message(embed=embed)
         
         # Get the message we just sent - fetch it from channel to get a proper Message object
@@ -498,7 +496,7 @@ class Timezone(commands.Cog):
         }
         
         # Persist to database for survival across restarts
-        save_timezone_embed(
+        await save_timezone_embed(
             str(interaction.guild.id),
             str(interaction.channel.id),
             str(message.id),
@@ -1,16 +1,15 @@
 import discord
 from discord.ext import commands, tasks
 from discord.ui import View, Button
-import aiohttp
 import asyncio
 import re
+import time
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
-from database import (
-    get_guild_settings,
+from async_database import (
     get_user,
-    get_all_twitch_ids,
-    update_twitch_username_by_id,
+    get_twitch_links,
+    bulk_update_twitch_usernames,
     clear_user_twitch,
     get_streamer_by_twitch_id,
     delete_streamer_by_twitch_id,
@@ -18,11 +17,11 @@ from database import (
 )
 from utils.helpers import log_to_channel
 from utils.twitch_utils import (
-    get_twitch_app_token, 
     twitch_get_user_by_login,
-    refresh_streamer_token,
-    ban_queue
+    refresh_streamer_token
 )
+from utils.helix import helix
+from utils.streamer_tokens import streamer_tokens
 import config
 
 load_dotenv()
@@ -43,38 +42,64 @@ class Twitch(commands.Cog):
     
     @tasks.loop(hours=6)
     async def sync_twitch_usernames(self):
-        """Sync stored twitch_id -> twitch_username for all users."""
-        ids = get_all_twitch_ids()
-        
-        if not ids:
+        """Sync stored twitch_id -> twitch_username for all users.
+
+        Logins are fetched from Helix in concurrent batches of 100, compared
+        with the stored ones, and only changed rows are written back in one
+        bulk upsert.
+        """
+        started = time.monotonic()
+        links = await get_twitch_links()
+        if not links:
             return
         
+        stored = {}   # twitch_id -> [(discord_id, stored login)]
+        for row in links:
+            stored.setdefault(str(row["twitch_id"]), []).append((row["discord_id"], row.get("twitch_username")))
+        ids = list(stored)
+        
+        semaphore = asyncio.Semaphore(config.TWITCH_SYNC_CONCURRENCY)
+        failed_batches = 0
+        
+        async def fetch_batch(batch):
+            nonlocal failed_batches
+            async with semaphore:
+                try:
+                    status, data = await helix.get("users", params=[("id", tid) for tid in batch])
+                except Exception as e:
+                    print("Helix error during twitch sync:", e)
+                    status, data = None, None
+            if status != 200:
+                failed_batches += 1
+            return (data or {}).get("data", [])
+        
         batch_size = 100
-        for i in range(0, len(ids), batch_size):
-            batch = ids[i:i+batch_size]
-            token = await get_twitch_app_token()
-            headers = {"Client-ID": config.TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
-            
-            params = [("id", tid) for tid in batch]
-            async with aiohttp.ClientSession() as session:
-                async with session.get("https://api.twitch.tv/helix/users", params=params, headers=headers) as resp:
-                    try:
-                        data = await resp.json()
-                    except Exception:
-                        data = {}
-            
-            for u in data.get("data", []):
+        results = await asyncio.gather(*(fetch_batch(ids[i:i+batch_size]) for i in range(0, len(ids), batch_size)))
+        
+        changes = []
+        for users in results:
+            for u in users:
                 tid = u.get("id")
                 login = u.get("login")
                 if not tid or not login:
                     continue
-                try:
-                    updated = update_twitch_username_by_id(tid, login)
-                    if updated:
-                        print(f"Updated username for twitch_id {tid} -> {login}")
-                        await log_to_channel(self.bot, f"[sync] Updated Twitch username for twitch_id {tid} -> {login}")
-                except Exception as e:
-                    print("DB error during twitch sync:", e)
+                for discord_id, old_login in stored.get(tid, ()):
+                    if old_login != login:
+                        changes.append((discord_id, tid, login))
+        
+        written = await bulk_update_twitch_usernames(changes) if changes else 0
+        elapsed = time.monotonic() - started
+        
+        summary = f"[sync] Checked {len(ids)} Twitch accounts in {elapsed:.1f}s: {written} username(s) updated"
+        if written < len(changes):
+            summary += f", {len(changes) - written} failed to save"
+        if failed_batches:
+            summary += f", {failed_batches} Helix batch(es) failed"
+        print(summary)
+        if changes:
+            examples = ", ".join(f"{tid} -> {login}" for _, tid, login in changes[:10])
+            more = f" (+{len(changes) - 10} more)" if len(changes) > 10 else ""
+            await log_to_channel(self.bot, f"{summary}. {examples}{more}")
     
     @sync_twitch_usernames.before_loop
     async def before_sync_twitch_usernames(self):
@@ -148,7 +173,7 @@ class Twitch(commands.Cog):
     async def twitch(self, ctx, member: discord.Member = None):
         """Show linked Twitch account for a member."""
         member = member or ctx.author
-        user = get_user(str(member.id))
+        user = await get_user(str(member.id))
         
         if user and user.get("twitch_username"):
             await ctx.send(f"{member.display_name}'s Twitch: **{user['twitch_username']}**")
@@ -159,10 +184,10 @@ class Twitch(commands.Cog):
     async def unlinktwitch(self, ctx):
         """Unlink your Twitch account."""
         try:
-            user = get_user(str(ctx.author.id))
+            user = await get_user(str(ctx.author.id))
             had_twitch = user and user.get("twitch_username")
             
-            clear_user_twitch(str(ctx.author.id))
+            await clear_user_twitch(str(ctx.author.id))
             
             if had_twitch:
                 msg = f"✅ {ctx.author.mention}, your Twitch account has been unlinked."
@@ -192,11 +217,12 @@ class Twitch(commands.Cog):
         
         try:
             # Try to find by Twitch ID first
-            streamer = get_streamer_by_twitch_id(identifier)
+            streamer = await get_streamer_by_twitch_id(identifier)
             if streamer:
                 discord_id = streamer["discord_id"]
-                delete_streamer_by_twitch_id(identifier)
-                clear_user_twitch(str(discord_id))
+                await delete_streamer_by_twitch_id(identifier)
+                streamer_tokens.forget(discord_id)
+                await clear_user_twitch(str(discord_id))
                 
                 msg = (f"✅ {ctx.author.mention} unlinked streamer with Twitch ID `{identifier}` "
                        f"and cleared linked Twitch for Discord ID `{discord_id}`.")
@@ -205,9 +231,10 @@ class Twitch(commands.Cog):
                 return
             
             # Try by Discord ID
-            twitch_id = delete_streamer_by_discord_id(str(identifier))
+            twitch_id = await delete_streamer_by_discord_id(str(identifier))
             if twitch_id:
-                clear_user_twitch(str(identifier))
+                streamer_tokens.forget(identifier)
+                await clear_user_twitch(str(identifier))
                 
                 msg = (f"✅ {ctx.author.mention} unlinked streamer for Discord ID `{identifier}` "
                        f"(Twitch ID: `{twitch_id}`) and cleared linked Twitch username.")
@@ -229,18 +256,9 @@ class Twitch(commands.Cog):
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def gettwid(self, ctx, twitch_username: str):
         """Lookup Twitch numeric ID."""
-        token = await get_twitch_app_token()
-        headers = {"Client-ID": config.TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://api.twitch.tv/helix/users",
-                params={"login": twitch_username},
-                headers=headers
-            ) as resp:
-                data = await resp.json()
+        _, data = await helix.get("users", params={"login": twitch_username})
         
-        if not data.get("data"):
+        if not data or not data.get("data"):
             await ctx.send(f"❌ No Twitch user found for `{twitch_username}`")
             return
         
@@ -254,13 +272,6 @@ class Twitch(commands.Cog):
     async def subscribeban(self, ctx, twitch_id: str):
         """Subscribe to Twitch ban events for a channel."""
         callback_url = config.TWITCH_CALLBACK_URL
-        token = await get_twitch_app_token()
-        
-        headers = {
-            "Client-ID": config.TWITCH_CLIENT_ID,
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
         body = {
             "type": "channel.ban",
             "version": "1",
@@ -272,15 +283,9 @@ class Twitch(commands.Cog):
             },
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://api.twitch.tv/helix/eventsub/subscriptions",
-                headers=headers,
-                json=body,
-            ) as resp:
-                data = await resp.json()
+        _, data = await helix.post("eventsub/subscriptions", json=body)
         
-        if "error" in data:
+        if not data or "error" in data:
             await ctx.send(f"❌ Failed to subscribe: {data}")
         else:
             await ctx.send(f"✅ Subscribed to ban events for Twitch channel `{twitch_id}`")
@@ -289,65 +294,39 @@ class Twitch(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def unsubscribeban(self, ctx, identifier: str):
         """Unsubscribe from EventSub subscription."""
-        token = await get_twitch_app_token()
-        headers = {
-            "Client-ID": config.TWITCH_CLIENT_ID,
-            "Authorization": f"Bearer {token}"
-        }
+        _, subs_data = await helix.get("eventsub/subscriptions")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://api.twitch.tv/helix/eventsub/subscriptions",
-                headers=headers
-            ) as resp:
-                subs_data = await resp.json()
-            
-            subs = subs_data.get("data", [])
-            if not subs:
-                await ctx.send("📭 No active subscriptions.")
-                return
-            
-            to_delete = []
-            for sub in subs:
-                if sub["id"] == identifier or sub["condition"].get("broadcaster_user_id") == identifier:
-                    to_delete.append(sub["id"])
-            
-            if not to_delete:
-                await ctx.send(f"❌ No subscription found for `{identifier}`")
-                return
-            
-            results = []
-            for sub_id in to_delete:
-                async with session.delete(
-                    f"https://api.twitch.tv/helix/eventsub/subscriptions?id={sub_id}",
-                    headers=headers
-                ) as del_resp:
-                    if del_resp.status == 204:
-                        results.append(f"✅ Unsubscribed from `{sub_id}`")
-                    else:
-                        error_data = await del_resp.json()
-                        results.append(f"❌ Failed to unsubscribe `{sub_id}`: {error_data}")
-            
-            await ctx.send("\n".join(results))
+        subs = (subs_data or {}).get("data", [])
+        if not subs:
+            await ctx.send("📭 No active subscriptions.")
+            return
+        
+        to_delete = []
+        for sub in subs:
+            if sub["id"] == identifier or sub["condition"].get("broadcaster_user_id") == identifier:
+                to_delete.append(sub["id"])
+        
+        if not to_delete:
+            await ctx.send(f"❌ No subscription found for `{identifier}`")
+            return
+        
+        results = []
+        for sub_id in to_delete:
+            status, error_data = await helix.delete("eventsub/subscriptions", params={"id": sub_id})
+            if status == 204:
+                results.append(f"✅ Unsubscribed from `{sub_id}`")
+            else:
+                results.append(f"❌ Failed to unsubscribe `{sub_id}`: {error_data}")
+        
+        await ctx.send("\n".join(results))
     
     @commands.command()
     @role_check(config.ADMIN_ROLE_ID, config.MOD_ROLE_ID)
     async def listsubs(self, ctx):
         """List active EventSub subscriptions."""
-        token = await get_twitch_app_token()
-        headers = {
-            "Client-ID": config.TWITCH_CLIENT_ID,
-            "Authorization": f"Bearer {token}"
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://api.twitch.tv/helix/eventsub/subscriptions",
-                headers=headers
-            ) as resp:
-                data = await resp.json()
+        _, data = await helix.get("eventsub/subscriptions")
         
-        subs = data.get("data", [])
+        subs = (data or {}).get("data", [])
         if not subs:
             await ctx.send("📭 No active subscriptions.")
             return
@@ -3,7 +3,7 @@ from discord.ext import commands
 from discord.ui import View, Button
 from urllib.parse import quote_plus
 import config
-from database import get_user, clear_user_youtube
+from async_database import get_user, clear_user_youtube
 
 class YouTube(commands.Cog):
     def __init__(self, bot):
@@ -42,7 +42,7 @@ class YouTube(commands.Cog):
     async def youtube(self, ctx, member: discord.Member = None):
         """Show linked YouTube account."""
         member = member or ctx.author
-        user = get_user(str(member.id))
+        user = await get_user(str(member.id))
         
         if user and user.get("youtube_channel"):
             await ctx.send(f"{member.display_name}'s YouTube: **{user['youtube_channel']}**")
@@ -52,7 +52,7 @@ class YouTube(commands.Cog):
     @commands.command()
     async def unlinkyoutube(self, ctx):
         """Unlink YouTube account."""
-        clear_user_youtube(str(ctx.author.id))
+        await clear_user_youtube(str(ctx.author.id))
         await ctx.send(f"{ctx.author.mention}, your YouTube account has been unlinked.")
 
 async def setup(bot):
@@ -15,6 +15,11 @@ OWNER_ID = int(os.getenv("OWNER")) if os.getenv("OWNER") else None
 # Reaction Tracking Config
 REACTION_WATCH_CHANNEL_ID = int(os.getenv("REACTION_WATCH_CHANNEL_ID", 0)) or None
 REACTION_LOG_CHANNEL_ID = int(os.getenv("REACTION_LOG_CHANNEL_ID", 0)) or None
+QUICK_REACTION_WINDOW = 2.0
+REACTION_TRACKER_MAX_ENTRIES = 20000
+REACTION_AUTHOR_CACHE_SIZE = 5000
+QUICK_REACTION_LOG_INTERVAL = 5
+QUICK_REACTION_LOG_BUFFER = 200
 
 # Twitch Config
 TWITCH_CLIENT_ID = os.getenv('TWITCH_CLIENT_ID')
@@ -22,6 +27,44 @@ TWITCH_CLIENT_SECRET = os.getenv('TWITCH_CLIENT_SECRET')
 TWITCH_EVENTSUB_SECRET = os.getenv('TWITCH_EVENTSUB_SECRET', 'supersecret')
 TWITCH_CALLBACK_URL = os.getenv('TWITCH_CALLBACK_URL')
 TWITCH_STREAMER_REDIRECT_URI = os.getenv('TWITCH_STREAMER_REDIRECT_URI')
+# Shared Helix HTTP client
+TWITCH_HTTP_POOL_SIZE = 20
+TWITCH_HTTP_TIMEOUT = 10
+TWITCH_HTTP_KEEPALIVE = 60
+TWITCH_DNS_CACHE_TTL = 300
+# Retries for a request rejected with 429 (after waiting for Ratelimit-Reset)
+TWITCH_RATE_LIMIT_RETRIES = 2
+# Refresh the app token this many seconds before it expires
+TWITCH_TOKEN_REFRESH_MARGIN = 600
+TWITCH_TOKEN_RETRY_DELAY = 30
+# Concurrent Helix batches (100 ids each) during the username sync
+TWITCH_SYNC_CONCURRENCY = 4
+# Streamer (user) OAuth tokens
+STREAMER_TOKEN_REFRESH_MARGIN = 900
+STREAMER_TOKEN_CHECK_INTERVAL = 300
+# Fernet key for the encrypted local token cache; the cache is disabled when unset
+STREAMER_TOKEN_CACHE_KEY = os.getenv('STREAMER_TOKEN_CACHE_KEY')
+STREAMER_TOKEN_CACHE_PATH = os.getenv('STREAMER_TOKEN_CACHE_PATH', 'streamer_tokens.enc')
+# Twitch ban fan-out across guilds
+TWITCH_BAN_CONCURRENCY = 10
+TWITCH_BAN_RATE = 20
+# Durable ban job queue (local SQLite journal)
+BAN_JOB_DB_PATH = os.getenv("BAN_JOB_DB_PATH", "ban_jobs.sqlite3")
+BAN_JOB_WORKERS = 2
+BAN_JOB_MAX_ATTEMPTS = 5
+# Retry delay doubles from this many seconds
+BAN_JOB_RETRY_BASE = 5
+BAN_JOB_POLL_INTERVAL = 1
+# Keep finished jobs this long so redelivered webhooks are recognised
+BAN_JOB_RETENTION = 86400
+# Webhooks are answered 503 (and retried by Twitch) once this many ban jobs are waiting
+BAN_JOB_MAX_PENDING = 5000
+# Work handed from the webhook thread to the bot loop but not yet finished
+INGRESS_MAX_PENDING = 1000
+# EventSub webhooks older than this (seconds) are rejected as possible replays
+EVENTSUB_MAX_MESSAGE_AGE = 600
+# Recently acknowledged EventSub message ids, for dropping redeliveries without a journal write
+EVENTSUB_REPLAY_CACHE_SIZE = 10000
 
 # Default Settings
 DEFAULT_BAD_WORDS = []
@@ -29,12 +72,37 @@ DEFAULT_BANNED_LINKS = ["discord.gg"]
 DEFAULT_CAPS_THRESHOLD = 0.7
 DEFAULT_SPAM_WINDOW = 5
 DEFAULT_SPAM_THRESHOLD = 5
+# Largest spam_threshold a guild can use; higher stored values are clamped to it
+MAX_SPAM_THRESHOLD = 100
+# Spam tracking memory bounds; each key keeps enough events to reach the largest threshold
+SPAM_TRACKER_MAX_KEYS = 50000
+SPAM_TRACKER_MAX_EVENTS = MAX_SPAM_THRESHOLD
+SPAM_TRACKER_IDLE_SECONDS = 300
+# Only match bad words as whole words ("ass" won't hit "class")
+BAD_WORDS_WHOLE_WORD = os.getenv("BAD_WORDS_WHOLE_WORD", "false").lower() == "true"
 LOG_CHANNEL_ID = None
 
 # Anti-Raid Settings
 DEFAULT_ACCOUNT_AGE_DAYS = 7
 DEFAULT_JOIN_THRESHOLD = 5
 DEFAULT_JOIN_WINDOW = 30
+# Joins kept per guild for burst detection (thresholds above this are clamped)
+RAID_JOIN_LOG_SIZE = 1000
+RAID_TRACKER_MAX_GUILDS = 10000
+# Log a warning once joins reach this fraction of the threshold
+RAID_SUSPECT_RATIO = 0.5
+RAID_LOCKDOWN_SLOWMODE = 30
+# Quiet seconds (below threshold) before an automatic lockdown is lifted
+RAID_COOLDOWN_SECONDS = 300
+RAID_STATE_CHECK_INTERVAL = 10
+ACCOUNT_AGE_TIMEOUT_SECONDS = 300
+RAID_MODE_TIMEOUT_SECONDS = 600
+# Join timeouts are collected for this many seconds, then applied as one batch
+JOIN_TIMEOUT_BATCH_INTERVAL = 2
+JOIN_TIMEOUT_CONCURRENCY = 5
+JOIN_TIMEOUT_RATE = 5
+# Batches up to this size list each member in the log; larger ones only log a summary
+JOIN_TIMEOUT_LOG_MENTIONS = 10
 
 # Auto-slowmode Settings
 DEFAULT_TIME_CONFIGS = {
@@ -44,4 +112,43 @@ DEFAULT_TIME_CONFIGS = {
     0: 0
 }
 DEFAULT_CHECK_FREQUENCY = 30
-SLOWMODE_EDIT_DELAY = 0.6
\ No newline at end of file
+# Message-rate smoothing half-life, as a fraction of the guild's check_frequency
+SLOWMODE_EWMA_HALFLIFE_RATIO = 0.5
+# Only step slowmode down once traffic is this far below the current level's threshold
+SLOWMODE_HYSTERESIS = 0.25
+# Minimum seconds between evaluations when a burst pulls one forward
+SLOWMODE_MIN_EVAL_INTERVAL = 5
+
+# Bulk channel edits (lockdown, anti-raid, auto-slowmode)
+CHANNEL_EDIT_CONCURRENCY = 8
+CHANNEL_EDIT_RATE = 10
+CHANNEL_EDIT_PROGRESS_INTERVAL = 2
+
+# Guild Settings Cache
+GUILD_SETTINGS_TTL = 60
+
+# Supabase PostgREST client (async data access layer)
+DB_HTTP_POOL_SIZE = 20
+DB_HTTP_TIMEOUT = 10
+DB_HTTP_KEEPALIVE = 60
+# Retries for transport errors, 429s and 5xx; delay doubles from DB_RETRY_BASE seconds
+DB_RETRIES = 3
+DB_RETRY_BASE = 0.5
+
+# Local SQLite replica of the read-heavy Supabase tables
+REPLICA_DB_PATH = os.getenv("REPLICA_DB_PATH", "replica.sqlite3")
+# Pull rows changed since the updated_at watermark this often
+REPLICA_SYNC_INTERVAL = 60
+# Full resync, which also drops rows deleted outside the bot
+REPLICA_RECONCILE_INTERVAL = 3600
+# Tables without an updated_at column can't sync incrementally; full-sync them this often instead
+REPLICA_FALLBACK_SYNC_INTERVAL = 1800
+
+# Write-behind queue for Supabase mutations (local SQLite journal)
+WRITE_BEHIND_DB_PATH = os.getenv("WRITE_BEHIND_DB_PATH", "write_behind.sqlite3")
+WRITE_BEHIND_FLUSH_INTERVAL = 2
+# Flush early once this many rows are waiting
+WRITE_BEHIND_MAX_BATCH = 200
+# Failed rows retry after WRITE_BEHIND_RETRY_BASE seconds, doubling, and are parked after this many attempts
+WRITE_BEHIND_MAX_ATTEMPTS = 8
+WRITE_BEHIND_RETRY_BASE = 5
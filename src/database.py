@@ -1,6 +1,11 @@
+"""Shared Supabase helpers: row conversion, caches, TWITCH_INDEX and music storage.
+
+Every table query lives in async_database; this module only keeps what both
+sides need and the supabase-py client for Storage, which PostgREST doesn't cover.
+"""
 import os
 import json
-import time
+import threading
 from dotenv import load_dotenv
 from supabase import create_client, Client, ClientOptions
 import config
@@ -19,7 +24,6 @@ else:
 
 TIMEZONES_CACHE = None
 BIRTHDAYS_CACHE = None
-GUILD_SETTINGS_CACHE: dict[str, tuple[float, dict]] = {}
 
 def format_supabase_error(e: Exception) -> str:
     err_str = str(e)
@@ -27,55 +31,31 @@ def format_supabase_error(e: Exception) -> str:
         return "Supabase API returned an HTML error page (likely a 502 Bad Gateway or Cloudflare block)."
     return err_str
 
-def init_db():
-    try:
-        supabase.table("guild_settings").select("guild_id").limit(1).execute()
-        print("Connected to Supabase successfully.")
-    except Exception as e:
-        print(f"Error connecting to Supabase: {format_supabase_error(e)}")
-
 def ensure_users_has_twitch_id():
     # Legacy migration function 
     pass
 
-def get_guild_settings(guild_id: int) -> dict:
-    global GUILD_SETTINGS_CACHE
-    gid_str = str(guild_id)
-    now = time.time()
-    if gid_str in GUILD_SETTINGS_CACHE:
-        cached_time, cached_data = GUILD_SETTINGS_CACHE[gid_str]
-        if now - cached_time < 60:
-            return cached_data
-
-    try:
-        response = supabase.table("guild_settings").select("*").eq("guild_id", gid_str).execute()
-        data = response.data
-    except Exception as e:
-        print(f"Error fetching guild settings: {format_supabase_error(e)}")
-        data = []
-
-    if not data:
-        default_settings = {
-            "autoslow_enabled": True,
-            "check_frequency": config.DEFAULT_CHECK_FREQUENCY,
-            "time_configs": config.DEFAULT_TIME_CONFIGS.copy(),
-            "blacklisted_channels": [],
-            "moderation_enabled": True,
-            "bad_words": config.DEFAULT_BAD_WORDS.copy(),
-            "banned_links": config.DEFAULT_BANNED_LINKS.copy(),
-            "caps_threshold": config.DEFAULT_CAPS_THRESHOLD,
-            "spam_window": config.DEFAULT_SPAM_WINDOW,
-            "spam_threshold": config.DEFAULT_SPAM_THRESHOLD,
-            "antiraid_enabled": False,
-            "join_threshold": config.DEFAULT_JOIN_THRESHOLD,
-            "join_window": config.DEFAULT_JOIN_WINDOW,
-            "min_account_age_days": config.DEFAULT_ACCOUNT_AGE_DAYS
-        }
-        GUILD_SETTINGS_CACHE[gid_str] = (now, default_settings)
-        return default_settings
-
-    row = data[0]
+def default_guild_settings() -> dict:
+    """Settings used for guilds that have no row in guild_settings yet."""
+    return {
+        "autoslow_enabled": True,
+        "check_frequency": config.DEFAULT_CHECK_FREQUENCY,
+        "time_configs": config.DEFAULT_TIME_CONFIGS.copy(),
+        "blacklisted_channels": [],
+        "moderation_enabled": True,
+        "bad_words": config.DEFAULT_BAD_WORDS.copy(),
+        "banned_links": config.DEFAULT_BANNED_LINKS.copy(),
+        "caps_threshold": config.DEFAULT_CAPS_THRESHOLD,
+        "spam_window": config.DEFAULT_SPAM_WINDOW,
+        "spam_threshold": config.DEFAULT_SPAM_THRESHOLD,
+        "antiraid_enabled": False,
+        "join_threshold": config.DEFAULT_JOIN_THRESHOLD,
+        "join_window": config.DEFAULT_JOIN_WINDOW,
+        "min_account_age_days": config.DEFAULT_ACCOUNT_AGE_DAYS
+    }
 
+def parse_guild_settings_row(row: dict) -> dict:
+    """Convert a raw guild_settings row into the settings dict used by the cogs."""
     def _parse(j, default):
         try:
             if isinstance(j, (dict, list)):
@@ -84,7 +64,13 @@ def get_guild_settings(guild_id: int) -> dict:
         except Exception:
             return default
 
-    parsed_settings = {
+    spam_threshold = int(row.get("spam_threshold") or config.DEFAULT_SPAM_THRESHOLD)
+    if spam_threshold > config.MAX_SPAM_THRESHOLD:
+        print(f"⚠️ spam_threshold {spam_threshold} for guild {row.get('guild_id')} is above "
+              f"{config.MAX_SPAM_THRESHOLD}; using {config.MAX_SPAM_THRESHOLD}")
+        spam_threshold = config.MAX_SPAM_THRESHOLD
+
+    return {
         "autoslow_enabled": bool(row.get("autoslow_enabled", 1)),
         "check_frequency": int(row.get("check_frequency") or config.DEFAULT_CHECK_FREQUENCY),
         "time_configs": _parse(row.get("time_configs"), config.DEFAULT_TIME_CONFIGS.copy()),
@@ -94,19 +80,17 @@ def get_guild_settings(guild_id: int) -> dict:
         "banned_links": _parse(row.get("banned_links"), config.DEFAULT_BANNED_LINKS.copy()),
         "caps_threshold": float(row.get("caps_threshold") or config.DEFAULT_CAPS_THRESHOLD),
         "spam_window": int(row.get("spam_window") or config.DEFAULT_SPAM_WINDOW),
-        "spam_threshold": int(row.get("spam_threshold") or config.DEFAULT_SPAM_THRESHOLD),
+        "spam_threshold": spam_threshold,
         "antiraid_enabled": bool(row.get("antiraid_enabled", 0)),
         "join_threshold": int(row.get("join_threshold") or config.DEFAULT_JOIN_THRESHOLD),
         "join_window": int(row.get("join_window") or config.DEFAULT_JOIN_WINDOW),
         "min_account_age_days": int(row.get("min_account_age_days") or config.DEFAULT_ACCOUNT_AGE_DAYS)
     }
-    GUILD_SETTINGS_CACHE[gid_str] = (now, parsed_settings)
-    return parsed_settings
 
-def save_guild_settings(guild_id: int, settings: dict):
-    global GUILD_SETTINGS_CACHE
+def build_guild_settings_row(guild_id: int, settings: dict) -> dict:
+    """Convert a settings dict into the guild_settings row that gets stored."""
     gid_str = str(guild_id)
-    data_to_insert = {
+    return {
         "guild_id": gid_str,
         "autoslow_enabled": 1 if settings.get("autoslow_enabled", True) else 0,
         "check_frequency": int(settings.get("check_frequency", config.DEFAULT_CHECK_FREQUENCY)),
@@ -117,553 +101,137 @@ def save_guild_settings(guild_id: int, settings: dict):
         "banned_links": json.dumps(settings.get("banned_links", config.DEFAULT_BANNED_LINKS)),
         "caps_threshold": float(settings.get("caps_threshold", config.DEFAULT_CAPS_THRESHOLD)),
         "spam_window": int(settings.get("spam_window", config.DEFAULT_SPAM_WINDOW)),
-        "spam_threshold": int(settings.get("spam_threshold", config.DEFAULT_SPAM_THRESHOLD)),
+        "spam_threshold": min(int(settings.get("spam_threshold", config.DEFAULT_SPAM_THRESHOLD)), config.MAX_SPAM_THRESHOLD),
         "antiraid_enabled": 1 if settings.get("antiraid_enabled", False) else 0,
         "join_threshold": int(settings.get("join_threshold", config.DEFAULT_JOIN_THRESHOLD)),
         "join_window": int(settings.get("join_window", config.DEFAULT_JOIN_WINDOW)),
         "min_account_age_days": int(settings.get("min_account_age_days", config.DEFAULT_ACCOUNT_AGE_DAYS))
     }
 
-    try:
-        supabase.table("guild_settings").upsert(data_to_insert).execute()
-        GUILD_SETTINGS_CACHE[gid_str] = (time.time(), settings.copy())
-    except Exception as e:
-        print(f"Error saving guild settings: {format_supabase_error(e)}")
-
-
-# ==================== Users Table Functions ====================
-
-def get_user(discord_id: str) -> dict | None:
-    """Get a user by Discord ID."""
-    try:
-        response = supabase.table("users").select("*").eq("discord_id", str(discord_id)).execute()
-        if response.data:
-            return response.data[0]
-        return None
-    except Exception as e:
-        print(f"Error fetching user: {format_supabase_error(e)}")
-        return None
-
-def get_all_users_with_twitch() -> list:
-    """Get all users with linked Twitch accounts."""
-    try:
-        response = supabase.table("users").select("discord_id, twitch_username").not_.is_("twitch_username", "null").execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching Twitch users: {format_supabase_error(e)}")
-        return []
-
-def get_all_users_with_youtube() -> list:
-    """Get all users with linked YouTube accounts."""
-    try:
-        response = supabase.table("users").select("discord_id, youtube_channel").not_.is_("youtube_channel", "null").execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching YouTube users: {format_supabase_error(e)}")
-        return []
-
-def get_all_twitch_ids() -> list:
-    """Get all distinct twitch_ids from users table."""
-    try:
-        response = supabase.table("users").select("twitch_id").not_.is_("twitch_id", "null").execute()
-        return [r["twitch_id"] for r in response.data if r.get("twitch_id")]
-    except Exception as e:
-        print(f"Error fetching Twitch IDs: {format_supabase_error(e)}")
-        return []
-
-def upsert_user(discord_id: str, twitch_username: str = None, youtube_channel: str = None, twitch_id: str = None):
-    """Insert or update a user."""
-    try:
-        # First get existing data to preserve fields not being updated
-        existing = get_user(discord_id)
-        
-        data = {"discord_id": str(discord_id)}
-        if twitch_username is not None:
-            data["twitch_username"] = twitch_username
-        elif existing and existing.get("twitch_username"):
-            data["twitch_username"] = existing["twitch_username"]
-            
-        if youtube_channel is not None:
-            data["youtube_channel"] = youtube_channel
-        elif existing and existing.get("youtube_channel"):
-            data["youtube_channel"] = existing["youtube_channel"]
-            
-        if twitch_id is not None:
-            data["twitch_id"] = twitch_id
-        elif existing and existing.get("twitch_id"):
-            data["twitch_id"] = existing["twitch_id"]
-        
-        supabase.table("users").upsert(data).execute()
-    except Exception as e:
-        print(f"Error upserting user: {format_supabase_error(e)}")
-
-def update_user_twitch(discord_id: str, twitch_username: str = None, twitch_id: str = None):
-    """Update Twitch fields for a user."""
-    try:
-        data = {}
-        if twitch_username is not None:
-            data["twitch_username"] = twitch_username
-        if twitch_id is not None:
-            data["twitch_id"] = twitch_id
-        
-        if data:
-            supabase.table("users").update(data).eq("discord_id", str(discord_id)).execute()
-    except Exception as e:
-        print(f"Error updating user Twitch: {format_supabase_error(e)}")
-
-def update_twitch_username_by_id(twitch_id: str, twitch_username: str):
-    """Update twitch_username for all users with a given twitch_id."""
-    try:
-        supabase.table("users").update({"twitch_username": twitch_username}).eq("twitch_id", twitch_id).execute()
-        return True
-    except Exception as e:
-        print(f"Error updating Twitch username by ID: {format_supabase_error(e)}")
-        return False
 
-def clear_user_twitch(discord_id: str):
-    """Clear Twitch fields for a user."""
-    try:
-        supabase.table("users").update({"twitch_username": None, "twitch_id": None}).eq("discord_id", str(discord_id)).execute()
-    except Exception as e:
-        print(f"Error clearing user Twitch: {format_supabase_error(e)}")
-
-def clear_user_youtube(discord_id: str):
-    """Clear YouTube field for a user."""
-    try:
-        supabase.table("users").update({"youtube_channel": None}).eq("discord_id", str(discord_id)).execute()
-    except Exception as e:
-        print(f"Error clearing user YouTube: {format_supabase_error(e)}")
-
-
-# ==================== Streamers Table Functions ====================
-
-def get_streamer(discord_id: str) -> dict | None:
-    """Get a streamer by Discord ID."""
-    try:
-        response = supabase.table("streamers").select("*").eq("discord_id", str(discord_id)).execute()
-        if response.data:
-            return response.data[0]
-        return None
-    except Exception as e:
-        print(f"Error fetching streamer: {format_supabase_error(e)}")
-        return None
-
-def get_streamer_by_twitch_id(twitch_id: str) -> dict | None:
-    """Get a streamer by Twitch ID."""
-    try:
-        response = supabase.table("streamers").select("*").eq("twitch_id", str(twitch_id)).execute()
-        if response.data:
-            return response.data[0]
-        return None
-    except Exception as e:
-        print(f"Error fetching streamer by Twitch ID: {format_supabase_error(e)}")
-        return None
-
-def upsert_streamer(discord_id: str, twitch_id: str, twitch_username: str, access_token: str, refresh_token: str):
-    """Insert or update a streamer."""
-    try:
-        data = {
-            "discord_id": str(discord_id),
-            "twitch_id": twitch_id,
-            "twitch_username": twitch_username,
-            "access_token": access_token,
-            "refresh_token": refresh_token
-        }
-        supabase.table("streamers").upsert(data).execute()
-    except Exception as e:
-        print(f"Error upserting streamer: {format_supabase_error(e)}")
-
-def delete_streamer_by_twitch_id(twitch_id: str) -> str | None:
-    """Delete a streamer by Twitch ID and return the discord_id."""
-    try:
-        response = supabase.table("streamers").select("discord_id").eq("twitch_id", str(twitch_id)).execute()
-        if response.data:
-            discord_id = response.data[0]["discord_id"]
-            supabase.table("streamers").delete().eq("twitch_id", str(twitch_id)).execute()
-            return discord_id
-        return None
-    except Exception as e:
-        print(f"Error deleting streamer by Twitch ID: {format_supabase_error(e)}")
-        return None
-
-def delete_streamer_by_discord_id(discord_id: str) -> str | None:
-    """Delete a streamer by Discord ID and return the twitch_id."""
-    try:
-        response = supabase.table("streamers").select("twitch_id").eq("discord_id", str(discord_id)).execute()
-        if response.data:
-            twitch_id = response.data[0]["twitch_id"]
-            supabase.table("streamers").delete().eq("discord_id", str(discord_id)).execute()
-            return twitch_id
-        return None
-    except Exception as e:
-        print(f"Error deleting streamer by Discord ID: {format_supabase_error(e)}")
-        return None
-
-def update_streamer_tokens(discord_id: str, access_token: str, refresh_token: str):
-    """Update OAuth tokens for a streamer."""
-    try:
-        supabase.table("streamers").update({
-            "access_token": access_token,
-            "refresh_token": refresh_token
-        }).eq("discord_id", str(discord_id)).execute()
-    except Exception as e:
-        print(f"Error updating streamer tokens: {format_supabase_error(e)}")
-
-
-# ==================== Discord ID Lookup Functions ====================
-
-def get_discord_ids_by_twitch(twitch_identifier: str) -> list:
-    """Get Discord IDs from Twitch identifier (ID or username)."""
-    if not twitch_identifier:
-        return []
-    
-    discord_ids = []
-    
-    try:
-        # Check if it's a numeric ID
-        if str(twitch_identifier).isdigit():
-            # Search by twitch_id in streamers
-            response = supabase.table("streamers").select("discord_id").eq("twitch_id", str(twitch_identifier)).execute()
-            discord_ids.extend([r["discord_id"] for r in response.data if r.get("discord_id")])
-            
-            # Search by twitch_id in users
-            response = supabase.table("users").select("discord_id").eq("twitch_id", str(twitch_identifier)).execute()
-            discord_ids.extend([r["discord_id"] for r in response.data if r.get("discord_id")])
-        
-        # If no results, search by username (case-insensitive)
-        if not discord_ids:
-            # Search in users
-            response = supabase.table("users").select("discord_id").ilike("twitch_username", str(twitch_identifier)).execute()
-            discord_ids.extend([r["discord_id"] for r in response.data if r.get("discord_id")])
-            
-            # Search in streamers
-            response = supabase.table("streamers").select("discord_id").ilike("twitch_username", str(twitch_identifier)).execute()
-            discord_ids.extend([r["discord_id"] for r in response.data if r.get("discord_id")])
-    
-    except Exception as e:
-        print(f"Error looking up Discord IDs by Twitch: {format_supabase_error(e)}")
-    
-    # Return unique IDs
-    seen = set()
-    return [d for d in discord_ids if not (d in seen or seen.add(d))]
-
-
-# ==================== User Timezone Functions ====================
-
-def get_user_timezone(discord_id: str) -> dict | None:
-    """Get a user's timezone info."""
-    global TIMEZONES_CACHE
-    if TIMEZONES_CACHE is not None:
-        for tz in TIMEZONES_CACHE:
-            if tz.get("discord_id") == str(discord_id):
-                return tz
-        return None  # Cache is full table, so if not found, it doesn't exist
-        
-    try:
-        response = supabase.table("user_timezones").select("*").eq("discord_id", str(discord_id)).execute()
-        if response.data:
-            return response.data[0]
-        return None
-    except Exception as e:
-        print(f"Error fetching user timezone: {format_supabase_error(e)}")
-        return None
-
-def set_user_timezone(discord_id: str, city: str, country: str, timezone: str, country_code: str = None):
-    """Set a user's timezone."""
-    global TIMEZONES_CACHE
-    try:
-        data = {
-            "discord_id": str(discord_id),
-            "city": city,
-            "country": country,
-            "timezone": timezone,
-            "country_code": country_code or ""
-        }
-        supabase.table("user_timezones").upsert(data).execute()
-        TIMEZONES_CACHE = None
-        return True
-    except Exception as e:
-        print(f"Error setting user timezone: {format_supabase_error(e)}")
-        return False
-
-def remove_user_timezone(discord_id: str) -> bool:
-    """Remove a user's timezone."""
-    global TIMEZONES_CACHE
-    try:
-        supabase.table("user_timezones").delete().eq("discord_id", str(discord_id)).execute()
-        TIMEZONES_CACHE = None
-        return True
-    except Exception as e:
-        print(f"Error removing user timezone: {format_supabase_error(e)}")
-        return False
-
-def get_all_user_timezones() -> list:
-    """Get all users with timezones set."""
-    global TIMEZONES_CACHE
-    if TIMEZONES_CACHE is not None:
-        return TIMEZONES_CACHE
-    try:
-        response = supabase.table("user_timezones").select("*").execute()
-        TIMEZONES_CACHE = response.data or []
-        return TIMEZONES_CACHE
-    except Exception as e:
-        print(f"Error fetching all user timezones: {format_supabase_error(e)}")
-        return []
-
-
-# ==================== Timezone Embed Tracking Functions ====================
-
-def save_timezone_embed(guild_id: str, channel_id: str, message_id: str, page: int = 0):
-    """Save a timezone embed for tracking (persists across restarts)."""
-    try:
-        data = {
-            "guild_id": str(guild_id),
-            "channel_id": str(channel_id),
-            "message_id": str(message_id),
-            "page": page
-        }
-        supabase.table("timezone_embeds").upsert(data).execute()
-        return True
-    except Exception as e:
-        print(f"Error saving timezone embed: {format_supabase_error(e)}")
-        return False
-
-def update_timezone_embed_page(guild_id: str, page: int):
-    """Update the page number for a timezone embed."""
-    try:
-        supabase.table("timezone_embeds").update({"page": page}).eq("guild_id", str(guild_id)).execute()
-        return True
-    except Exception as e:
-        print(f"Error updating timezone embed page: {format_supabase_error(e)}")
-        return False
-
-def remove_timezone_embed(guild_id: str):
-    """Remove a timezone embed from tracking."""
-    try:
-        supabase.table("timezone_embeds").delete().eq("guild_id", str(guild_id)).execute()
-        return True
-    except Exception as e:
-        print(f"Error removing timezone embed: {format_supabase_error(e)}")
-        return False
-
-def get_all_timezone_embeds() -> list:
-    """Get all tracked timezone embeds."""
-    try:
-        response = supabase.table("timezone_embeds").select("*").execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching timezone embeds: {format_supabase_error(e)}")
-        return []
-
-
-# ==================== User Birthday Functions ====================
-
-def get_user_birthday(discord_id: str) -> dict | None:
-    """Get a user's birthday info."""
-    global BIRTHDAYS_CACHE
-    if BIRTHDAYS_CACHE is not None:
-        for bday in BIRTHDAYS_CACHE:
-            if bday.get("discord_id") == str(discord_id):
-                return bday
-        return None
-        
-    try:
-        response = supabase.table("user_birthdays").select("*").eq("discord_id", str(discord_id)).execute()
-        if response.data:
-            return response.data[0]
-        return None
-    except Exception as e:
-        print(f"Error fetching user birthday: {format_supabase_error(e)}")
-        return None
-
-def set_user_birthday(discord_id: str, display_name: str, day: int, month: int) -> bool:
-    """Set a user's birthday."""
-    global BIRTHDAYS_CACHE
-    try:
-        data = {
-            "discord_id": str(discord_id),
-            "display_name": display_name,
-            "day": day,
-            "month": month
-        }
-        supabase.table("user_birthdays").upsert(data).execute()
-        BIRTHDAYS_CACHE = None
-        return True
-    except Exception as e:
-        print(f"Error setting user birthday: {format_supabase_error(e)}")
-        return False
-
-def remove_user_birthday(discord_id: str) -> bool:
-    """Remove a user's birthday."""
-    global BIRTHDAYS_CACHE
-    try:
-        supabase.table("user_birthdays").delete().eq("discord_id", str(discord_id)).execute()
-        BIRTHDAYS_CACHE = None
-        return True
-    except Exception as e:
-        print(f"Error removing user birthday: {format_supabase_error(e)}")
-        return False
-
-def get_all_user_birthdays() -> list:
-    """Get all users with birthdays set."""
-    global BIRTHDAYS_CACHE
-    if BIRTHDAYS_CACHE is not None:
-        return BIRTHDAYS_CACHE
-    try:
-        response = supabase.table("user_birthdays").select("*").execute()
-        BIRTHDAYS_CACHE = response.data or []
-        return BIRTHDAYS_CACHE
-    except Exception as e:
-        print(f"Error fetching all user birthdays: {format_supabase_error(e)}")
-        return []
-
-
-# ==================== Birthday Embed Tracking Functions ====================
-
-def save_birthday_embed(guild_id: str, channel_id: str, message_id: str, page: int = 0):
-    """Save a birthday embed for tracking (persists across restarts)."""
-    try:
-        data = {
-            "guild_id": str(guild_id),
-            "channel_id": str(channel_id),
-            "message_id": str(message_id),
-            "page": page
-        }
-        supabase.table("birthday_embeds").upsert(data).execute()
-        return True
-    except Exception as e:
-        print(f"Error saving birthday embed: {format_supabase_error(e)}")
-        return False
-
-def update_birthday_embed_page(guild_id: str, page: int):
-    """Update the page number for a birthday embed."""
-    try:
-        supabase.table("birthday_embeds").update({"page": page}).eq("guild_id", str(guild_id)).execute()
-        return True
-    except Exception as e:
-        print(f"Error updating birthday embed page: {format_supabase_error(e)}")
-        return False
-
-def remove_birthday_embed(guild_id: str):
-    """Remove a birthday embed from tracking."""
-    try:
-        supabase.table("birthday_embeds").delete().eq("guild_id", str(guild_id)).execute()
-        return True
-    except Exception as e:
-        print(f"Error removing birthday embed: {format_supabase_error(e)}")
-        return False
-
-def get_all_birthday_embeds() -> list:
-    """Get all tracked birthday embeds."""
-    try:
-        response = supabase.table("birthday_embeds").select("*").execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching birthday embeds: {format_supabase_error(e)}")
-        return []
-
-
-# ==================== Birthday Announcement Functions ====================
-
-def update_birthday_announced(discord_id: str, year: int) -> bool:
-    """Mark a user's birthday as announced for the given year."""
-    global BIRTHDAYS_CACHE
-    try:
-        supabase.table("user_birthdays").update({"last_announced_year": year}).eq("discord_id", str(discord_id)).execute()
-        BIRTHDAYS_CACHE = None
-        return True
-    except Exception as e:
-        print(f"Error updating birthday announced: {format_supabase_error(e)}")
-        return False
-
-def get_birthdays_to_announce(day: int, month: int, year: int) -> list:
-    """Get birthdays that match day/month and haven't been announced this year."""
-    try:
-        response = supabase.table("user_birthdays").select("*").eq("day", day).eq("month", month).neq("last_announced_year", year).execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching birthdays to announce: {format_supabase_error(e)}")
-        return []
-
-
-# ==================== Birthday Channel Functions ====================
-
-def get_birthday_channel(guild_id: str) -> str | None:
-    """Get the birthday announcement channel for a guild."""
-    try:
-        response = supabase.table("birthday_channels").select("channel_id").eq("guild_id", str(guild_id)).execute()
-        if response.data:
-            return response.data[0]["channel_id"]
-        return None
-    except Exception as e:
-        print(f"Error fetching birthday channel: {format_supabase_error(e)}")
-        return None
-
-def set_birthday_channel(guild_id: str, channel_id: str) -> bool:
-    """Set the birthday announcement channel for a guild."""
-    try:
-        data = {
-            "guild_id": str(guild_id),
-            "channel_id": str(channel_id)
-        }
-        supabase.table("birthday_channels").upsert(data).execute()
-        return True
-    except Exception as e:
-        print(f"Error setting birthday channel: {format_supabase_error(e)}")
-        return False
-
-def remove_birthday_channel(guild_id: str) -> bool:
-    """Remove the birthday announcement channel for a guild."""
-    try:
-        supabase.table("birthday_channels").delete().eq("guild_id", str(guild_id)).execute()
-        return True
-    except Exception as e:
-        print(f"Error removing birthday channel: {format_supabase_error(e)}")
-        return False
+# ==================== Twitch Identity Index ====================
+
+class TwitchIdentityIndex:
+    """In-memory twitch_id / lowercased login -> discord_ids index.
+
+    Covers the `users` and `streamers` tables so a ban lookup is a dict hit
+    instead of up to four Supabase queries. Entries are keyed by
+    (table, discord_id) so the reverse mapping can drop a stale identity when
+    a row changes. The write helpers in async_database keep it current; it
+    is shared between the event loop and worker threads, hence the lock.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._by_owner = {}   # (table, discord_id) -> (twitch_id, login)
+        self._by_id = {}      # twitch_id -> {(table, discord_id)}
+        self._by_login = {}   # lowercased login -> {(table, discord_id)}
+        self.hits = 0
+        self.misses = 0
+
+    def _unlink(self, owner) -> None:
+        old = self._by_owner.pop(owner, None)
+        if old is None:
+            return
+        for key, index in zip(old, (self._by_id, self._by_login)):
+            if key and key in index:
+                index[key].discard(owner)
+                if not index[key]:
+                    del index[key]
+
+    def _link(self, owner, twitch_id, login) -> None:
+        twitch_id = str(twitch_id) if twitch_id else None
+        login = login.lower() if login else None
+        if not twitch_id and not login:
+            return
+        self._by_owner[owner] = (twitch_id, login)
+        if twitch_id:
+            self._by_id.setdefault(twitch_id, set()).add(owner)
+        if login:
+            self._by_login.setdefault(login, set()).add(owner)
+
+    def set(self, table: str, discord_id, twitch_id=None, login=None) -> None:
+        owner = (table, str(discord_id))
+        with self._lock:
+            self._unlink(owner)
+            self._link(owner, twitch_id, login)
+
+    def update(self, table: str, discord_id, twitch_id=None, login=None) -> None:
+        """Change only the given fields of an existing entry."""
+        owner = (table, str(discord_id))
+        with self._lock:
+            old_id, old_login = self._by_owner.get(owner, (None, None))
+            self._unlink(owner)
+            self._link(owner, twitch_id if twitch_id is not None else old_id, login if login is not None else old_login)
+
+    def remove(self, table: str, discord_id) -> None:
+        with self._lock:
+            self._unlink((table, str(discord_id)))
+
+    def rename(self, twitch_id, login: str) -> None:
+        """Point every `users` row with this twitch_id at a new login."""
+        with self._lock:
+            owners = [o for o in self._by_id.get(str(twitch_id), ()) if o[0] == "users"]
+            for owner in owners:
+                self._unlink(owner)
+                self._link(owner, twitch_id, login)
+
+    def load(self, rows_by_table: dict) -> None:
+        with self._lock:
+            self._by_owner.clear()
+            self._by_id.clear()
+            self._by_login.clear()
+            for table, rows in rows_by_table.items():
+                for r in rows:
+                    if r.get("discord_id"):
+                        self._link((table, str(r["discord_id"])), r.get("twitch_id"), r.get("twitch_username"))
+            self.loaded = True
+
+    def lookup(self, twitch_identifier: str) -> list | None:
+        """Discord IDs for a twitch_id or login, or None when the index can't answer."""
+        if not self.loaded:
+            return None
+        ident = str(twitch_identifier)
+        with self._lock:
+            owners = self._by_id.get(ident) if ident.isdigit() else None
+            if not owners:
+                owners = self._by_login.get(ident.lower())
+            if not owners:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Streamers first, matching the order of the database lookup
+            return list(dict.fromkeys(d for _, d in sorted(owners, key=lambda o: o[0] != "streamers")))
+
+    def stats(self) -> dict:
+        return {"identities": len(self._by_owner), "hits": self.hits, "misses": self.misses}
+
+TWITCH_INDEX = TwitchIdentityIndex()
 
 
 # ==================== Music Library & Cloud Storage Functions ====================
 
-def get_all_music_tracks() -> list:
-    """Fetch all music tracks from Supabase database."""
-    try:
-        response = supabase.table("music_tracks").select("*").execute()
-        return response.data or []
-    except Exception as e:
-        print(f"Error fetching music tracks from Supabase: {format_supabase_error(e)}")
-        return []
-
-def upsert_music_track(track: dict) -> bool:
-    """Insert or update a music track record in Supabase."""
-    try:
-        data = {
-            "track_id": str(track["id"]),
-            "title": track.get("title", ""),
-            "filename": track.get("filename", ""),
-            "uploader_id": str(track.get("uploader_id", "")),
-            "uploader_name": track.get("uploader_name", ""),
-            "uploaded_at": int(track.get("uploaded_at", 0)),
-            "duration": int(track.get("duration", 0)),
-            "is_private": bool(track.get("is_private", False))
-        }
-        supabase.table("music_tracks").upsert(data).execute()
-        return True
-    except Exception as e:
-        print(f"Error saving music track to Supabase database: {format_supabase_error(e)}")
-        return False
+def build_music_track_row(track: dict) -> dict:
+    """Convert a local music index entry into the music_tracks row that gets stored."""
+    return {
+        "track_id": str(track["id"]),
+        "title": track.get("title", ""),
+        "filename": track.get("filename", ""),
+        "uploader_id": str(track.get("uploader_id", "")),
+        "uploader_name": track.get("uploader_name", ""),
+        "uploaded_at": int(track.get("uploaded_at", 0)),
+        "duration": int(track.get("duration", 0)),
+        "is_private": bool(track.get("is_private", False))
+    }
 
-def delete_music_track(track_id: str, filename: str = None) -> bool:
-    """Delete a music track from Supabase database and storage bucket."""
+def remove_music_storage(filename: str) -> bool:
+    """Remove an audio file from the 'music' Supabase Storage bucket."""
     try:
-        supabase.table("music_tracks").delete().eq("track_id", str(track_id)).execute()
-        if filename:
-            try:
-                supabase.storage.from_("music").remove([filename])
-            except Exception as se:
-                print(f"Error removing file {filename} from Supabase storage: {format_supabase_error(se)}")
+        supabase.storage.from_("music").remove([filename])
         return True
     except Exception as e:
-        print(f"Error deleting music track from Supabase: {format_supabase_error(e)}")
+        print(f"Error removing file {filename} from Supabase storage: {format_supabase_error(e)}")
         return False
 
 def upload_music_storage(filename: str, filepath: str) -> bool:
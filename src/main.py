@@ -7,9 +7,17 @@ import os
 import asyncio
 import threading
 from dotenv import load_dotenv
-from database import init_db, ensure_users_has_twitch_id, get_guild_settings, save_guild_settings
-from utils.twitch_utils import ban_queue, ban_worker
-from web_server import start_flask_server
+from database import ensure_users_has_twitch_id
+from async_database import init_db, load_twitch_index, close_db
+from utils.settings_store import settings_store
+from utils.twitch_utils import handle_twitch_ban
+from utils.ban_jobs import ban_jobs
+from utils.ingress import ingress
+from utils.helix import helix
+from utils.streamer_tokens import streamer_tokens
+from utils.replica import replica
+from utils.write_behind import write_behind
+from web_server import start_web_server, stop_web_server
 import config
 
 # Load environment variables
@@ -66,15 +74,9 @@ async def on_ready():
         logging.info(f"Synced {len(synced)} slash command(s)")
     except Exception as e:
         logging.error(f"Failed to sync slash commands: {e}")
-    
-    # global ban_queue
-    # if ban_queue is not None:
-    #     try:
-    #         if not getattr(bot, "ban_worker_task", None) or bot.ban_worker_task.done():
-    #             bot.ban_worker_task = bot.loop.create_task(ban_worker(bot))
-    #             logging.info("Started ban_worker task.")
-    #     except Exception as e:
-    #         logging.exception("Failed to start ban_worker: %s", e)
+
+    # Load every guild's settings in one query so message handlers start warm
+    await settings_store.warm(guild.id for guild in bot.guilds)
 
 class HelpDropdown(discord.ui.Select):
     def __init__(self, current_category: str = "overview"):
@@ -307,11 +309,39 @@ async def hello(ctx):
 
 async def main():
     async with bot:
-        init_db()
+        # Webhook threads hand work to this loop; capture it before they start
+        ingress.bind()
+        await init_db()
         ensure_users_has_twitch_id()
-        start_flask_server()
+        # Bind the port before the replica sync, so Twitch's webhook checks don't wait on it;
+        # until a table has synced, its reads go to Supabase
+        await start_web_server()
+        # Serve reads from local disk; if Supabase is down, the last synced copy is used.
+        # The write journal opens first so rows still queued there aren't overwritten by the sync.
+        await asyncio.to_thread(write_behind.open)
+        await asyncio.to_thread(replica.open)
+        await replica.sync()
+        replica.start()
+        write_behind.start()
+        await load_twitch_index()
+        # OAuth callbacks and ban handling use Helix even while the Twitch cog is unloaded
+        if config.TWITCH_CLIENT_ID and config.TWITCH_CLIENT_SECRET:
+            helix.tokens.start()
+            streamer_tokens.start()
+        # /twitch/events journals ban jobs; the workers run them once the bot is ready
+        ban_jobs.start(bot, handle_twitch_ban)
         await load_extensions()
-        await bot.start(config.TOKEN)
+        try:
+            await bot.start(config.TOKEN)
+        finally:
+            await stop_web_server()
+            ban_jobs.stop()
+            helix.tokens.stop()
+            streamer_tokens.stop()
+            replica.stop()
+            await write_behind.stop()
+            await helix.close()
+            await close_db()
 
 if __name__ == "__main__":
     if not config.TOKEN:
@@ -0,0 +1,99 @@
+import unicodedata
+from collections import deque
+
+
+def normalize_text(text: str) -> str:
+    """Fold compatibility forms and case so lookalike spellings match the same pattern."""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class AhoCorasickMatcher:
+    """Multi-pattern substring matcher with a cost linear in the text length.
+
+    Unlike a large regex alternation, scanning a message does not depend on
+    how many patterns there are, so guilds with tens of thousands of filter
+    entries cost the same per message as guilds with ten.
+
+    With `whole_word=True` a pattern only matches when it is not surrounded by
+    letters, digits or underscores (like `\\b...\\b` in a regex). Patterns and
+    text are normalised with NFKC + casefold unless `normalize=False`.
+    """
+
+    __slots__ = ("whole_word", "normalize", "pattern_count", "_goto", "_fail", "_out")
+
+    def __init__(self, patterns, whole_word: bool = False, normalize: bool = True):
+        self.whole_word = whole_word
+        self.normalize = normalize
+        self._goto = [{}]
+        self._fail = [0]
+        # For each state, lengths of the patterns that end there (including via fail links)
+        self._out = [()]
+
+        prepared = {normalize_text(p) if normalize else p for p in patterns if p}
+        prepared.discard("")
+        self.pattern_count = len(prepared)
+        for pattern in prepared:
+            self._insert(pattern)
+        self._build_fail_links()
+
+    def __bool__(self) -> bool:
+        return self.pattern_count > 0
+
+    def _insert(self, pattern: str) -> None:
+        goto = self._goto
+        state = 0
+        for ch in pattern:
+            nxt = goto[state].get(ch)
+            if nxt is None:
+                nxt = len(goto)
+                goto[state][ch] = nxt
+                goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (len(pattern),)
+
+    def _build_fail_links(self) -> None:
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+    def search(self, text: str) -> bool:
+        """Return True if any pattern occurs in text."""
+        if not self.pattern_count or not text:
+            return False
+        if self.normalize:
+            text = normalize_text(text)
+        goto, fail, out = self._goto, self._fail, self._out
+        whole_word = self.whole_word
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt or 0
+            if out[state]:
+                if not whole_word:
+                    return True
+                if i + 1 < len(text) and _is_word_char(text[i + 1]):
+                    continue
+                for length in out[state]:
+                    start = i - length + 1
+                    if start == 0 or not _is_word_char(text[start - 1]):
+                        return True
+        return False
@@ -0,0 +1,235 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+import config
+from utils import metrics
+from utils.helpers import log_to_channel
+from utils.ingress import ingress
+
+# enqueue() results
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+BUSY = "busy"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ban_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem_key TEXT NOT NULL UNIQUE,
+    identifier TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ban_jobs_due ON ban_jobs (status, next_attempt_at);
+"""
+
+
+class BanJob:
+    __slots__ = ("id", "identifier", "received_at", "attempts")
+
+    def __init__(self, job_id: int, identifier: str, received_at: float, attempts: int):
+        self.id = job_id
+        self.identifier = identifier
+        self.received_at = received_at
+        self.attempts = attempts
+
+
+class BanJobQueue:
+    """Durable Twitch ban job queue backed by a local SQLite journal.
+
+    A job is written to disk before the webhook is acknowledged and only
+    leaves the journal once a worker has finished it, so a restart replays
+    anything that was queued or in flight (at-least-once delivery). Each job
+    carries an idempotency key (the EventSub message id); Twitch redelivering
+    the same message is dropped at insert time. Failed jobs are retried with
+    exponential backoff and dead-lettered after BAN_JOB_MAX_ATTEMPTS.
+
+    The journal is small and local, so calls are short; the async helpers
+    still run them in a worker thread to keep the event loop free.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._workers = []
+        self._wakeup = None
+        self.enqueued = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            # Jobs that were running when the process died go back to the queue
+            conn.execute("UPDATE ban_jobs SET status = ? WHERE status = ?", (PENDING, RUNNING))
+            self._conn = conn
+        return self._conn
+
+    def enqueue(self, identifier: str, idem_key: str = None, received_at: float = None) -> str:
+        """Durably queue a ban from any thread.
+
+        Returns QUEUED, DUPLICATE if the idempotency key was already seen, or
+        BUSY when BAN_JOB_MAX_PENDING jobs are already waiting.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            (waiting,) = db.execute(
+                "SELECT COUNT(*) FROM ban_jobs WHERE status IN (?, ?)", (PENDING, RUNNING)
+            ).fetchone()
+            if waiting >= config.BAN_JOB_MAX_PENDING:
+                self.rejected += 1
+                return BUSY
+            cur = db.execute(
+                "INSERT OR IGNORE INTO ban_jobs (idem_key, identifier, received_at, status, next_attempt_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (idem_key or uuid.uuid4().hex, identifier, received_at or now, PENDING, now, now),
+            )
+        if cur.rowcount == 0:
+            self.duplicates += 1
+            return DUPLICATE
+        self.enqueued += 1
+        self._notify()
+        return QUEUED
+
+    def _claim(self) -> BanJob | None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT id, identifier, received_at, attempts FROM ban_jobs "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT 1",
+                (PENDING, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE ban_jobs SET status = ?, updated_at = ? WHERE id = ?", (RUNNING, now, row[0]))
+        return BanJob(*row)
+
+    def _complete(self, job: BanJob) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE ban_jobs SET status = ?, updated_at = ? WHERE id = ?", (DONE, now, job.id))
+            # Finished jobs are only kept long enough to catch Twitch redeliveries
+            db.execute("DELETE FROM ban_jobs WHERE status = ? AND updated_at < ?", (DONE, now - config.BAN_JOB_RETENTION))
+        self.completed += 1
+
+    def _fail(self, job: BanJob, error: str) -> bool:
+        """Record a failed attempt; returns True if the job was dead-lettered."""
+        now = time.time()
+        attempts = job.attempts + 1
+        dead = attempts >= config.BAN_JOB_MAX_ATTEMPTS
+        delay = config.BAN_JOB_RETRY_BASE * 2 ** (attempts - 1)
+        with self._lock:
+            self._db().execute(
+                "UPDATE ban_jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (DEAD if dead else PENDING, attempts, now + delay, error[:500], now, job.id),
+            )
+        if dead:
+            self.dead_lettered += 1
+        else:
+            self.retried += 1
+        return dead
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db().execute("SELECT status, COUNT(*) FROM ban_jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def dead_letters(self, limit: int = 20) -> list:
+        with self._lock:
+            return self._db().execute(
+                "SELECT id, identifier, attempts, last_error FROM ban_jobs WHERE status = ? ORDER BY id DESC LIMIT ?",
+                (DEAD, limit),
+            ).fetchall()
+
+    def stats(self) -> dict:
+        return {
+            **self.counts(),
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    def _notify(self) -> None:
+        """Wake an idle worker; from another thread the wakeup goes through the ingress."""
+        wakeup = self._wakeup
+        if wakeup is None:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            ingress.submit(wakeup.set)
+            return
+        wakeup.set()
+
+    def start(self, bot, handler) -> None:
+        """Start BAN_JOB_WORKERS workers calling `await handler(bot, identifier, received_at)`.
+
+        The handler returns False (or raises) when the job should be retried.
+        """
+        if any(not w.done() for w in self._workers):
+            return
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._workers = [loop.create_task(self._worker(bot, handler)) for _ in range(config.BAN_JOB_WORKERS)]
+
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    async def _worker(self, bot, handler) -> None:
+        while True:
+            # Clear before claiming, so an enqueue that lands during the claim still wakes us
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=config.BAN_JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                ok = await handler(bot, job.identifier, job.received_at)
+                error = None if ok is not False else "some guild bans failed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+            if error is None:
+                await asyncio.to_thread(self._complete, job)
+                continue
+            if await asyncio.to_thread(self._fail, job, error):
+                msg = f"Ban job {job.id} for Twitch {job.identifier} dead-lettered after {job.attempts + 1} attempts: {error}"
+                print(f"❌ {msg}")
+                await log_to_channel(bot, f"[ban] {msg}")
+            else:
+                print(f"⚠️ Ban job {job.id} for Twitch {job.identifier} failed ({error}); will retry")
+
+
+ban_jobs = BanJobQueue(config.BAN_JOB_DB_PATH)
+metrics.register("ban_jobs", ban_jobs.stats)
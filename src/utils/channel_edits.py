@@ -0,0 +1,85 @@
+import asyncio
+import time
+import discord
+import config
+from utils.ratelimit import AsyncTokenBucket
+
+
+class SlowmodeEditResult:
+    """Outcome of one `ChannelEditExecutor.set_slowmode` run."""
+
+    def __init__(self):
+        self.changed = []   # (channel, delay)
+        self.skipped = []   # (channel, delay) already at the requested delay
+        self.failed = []    # (channel, delay, exception)
+        self.elapsed = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.changed) + len(self.skipped) + len(self.failed)
+
+
+class ChannelEditExecutor:
+    """Shared executor for bulk slowmode edits (lockdowns, anti-raid, auto-slowmode).
+
+    Channel PATCHes are rate limited per channel, so edits to different
+    channels run concurrently. discord.py already waits on each route's
+    rate-limit bucket and retries 429s; this executor adds a global pace
+    (`rate` edits/second) so a 200-channel sweep doesn't trip the global
+    limit, and backs off the whole pool when a 429 still gets through.
+    """
+
+    def __init__(self, concurrency: int, rate: float):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bucket = AsyncTokenBucket(rate, burst=concurrency)
+
+    async def set_slowmode(self, edits, reason: str, on_progress=None) -> SlowmodeEditResult:
+        """Apply `slowmode_delay` for each (channel, delay) pair.
+
+        Channels already at the requested delay are skipped without an API call.
+        `on_progress(done, total)` is awaited at most every couple of seconds
+        and once when everything has finished.
+        """
+        result = SlowmodeEditResult()
+        pending = []
+        for channel, delay in edits:
+            if channel.slowmode_delay == delay:
+                result.skipped.append((channel, delay))
+            else:
+                pending.append((channel, delay))
+
+        total = len(edits)
+        started = time.monotonic()
+        last_report = started
+
+        async def edit(channel, delay):
+            nonlocal last_report
+            async with self._semaphore:
+                await self._bucket.acquire()
+                try:
+                    await channel.edit(slowmode_delay=delay, reason=reason)
+                    result.changed.append((channel, delay))
+                except discord.HTTPException as e:
+                    if e.status == 429:
+                        self._bucket.pause(getattr(e, "retry_after", 1.0) or 1.0)
+                    result.failed.append((channel, delay, e))
+                except Exception as e:
+                    result.failed.append((channel, delay, e))
+            if on_progress and time.monotonic() - last_report >= config.CHANNEL_EDIT_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                try:
+                    await on_progress(result.total, total)
+                except Exception:
+                    pass
+
+        await asyncio.gather(*(edit(channel, delay) for channel, delay in pending))
+        result.elapsed = time.monotonic() - started
+        if on_progress:
+            try:
+                await on_progress(result.total, total)
+            except Exception:
+                pass
+        return result
+
+
+channel_edits = ChannelEditExecutor(config.CHANNEL_EDIT_CONCURRENCY, config.CHANNEL_EDIT_RATE)
@@ -0,0 +1,218 @@
+import asyncio
+import time
+import aiohttp
+import config
+from utils import metrics
+
+HELIX_BASE_URL = "https://api.twitch.tv/helix"
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+
+
+class AppTokenManager:
+    """Twitch app access token, refreshed in the background ahead of expiry.
+
+    Concurrent callers that find no valid token share a single request to
+    the token endpoint (single-flight). Once `start` is called a background
+    task renews the token `TWITCH_TOKEN_REFRESH_MARGIN` seconds before it
+    expires, so request paths normally never wait on a token round trip.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.token = None
+        self.expires_at = 0.0
+        self._inflight = None
+        self._refresher = None
+        self.refreshes = 0
+        self.refreshes_coalesced = 0
+
+    def _valid(self) -> bool:
+        return bool(self.token) and time.time() < self.expires_at - 30
+
+    async def get(self) -> str:
+        if self._valid():
+            return self.token
+        return await asyncio.shield(self._schedule_refresh())
+
+    async def force_refresh(self, rejected_token: str) -> str:
+        """Replace a token the API rejected; callers holding the same stale token share one refresh."""
+        if self.token != rejected_token and self._valid():
+            return self.token
+        self.expires_at = 0.0
+        return await asyncio.shield(self._schedule_refresh())
+
+    def start(self) -> None:
+        """Start the background refresher (idempotent)."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    def _schedule_refresh(self) -> asyncio.Task:
+        if self._inflight is not None:
+            self.refreshes_coalesced += 1
+            return self._inflight
+        task = asyncio.get_running_loop().create_task(self._fetch())
+        self._inflight = task
+        task.add_done_callback(self._clear_inflight)
+        return task
+
+    def _clear_inflight(self, task) -> None:
+        if self._inflight is task:
+            self._inflight = None
+
+    async def _fetch(self) -> str:
+        self.refreshes += 1
+        async with self._client.session().post(
+            TOKEN_URL,
+            params={
+                "client_id": config.TWITCH_CLIENT_ID,
+                "client_secret": config.TWITCH_CLIENT_SECRET,
+                "grant_type": "client_credentials",
+            },
+        ) as resp:
+            data = await resp.json()
+
+        if not data or "access_token" not in data:
+            raise RuntimeError(f"Failed to fetch twitch app token: {data}")
+
+        self.token = data["access_token"]
+        self.expires_at = time.time() + int(data.get("expires_in", 3600))
+        return self.token
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            remaining = self.expires_at - time.time()
+            if remaining > config.TWITCH_TOKEN_REFRESH_MARGIN:
+                await asyncio.sleep(remaining - config.TWITCH_TOKEN_REFRESH_MARGIN)
+                continue
+            try:
+                await asyncio.shield(self._schedule_refresh())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Twitch app token refresh failed: {e}")
+                await asyncio.sleep(config.TWITCH_TOKEN_RETRY_DELAY)
+
+
+class HelixClient:
+    """Bot-scoped HTTP client for the Twitch Helix API.
+
+    All Twitch calls share one aiohttp session, so connections stay alive
+    between requests and DNS lookups are cached instead of paying a fresh
+    TLS handshake per call. Helix reports its points budget in the
+    `Ratelimit-Remaining`/`Ratelimit-Reset` headers; when the budget runs out
+    requests wait for the reset instead of collecting 429s, and a 429 that
+    still gets through is retried after the reset.
+    """
+
+    def __init__(self):
+        self._session = None
+        self.tokens = AppTokenManager(self)
+        self._remaining = None
+        self._reset_at = 0.0
+        self.requests_sent = 0
+        self.rate_limit_waits = 0
+
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use inside the running loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.TWITCH_HTTP_POOL_SIZE,
+                ttl_dns_cache=config.TWITCH_DNS_CACHE_TTL,
+                keepalive_timeout=config.TWITCH_HTTP_KEEPALIVE,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=config.TWITCH_HTTP_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        self.tokens.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def app_token(self) -> str:
+        """Current Twitch app access token."""
+        return await self.tokens.get()
+
+    async def _wait_for_budget(self) -> None:
+        while self._remaining is not None and self._remaining <= 0:
+            delay = self._reset_at - time.time()
+            if delay <= 0:
+                self._remaining = None
+                break
+            self.rate_limit_waits += 1
+            await asyncio.sleep(min(delay, 60))
+        if self._remaining is not None:
+            # Claim a point now so concurrent callers don't all spend the last one
+            self._remaining -= 1
+
+    def _record_rate_limit(self, headers) -> None:
+        remaining = headers.get("Ratelimit-Remaining")
+        reset = headers.get("Ratelimit-Reset")
+        try:
+            if remaining is not None:
+                self._remaining = int(remaining)
+            if reset is not None:
+                self._reset_at = float(reset)
+        except ValueError:
+            pass
+
+    async def request(self, method: str, path: str, *, params=None, json=None):
+        """Call a Helix endpoint with the app token; returns (status, parsed JSON or None).
+
+        A 401 is retried once with a freshly issued token.
+        """
+        token = await self.tokens.get()
+        auth_retried = False
+        rate_limit_retries = 0
+        while True:
+            await self._wait_for_budget()
+            headers = {"Client-ID": config.TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
+            self.requests_sent += 1
+            async with self.session().request(
+                method, f"{HELIX_BASE_URL}/{path}", params=params, json=json, headers=headers
+            ) as resp:
+                self._record_rate_limit(resp.headers)
+                if resp.status == 401 and not auth_retried:
+                    auth_retried = True
+                    token = await self.tokens.force_refresh(token)
+                    continue
+                if resp.status == 429 and rate_limit_retries < config.TWITCH_RATE_LIMIT_RETRIES:
+                    rate_limit_retries += 1
+                    self._remaining = 0
+                    self._reset_at = max(self._reset_at, time.time() + 1)
+                    continue
+                try:
+                    data = await resp.json(content_type=None)
+                except Exception:
+                    data = None
+                return resp.status, data
+
+    async def get(self, path: str, params=None):
+        return await self.request("GET", path, params=params)
+
+    async def post(self, path: str, json=None):
+        return await self.request("POST", path, json=json)
+
+    async def delete(self, path: str, params=None):
+        return await self.request("DELETE", path, params=params)
+
+    def stats(self) -> dict:
+        return {
+            "requests_sent": self.requests_sent,
+            "rate_limit_waits": self.rate_limit_waits,
+            "ratelimit_remaining": self._remaining,
+            "token_refreshes": self.tokens.refreshes,
+            "token_refreshes_coalesced": self.tokens.refreshes_coalesced,
+        }
+
+
+helix = HelixClient()
+metrics.register("helix", helix.stats)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import config
+from utils import metrics
+
+
+class LoopIngress:
+    """Hands work from other threads (webhook journal writes, worker threads) to the bot's event loop.
+
+    `bind` captures the running loop once at startup; `submit` may then be
+    called from any thread and schedules the callback on that loop with
+    `call_soon_threadsafe`. A callback that returns a coroutine is run as a
+    task. Work counts as pending until it has finished on the loop, and
+    `submit` refuses new work past `max_pending` so callers can push back
+    (e.g. answer a webhook with 503 and let the sender retry) instead of
+    piling up an unbounded backlog.
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._loop = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.peak_pending = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, callback, *args) -> bool:
+        """Schedule `callback(*args)` on the bot loop; False if unbound, closed or full."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            self.rejected += 1
+            return False
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            self.peak_pending = max(self.peak_pending, self._pending)
+            self.submitted += 1
+        try:
+            loop.call_soon_threadsafe(self._dispatch, callback, args)
+        except RuntimeError:
+            # Loop closed between the check and the call
+            self._done()
+            self.rejected += 1
+            return False
+        return True
+
+    def _done(self, task=None) -> None:
+        with self._lock:
+            self._pending -= 1
+        if task is not None and not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Ingress task failed: {task.exception()}")
+
+    def _dispatch(self, callback, args) -> None:
+        try:
+            result = callback(*args)
+        except Exception as e:
+            print(f"⚠️ Ingress callback {getattr(callback, '__name__', callback)} failed: {e}")
+            self._done()
+            return
+        if asyncio.iscoroutine(result):
+            task = self._loop.create_task(result)
+            task.add_done_callback(self._done)
+        else:
+            self._done()
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "peak_pending": self.peak_pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+
+ingress = LoopIngress(config.INGRESS_MAX_PENDING)
+metrics.register("ingress", ingress.stats)
@@ -0,0 +1,15 @@
+_SOURCES = {}
+
+def register(name: str, source):
+    """Register a zero-argument callable that returns a dict of metric values."""
+    _SOURCES[name] = source
+
+def snapshot() -> dict:
+    """Collect the current values of every registered source."""
+    values = {}
+    for name, source in _SOURCES.items():
+        try:
+            values[name] = source()
+        except Exception as e:
+            values[name] = {"error": str(e)}
+    return values
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import random
+import httpx
+import config
+from utils import metrics
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# Transient statuses worth retrying; 520-527 are Cloudflare's origin errors
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504, 520, 521, 522, 523, 524, 525, 526, 527}
+
+
+class PostgrestError(Exception):
+    """A PostgREST request that failed, or kept failing after its retries."""
+
+    def __init__(self, status: int | None, message: str):
+        super().__init__(f"{status}: {message}" if status else message)
+        self.status = status
+
+
+def eq(value) -> str:
+    return f"eq.{value}"
+
+
+def neq(value) -> str:
+    return f"neq.{value}"
+
+
+def gt(value) -> str:
+    return f"gt.{value}"
+
+
+def ilike(value) -> str:
+    return f"ilike.{value}"
+
+
+def in_(values) -> str:
+    quoted = ",".join('"{}"'.format(str(v).replace('"', '\\"')) for v in values)
+    return f"in.({quoted})"
+
+
+def is_null() -> str:
+    return "is.null"
+
+
+def not_null() -> str:
+    return "not.is.null"
+
+
+class PostgrestClient:
+    """Async client for Supabase's PostgREST endpoint (`/rest/v1`).
+
+    Every query shares one httpx connection pool, negotiating HTTP/2 when
+    `h2` is installed so concurrent queries are multiplexed over a single
+    connection. Each call takes an optional timeout; transport errors,
+    429s and 5xx/Cloudflare pages are retried with jittered exponential
+    backoff, so a brief Supabase hiccup doesn't surface as a failed command.
+
+    Filters are a dict of column -> PostgREST operator string, built with
+    the helpers above (`{"discord_id": eq(uid)}`); a list value applies
+    several filters to the same column.
+    """
+
+    def __init__(self, url: str | None, key: str | None):
+        self.url = f"{url.rstrip('/')}/rest/v1" if url else None
+        self.key = key
+        self._client = None
+        self.requests_sent = 0
+        self.retries = 0
+        self.failures = 0
+        self.http2_responses = 0
+
+    def client(self) -> httpx.AsyncClient:
+        """The shared client, created on first use inside the running loop."""
+        if self._client is None or self._client.is_closed:
+            if not self.url or not self.key:
+                raise PostgrestError(None, "SUPABASE_URL / SUPABASE_KEY are not configured")
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                http2=h2 is not None,
+                headers={
+                    "apikey": self.key,
+                    "Authorization": f"Bearer {self.key}",
+                    "User-Agent": "DiscordBot/1.0 (Render Service; +https://render.com)",
+                },
+                limits=httpx.Limits(
+                    max_connections=config.DB_HTTP_POOL_SIZE,
+                    max_keepalive_connections=config.DB_HTTP_POOL_SIZE,
+                    keepalive_expiry=config.DB_HTTP_KEEPALIVE,
+                ),
+                timeout=config.DB_HTTP_TIMEOUT,
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def _params(filters) -> list:
+        params = []
+        for column, ops in (filters or {}).items():
+            for op in ops if isinstance(ops, (list, tuple)) else (ops,):
+                params.append((column, op))
+        return params
+
+    @staticmethod
+    def _backoff(attempt: int, resp) -> float:
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 30.0)
+            except ValueError:
+                pass
+        return config.DB_RETRY_BASE * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def request(self, method: str, table: str, *, params=None, json=None,
+                      prefer: str | None = None, timeout: float | None = None):
+        """Send one request and return the decoded JSON body ([] when empty).
+
+        Raises PostgrestError for non-2xx responses once retries are exhausted.
+        """
+        headers = {"Prefer": prefer} if prefer else None
+        kwargs = {"params": params, "json": json, "headers": headers}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        attempt = 0
+        while True:
+            self.requests_sent += 1
+            resp = None
+            try:
+                resp = await self.client().request(method, f"/{table}", **kwargs)
+            except httpx.TransportError as e:
+                error = PostgrestError(None, f"{type(e).__name__}: {e}")
+            else:
+                if resp.http_version == "HTTP/2":
+                    self.http2_responses += 1
+                if resp.is_success:
+                    if not resp.content:
+                        return []
+                    try:
+                        return resp.json()
+                    except ValueError:
+                        return []
+                error = PostgrestError(resp.status_code, self._error_message(resp))
+                if resp.status_code not in RETRY_STATUSES:
+                    self.failures += 1
+                    raise error
+
+            if attempt >= config.DB_RETRIES:
+                self.failures += 1
+                raise error
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, resp))
+            attempt += 1
+
+    @staticmethod
+    def _error_message(resp) -> str:
+        try:
+            body = resp.json()
+            if isinstance(body, dict):
+                return body.get("message") or str(body)
+        except ValueError:
+            pass
+        # HTML bodies are kept so format_supabase_error can recognise them
+        return resp.text[:500]
+
+    async def select(self, table: str, columns: str = "*", filters=None, *, order: str | None = None,
+                     limit: int | None = None, offset: int | None = None, timeout: float | None = None) -> list:
+        params = [("select", columns)] + self._params(filters)
+        if order:
+            params.append(("order", order))
+        if limit is not None:
+            params.append(("limit", str(limit)))
+        if offset:
+            params.append(("offset", str(offset)))
+        return await self.request("GET", table, params=params, timeout=timeout)
+
+    async def select_all(self, table: str, columns: str = "*", filters=None, *, order: str,
+                         page: int = 1000, timeout: float | None = None) -> list:
+        """Page through every matching row, since PostgREST caps each response."""
+        rows = []
+        while True:
+            batch = await self.select(table, columns, filters, order=order, limit=page,
+                                      offset=len(rows), timeout=timeout)
+            rows.extend(batch)
+            if len(batch) < page:
+                return rows
+
+    async def upsert(self, table: str, rows, *, on_conflict: str | None = None, returning: str | None = None,
+                     timeout: float | None = None) -> list:
+        """Insert or merge rows; with `returning`, the stored rows' columns are returned."""
+        params = [("on_conflict", on_conflict)] if on_conflict else []
+        if returning:
+            params.append(("select", returning))
+        return await self.request("POST", table, params=params, json=rows,
+                                  prefer="resolution=merge-duplicates," + self._return(returning),
+                                  timeout=timeout)
+
+    async def update(self, table: str, values: dict, filters, *, returning: str | None = None,
+                     timeout: float | None = None) -> list:
+        """Update matching rows; with `returning`, the updated rows' columns are returned."""
+        params = self._params(filters)
+        if returning:
+            params.append(("select", returning))
+        return await self.request("PATCH", table, params=params, json=values,
+                                  prefer=self._return(returning), timeout=timeout)
+
+    async def delete(self, table: str, filters, *, returning: str | None = None,
+                     timeout: float | None = None) -> list:
+        """Delete matching rows; with `returning`, the deleted rows' columns are returned."""
+        params = self._params(filters)
+        if returning:
+            params.append(("select", returning))
+        return await self.request("DELETE", table, params=params, prefer=self._return(returning),
+                                  timeout=timeout)
+
+    @staticmethod
+    def _return(returning: str | None) -> str:
+        return "return=representation" if returning else "return=minimal"
+
+    def stats(self) -> dict:
+        return {
+            "requests_sent": self.requests_sent,
+            "retries": self.retries,
+            "failures": self.failures,
+            "http2_responses": self.http2_responses,
+            "http2_available": h2 is not None,
+        }
+
+
+postgrest = PostgrestClient(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+metrics.register("postgrest", postgrest.stats)
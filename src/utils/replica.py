@@ -0,0 +1,355 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import config
+from utils import metrics
+from utils.postgrest import postgrest, gt, in_, PostgrestError
+
+# Replicated Supabase tables and their primary key columns
+REPLICATED_TABLES = {
+    "users": "discord_id",
+    "user_timezones": "discord_id",
+    "user_birthdays": "discord_id",
+    "guild_settings": "guild_id",
+    "music_tracks": "track_id",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replica_rows (
+    tbl TEXT NOT NULL,
+    pk TEXT NOT NULL,
+    data TEXT,
+    written_at REAL NOT NULL,
+    PRIMARY KEY (tbl, pk)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS replica_sync (
+    tbl TEXT PRIMARY KEY,
+    watermark TEXT,
+    synced_at REAL NOT NULL,
+    reconciled_at REAL NOT NULL
+);
+"""
+
+_UPSERT_SYNCED = (
+    "INSERT INTO replica_rows (tbl, pk, data, written_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (tbl, pk) DO UPDATE SET data = excluded.data, written_at = excluded.written_at "
+    "WHERE replica_rows.written_at <= excluded.written_at"
+)
+
+
+class LocalReplica:
+    """Embedded SQLite copy of the read-heavy Supabase tables.
+
+    Once a table has completed its first sync, every read for it is served
+    from local disk, including while Supabase is down; the synced state is
+    kept across restarts. A background task pulls rows changed since the
+    last `updated_at` watermark every REPLICA_SYNC_INTERVAL seconds, and a
+    full pass every REPLICA_RECONCILE_INTERVAL drops rows deleted outside
+    the bot. The column and its trigger are described in the README; a
+    table without them is only synced in full, every
+    REPLICA_FALLBACK_SYNC_INTERVAL seconds.
+
+    Mutations made through async_database are written through as soon as
+    Supabase accepts them. Each row records when it was last written
+    locally, so a sync that started before a write-through never overwrites
+    it, and deletes leave a tombstone until a later sync confirms them.
+
+    Reads run inline on the event loop: a primary-key lookup in a local WAL
+    database takes microseconds and never waits on a writer. Writes go
+    through a separate connection in a worker thread.
+    """
+
+    def __init__(self, path: str, tables: dict):
+        self.path = path
+        self.tables = tables
+        self._reader = None
+        self._writer = None
+        self._lock = threading.Lock()
+        self._synced = {}   # table -> (watermark, reconciled_at)
+        self._has_updated_at = {}   # table -> whether Supabase has the column
+        self._task = None
+        self.on_change = None
+        # Set by the write-behind queue: pks whose newest data hasn't reached Supabase yet
+        self.pending_keys = None
+        self.reads = 0
+        self.syncs = 0
+        self.sync_failures = 0
+        self.rows_pulled = 0
+        self.last_sync = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write_db(self) -> sqlite3.Connection:
+        if self._writer is None:
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+            for table, watermark, reconciled_at in conn.execute(
+                "SELECT tbl, watermark, reconciled_at FROM replica_sync"
+            ):
+                self._synced[table] = (watermark, reconciled_at)
+            self._writer = conn
+        return self._writer
+
+    def _read_db(self) -> sqlite3.Connection:
+        if self._reader is None:
+            with self._lock:
+                self._write_db()
+            self._reader = self._connect()
+        return self._reader
+
+    def open(self) -> None:
+        """Create the schema and load sync state, so `ready` is accurate before the first read."""
+        self._read_db()
+
+    def ready(self, table: str) -> bool:
+        """True once `table` has been fully synced at least once."""
+        return table in self._synced
+
+    # ---- reads (event loop) ----
+
+    def get(self, table: str, pk) -> dict | None:
+        self.reads += 1
+        row = self._read_db().execute(
+            "SELECT data FROM replica_rows WHERE tbl = ? AND pk = ?", (table, str(pk))
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def get_many(self, table: str, pks) -> dict:
+        """Rows for the given primary keys, keyed by pk; missing keys are omitted."""
+        self.reads += 1
+        pks = [str(p) for p in pks]
+        found = {}
+        db = self._read_db()
+        for i in range(0, len(pks), 500):
+            chunk = pks[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for pk, data in db.execute(
+                f"SELECT pk, data FROM replica_rows WHERE tbl = ? AND pk IN ({marks}) AND data IS NOT NULL",
+                (table, *chunk),
+            ):
+                found[pk] = json.loads(data)
+        return found
+
+    def all(self, table: str) -> list:
+        self.reads += 1
+        return [
+            json.loads(data) for (data,) in self._read_db().execute(
+                "SELECT data FROM replica_rows WHERE tbl = ? AND data IS NOT NULL ORDER BY pk", (table,)
+            )
+        ]
+
+    # ---- write-through (worker thread) ----
+
+    def _merge(self, table: str, rows: list, existing_only: bool = False) -> None:
+        key = self.tables[table]
+        now = time.time()
+        with self._lock:
+            db = self._write_db()
+            db.execute("BEGIN")
+            try:
+                for row in rows:
+                    pk = str(row[key])
+                    current = db.execute(
+                        "SELECT data FROM replica_rows WHERE tbl = ? AND pk = ?", (table, pk)
+                    ).fetchone()
+                    if existing_only and not (current and current[0]):
+                        continue
+                    merged = {**json.loads(current[0]), **row} if current and current[0] else row
+                    db.execute(
+                        "INSERT OR REPLACE INTO replica_rows (tbl, pk, data, written_at) VALUES (?, ?, ?, ?)",
+                        (table, pk, json.dumps(merged), now),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _tombstone(self, table: str, pks: list) -> None:
+        now = time.time()
+        with self._lock:
+            self._write_db().executemany(
+                "INSERT OR REPLACE INTO replica_rows (tbl, pk, data, written_at) VALUES (?, ?, NULL, ?)",
+                [(table, str(pk), now) for pk in pks],
+            )
+
+    async def put(self, table: str, rows: list) -> None:
+        """Write rows Supabase just accepted; partial rows are merged into the local copy."""
+        if rows and table in self.tables:
+            await asyncio.to_thread(self._merge, table, rows)
+
+    async def patch(self, table: str, rows: list) -> None:
+        """Like `put`, but only for rows the replica already has, as a PATCH leaves missing rows missing."""
+        if rows and table in self.tables:
+            await asyncio.to_thread(self._merge, table, rows, True)
+
+    async def remove(self, table: str, pks: list) -> None:
+        if pks and table in self.tables:
+            await asyncio.to_thread(self._tombstone, table, pks)
+
+    def _replace(self, table: str, pks: list, rows: list, started: float) -> None:
+        key = self.tables[table]
+        with self._lock:
+            db = self._write_db()
+            db.execute("BEGIN")
+            try:
+                db.executemany(_UPSERT_SYNCED, [(table, str(r[key]), json.dumps(r), started) for r in rows])
+                found = {str(r[key]) for r in rows}
+                db.executemany(
+                    "DELETE FROM replica_rows WHERE tbl = ? AND pk = ? AND written_at < ?",
+                    [(table, pk, started) for pk in pks if pk not in found],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    async def resync(self, table: str, pks: list) -> None:
+        """Re-read specific rows from Supabase, e.g. after their queued writes were given up on."""
+        if not pks or table not in self.tables:
+            return
+        pks = [str(pk) for pk in pks]
+        started = time.time()
+        rows = []
+        for i in range(0, len(pks), 100):
+            rows += await postgrest.select(table, filters={self.tables[table]: in_(pks[i:i + 100])})
+        await asyncio.to_thread(self._replace, table, pks, rows, started)
+        if self.on_change is not None:
+            self.on_change(table)
+
+    # ---- sync ----
+
+    def _apply(self, table: str, rows: list, started: float, watermark: str | None, full: bool,
+               pending: frozenset) -> int:
+        key = self.tables[table]
+        with self._lock:
+            db = self._write_db()
+            db.execute("BEGIN")
+            try:
+                db.executemany(_UPSERT_SYNCED, [
+                    (table, str(r[key]), json.dumps(r), started) for r in rows if str(r[key]) not in pending
+                ])
+                if full:
+                    # Rows written locally after the fetch began are newer than it
+                    db.execute("CREATE TEMP TABLE IF NOT EXISTS replica_seen (pk TEXT PRIMARY KEY)")
+                    db.execute("DELETE FROM replica_seen")
+                    db.executemany("INSERT OR IGNORE INTO replica_seen VALUES (?)",
+                                   [(str(r[key]),) for r in rows] + [(pk,) for pk in pending])
+                    removed = db.execute(
+                        "DELETE FROM replica_rows WHERE tbl = ? AND written_at < ? "
+                        "AND pk NOT IN (SELECT pk FROM replica_seen)",
+                        (table, started),
+                    ).rowcount
+                else:
+                    removed = db.execute(
+                        "DELETE FROM replica_rows WHERE tbl = ? AND data IS NULL AND written_at < ?",
+                        (table, started),
+                    ).rowcount
+                reconciled_at = started if full else self._synced[table][1]
+                db.execute(
+                    "INSERT OR REPLACE INTO replica_sync (tbl, watermark, synced_at, reconciled_at) VALUES (?, ?, ?, ?)",
+                    (table, watermark, time.time(), reconciled_at),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._synced[table] = (watermark, reconciled_at)
+        return len(rows) + removed
+
+    def _pending(self, table: str) -> frozenset:
+        return self.pending_keys(table) if self.pending_keys is not None else frozenset()
+
+    async def _incremental(self, table: str) -> bool:
+        """Whether `table` has an `updated_at` column to sync incrementally by (checked once)."""
+        if table not in self._has_updated_at:
+            try:
+                await postgrest.select(table, "updated_at", limit=1)
+                self._has_updated_at[table] = True
+            except PostgrestError as e:
+                # PostgREST answers 400 for an unknown column
+                if e.status != 400:
+                    raise
+                self._has_updated_at[table] = False
+                print(f"⚠️ Replica: {table} has no updated_at column, falling back to a full sync "
+                      f"every {config.REPLICA_FALLBACK_SYNC_INTERVAL}s (see the README to add it)")
+        return self._has_updated_at[table]
+
+    async def sync_table(self, table: str) -> int:
+        """Pull changes for one table; returns how many local rows changed."""
+        await asyncio.to_thread(self.open)
+        started = time.time()
+        state = self._synced.get(table)
+        incremental = await self._incremental(table)
+        if not incremental and state is not None and started - state[1] < config.REPLICA_FALLBACK_SYNC_INTERVAL:
+            return 0
+        # Rows with queued writes keep their local data; check before and after
+        # the fetch so a write flushed mid-fetch isn't overwritten by older data.
+        pending = self._pending(table)
+        full = (not incremental or state is None or state[0] is None
+                or started - state[1] >= config.REPLICA_RECONCILE_INTERVAL)
+        if full:
+            rows = await postgrest.select_all(table, order=self.tables[table])
+        else:
+            rows = await postgrest.select_all(
+                table, filters={"updated_at": gt(state[0])}, order=f"updated_at,{self.tables[table]}"
+            )
+        stamps = [r["updated_at"] for r in rows if r.get("updated_at")]
+        # PostgREST renders timestamps in one ISO format, so they compare as strings
+        watermark = max(stamps, default=None if full else state[0])
+        pending |= self._pending(table)
+        changed = await asyncio.to_thread(self._apply, table, rows, started, watermark, full, pending)
+        self.rows_pulled += len(rows)
+        if changed and self.on_change is not None:
+            self.on_change(table)
+        return changed
+
+    async def sync(self) -> bool:
+        """Sync every replicated table; returns False if any of them failed."""
+        ok = True
+        for table in self.tables:
+            try:
+                await self.sync_table(table)
+            except Exception as e:
+                ok = False
+                self.sync_failures += 1
+                print(f"⚠️ Replica sync failed for {table}: {e}")
+        self.syncs += 1
+        if ok:
+            self.last_sync = time.time()
+        return ok
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(config.REPLICA_SYNC_INTERVAL)
+            await self.sync()
+
+    def start(self) -> None:
+        """Start the background sync (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._sync_loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready_tables": sorted(self._synced),
+            "full_sync_tables": sorted(t for t, has in self._has_updated_at.items() if not has),
+            "reads": self.reads,
+            "syncs": self.syncs,
+            "sync_failures": self.sync_failures,
+            "rows_pulled": self.rows_pulled,
+            "seconds_since_sync": round(time.time() - self.last_sync, 1) if self.last_sync else None,
+        }
+
+
+replica = LocalReplica(config.REPLICA_DB_PATH, REPLICATED_TABLES)
+metrics.register("replica", replica.stats)
@@ -0,0 +1,169 @@
+import asyncio
+import copy
+import itertools
+import time
+import database
+import async_database
+import config
+from utils import metrics
+
+
+class _CachedSettings:
+    __slots__ = ("settings", "fetched_at", "version", "derived")
+
+    def __init__(self, settings: dict, fetched_at: float, version: int):
+        self.settings = settings
+        self.fetched_at = fetched_at
+        self.version = version
+        # Objects computed from this exact settings version (compiled filters, ...)
+        self.derived = {}
+
+
+class GuildSettingsStore:
+    """Asyncio-native guild settings cache.
+
+    Reads are served from memory. Stale entries keep being served while a
+    background task refreshes them (stale-while-revalidate), and all Supabase
+    I/O runs in a worker thread so the event loop never waits on the network.
+
+    Every distinct settings value gets a version number. Data derived from the
+    settings (see `derive`) lives on the cached entry, so it is rebuilt only
+    when a save or a refresh actually changes the settings.
+    """
+
+    def __init__(self, ttl: float = config.GUILD_SETTINGS_TTL):
+        self.ttl = ttl
+        self._entries: dict[str, _CachedSettings] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._versions = itertools.count(1)
+        self._default_entry = _CachedSettings(database.default_guild_settings(), 0.0, 0)
+        self.fetches_issued = 0
+        self.fetches_coalesced = 0
+
+    def peek(self, guild_id: int) -> dict:
+        """Return a guild's settings without ever awaiting I/O.
+
+        Meant for gateway event handlers. Missing or stale entries trigger a
+        background refresh; a guild that has never been loaded gets the default
+        settings until that refresh lands. The returned dict is shared, so
+        callers must not mutate it.
+        """
+        return self._peek_entry(str(guild_id)).settings
+
+    def derive(self, guild_id: int, name: str, builder):
+        """Return `builder(settings)` for the guild's current settings version.
+
+        The result is cached on the settings entry and reused until the
+        settings change. Like `peek`, this never awaits I/O.
+        """
+        entry = self._peek_entry(str(guild_id))
+        value = entry.derived.get(name)
+        if value is None:
+            value = entry.derived[name] = builder(entry.settings)
+        return value
+
+    def version(self, guild_id: int) -> int:
+        """Version of the cached settings; 0 while only the defaults are known."""
+        entry = self._entries.get(str(guild_id))
+        return entry.version if entry else 0
+
+    async def get_guild_settings(self, guild_id: int) -> dict:
+        """Return a private copy of a guild's settings, safe to mutate and save.
+
+        Only a guild that has never been loaded waits for the database; stale
+        entries are returned immediately and refreshed in the background.
+        """
+        gid = str(guild_id)
+        entry = self._entries.get(gid)
+        if entry is None:
+            await asyncio.shield(self._schedule_refresh(gid))
+            entry = self._entries[gid]
+        elif time.monotonic() - entry.fetched_at >= self.ttl:
+            self._schedule_refresh(gid)
+        return copy.deepcopy(entry.settings)
+
+    async def save_guild_settings(self, guild_id: int, settings: dict) -> bool:
+        """Persist a guild's settings and update the cache once the write succeeds."""
+        gid = str(guild_id)
+        # Cache exactly what a later fetch will read back, so the next refresh
+        # compares equal and does not bump the version again.
+        row = database.build_guild_settings_row(gid, settings)
+        saved = await async_database.save_guild_settings(gid, settings)
+        if saved:
+            self._entries[gid] = _CachedSettings(database.parse_guild_settings_row(row), time.monotonic(), next(self._versions))
+        return saved
+
+    async def warm(self, guild_ids) -> None:
+        """Load settings for many guilds with a single query, e.g. on startup."""
+        ids = [str(g) for g in guild_ids]
+        started = time.monotonic()
+        rows = await async_database.fetch_guild_settings_bulk(ids)
+        if rows is None:
+            return
+        now = time.monotonic()
+        for gid in ids:
+            current = self._entries.get(gid)
+            if current is not None and current.fetched_at > started:
+                continue
+            self._store_fetched(gid, rows.get(gid) or database.default_guild_settings(), now)
+
+    def invalidate(self, guild_id: int) -> None:
+        """Drop a guild from the cache, e.g. when the bot leaves it."""
+        self._entries.pop(str(guild_id), None)
+
+    def stats(self) -> dict:
+        return {
+            "cached_guilds": len(self._entries),
+            "inflight_fetches": len(self._inflight),
+            "fetches_issued": self.fetches_issued,
+            "fetches_coalesced": self.fetches_coalesced,
+        }
+
+    def _peek_entry(self, gid: str) -> _CachedSettings:
+        entry = self._entries.get(gid)
+        if entry is None:
+            self._schedule_refresh(gid)
+            return self._default_entry
+        if time.monotonic() - entry.fetched_at >= self.ttl:
+            self._schedule_refresh(gid)
+        return entry
+
+    def _schedule_refresh(self, gid: str) -> asyncio.Task:
+        """Start a fetch for gid, or join the one already in flight (single-flight)."""
+        task = self._inflight.get(gid)
+        if task is not None:
+            self.fetches_coalesced += 1
+            return task
+        self.fetches_issued += 1
+        task = asyncio.get_running_loop().create_task(self._refresh(gid))
+        self._inflight[gid] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(gid, None))
+        return task
+
+    async def _refresh(self, gid: str) -> None:
+        started = time.monotonic()
+        settings = await async_database.fetch_guild_settings(gid)
+        now = time.monotonic()
+        current = self._entries.get(gid)
+        if current is not None and current.fetched_at > started:
+            # A save landed while we were fetching; it is newer than our read.
+            return
+        if settings is not None:
+            self._store_fetched(gid, settings, now)
+        elif current is not None:
+            # Supabase is unreachable: keep serving the last known settings.
+            current.fetched_at = now
+        else:
+            self._store_fetched(gid, database.default_guild_settings(), now)
+
+    def _store_fetched(self, gid: str, settings: dict, now: float) -> None:
+        current = self._entries.get(gid)
+        if current is not None and current.settings == settings:
+            # Unchanged: keep the version so derived data stays valid.
+            current.fetched_at = now
+            return
+        self._entries[gid] = _CachedSettings(settings, now, next(self._versions))
+
+
+settings_store = GuildSettingsStore()
+metrics.register("guild_settings", settings_store.stats)
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+import time
+import config
+import async_database
+from utils import metrics
+from utils.helix import helix, HELIX_BASE_URL, TOKEN_URL
+
+VALIDATE_URL = "https://id.twitch.tv/oauth2/validate"
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+
+class StreamerCredentials:
+    __slots__ = ("discord_id", "twitch_id", "access_token", "refresh_token", "expires_at")
+
+    def __init__(self, discord_id: str, twitch_id: str, access_token: str, refresh_token: str, expires_at: float = 0.0):
+        self.discord_id = discord_id
+        self.twitch_id = twitch_id
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        # 0 = unknown (loaded from storage); the token is used until Twitch rejects it
+        self.expires_at = expires_at
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StreamerTokenManager:
+    """Streamer OAuth tokens kept in memory and refreshed ahead of expiry.
+
+    Credentials are loaded once (encrypted local cache first, then Supabase)
+    and served from memory. A background task refreshes tokens
+    `STREAMER_TOKEN_REFRESH_MARGIN` seconds before they expire, one refresh
+    per streamer at a time, and new tokens are written back to Supabase and
+    the local cache in worker threads. User-token Helix calls therefore
+    only wait on a refresh when Twitch rejects a token outright.
+
+    The local cache is Fernet-encrypted with `STREAMER_TOKEN_CACHE_KEY` and
+    is skipped when the key or the cryptography package is missing.
+    """
+
+    def __init__(self):
+        self._creds: dict[str, StreamerCredentials] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._cache_loaded = False
+        # Loaded from the local cache and not yet checked against Supabase
+        self._unverified: set[str] = set()
+        self._refresher = None
+        self._background: set[asyncio.Task] = set()
+        self._fernet = Fernet(config.STREAMER_TOKEN_CACHE_KEY) if Fernet and config.STREAMER_TOKEN_CACHE_KEY else None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    # ---------- storage ----------
+
+    def _read_cache(self) -> dict:
+        if not self._fernet or not os.path.exists(config.STREAMER_TOKEN_CACHE_PATH):
+            return {}
+        try:
+            with open(config.STREAMER_TOKEN_CACHE_PATH, "rb") as f:
+                return json.loads(self._fernet.decrypt(f.read()))
+        except (InvalidToken, ValueError, OSError) as e:
+            print(f"⚠️ Ignoring unreadable streamer token cache: {e}")
+            return {}
+
+    def _write_cache(self, snapshot: dict) -> None:
+        if not self._fernet:
+            return
+        tmp = config.STREAMER_TOKEN_CACHE_PATH + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(self._fernet.encrypt(json.dumps(snapshot).encode()))
+            os.replace(tmp, config.STREAMER_TOKEN_CACHE_PATH)
+        except OSError as e:
+            print(f"⚠️ Failed to write streamer token cache: {e}")
+
+    def _persist(self, creds: StreamerCredentials) -> None:
+        """Write refreshed tokens to Supabase and the local cache without blocking the loop."""
+        snapshot = {d: c.as_dict() for d, c in self._creds.items()}
+
+        async def write():
+            await async_database.update_streamer_tokens(creds.discord_id, creds.access_token, creds.refresh_token)
+            await asyncio.to_thread(self._write_cache, snapshot)
+
+        self._spawn(write())
+
+    def _spawn(self, coro) -> None:
+        """Run a background write, keeping a reference until it finishes."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        task.add_done_callback(self._report_persist_error)
+
+    @staticmethod
+    def _report_persist_error(task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Persisting streamer tokens failed: {task.exception()}")
+
+    async def _load(self, discord_id: str) -> StreamerCredentials | None:
+        if not self._cache_loaded:
+            self._cache_loaded = True
+            for d, fields in (await asyncio.to_thread(self._read_cache)).items():
+                if d not in self._creds:
+                    self._creds[d] = StreamerCredentials(**fields)
+                    self._unverified.add(d)
+        creds = self._creds.get(discord_id)
+        if creds is not None:
+            if discord_id in self._unverified:
+                return await self._verify_cached(creds)
+            return creds
+        row = await async_database.get_streamer(discord_id)
+        if not row or not row.get("access_token"):
+            return None
+        creds = self._creds[discord_id] = StreamerCredentials(
+            discord_id, row.get("twitch_id"), row["access_token"], row.get("refresh_token")
+        )
+        # Learn the expiry in the background so the refresher can renew it in time
+        task = asyncio.get_running_loop().create_task(self._validate(creds))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return creds
+
+    async def _verify_cached(self, creds: StreamerCredentials) -> StreamerCredentials | None:
+        """Drop cached tokens of a streamer who was unlinked elsewhere; kept if Supabase can't answer."""
+        exists = await async_database.streamer_exists(creds.discord_id)
+        if exists is None:
+            return creds
+        self._unverified.discard(creds.discord_id)
+        if not exists:
+            self.forget(creds.discord_id)
+            return None
+        return creds
+
+    async def _validate(self, creds: StreamerCredentials) -> None:
+        try:
+            async with helix.session().get(VALIDATE_URL, headers={"Authorization": f"OAuth {creds.access_token}"}) as resp:
+                if resp.status == 401:
+                    await self.refresh(creds.discord_id, rejected_token=creds.access_token)
+                    return
+                data = await resp.json(content_type=None)
+            if creds.expires_at == 0.0 and data.get("expires_in"):
+                creds.expires_at = time.time() + int(data["expires_in"])
+        except Exception as e:
+            print(f"⚠️ Validating streamer token for {creds.discord_id} failed: {e}")
+
+    def store(self, discord_id, twitch_id: str, access_token: str, refresh_token: str, expires_in: int = None) -> None:
+        """Remember tokens from a fresh OAuth login (the caller has already saved them)."""
+        expires_at = time.time() + int(expires_in) if expires_in else 0.0
+        self._creds[str(discord_id)] = StreamerCredentials(str(discord_id), twitch_id, access_token, refresh_token, expires_at)
+        self._unverified.discard(str(discord_id))
+        self._spawn(asyncio.to_thread(self._write_cache, {d: c.as_dict() for d, c in self._creds.items()}))
+
+    def forget(self, discord_id) -> None:
+        """Drop a streamer's tokens from memory and the local cache."""
+        discord_id = str(discord_id)
+        self._unverified.discard(discord_id)
+        if self._creds.pop(discord_id, None) is not None:
+            self._spawn(asyncio.to_thread(self._write_cache, {d: c.as_dict() for d, c in self._creds.items()}))
+
+    # ---------- refresh ----------
+
+    async def get_access_token(self, discord_id) -> str | None:
+        creds = await self._load(str(discord_id))
+        if creds is None:
+            return None
+        if creds.expires_at and creds.expires_at <= time.time() + 30:
+            return await self.refresh(discord_id)
+        return creds.access_token
+
+    async def refresh(self, discord_id, rejected_token: str = None) -> str | None:
+        """Refresh a streamer's token; concurrent callers share one request."""
+        discord_id = str(discord_id)
+        creds = await self._load(discord_id)
+        if creds is None or not creds.refresh_token:
+            return None
+        if rejected_token and creds.access_token != rejected_token:
+            # Someone else already replaced the rejected token
+            return creds.access_token
+        task = self._inflight.get(discord_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._refresh(creds))
+            self._inflight[discord_id] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(discord_id, None))
+        return await asyncio.shield(task)
+
+    async def _refresh(self, creds: StreamerCredentials) -> str | None:
+        self.refreshes += 1
+        async with helix.session().post(
+            TOKEN_URL,
+            params={
+                "grant_type": "refresh_token",
+                "refresh_token": creds.refresh_token,
+                "client_id": config.TWITCH_CLIENT_ID,
+                "client_secret": config.TWITCH_CLIENT_SECRET,
+            },
+        ) as resp:
+            if resp.status != 200:
+                self.refresh_failures += 1
+                print(f"⚠️ Streamer token refresh for {creds.discord_id} failed: HTTP {resp.status}")
+                return None
+            data = await resp.json(content_type=None)
+
+        creds.access_token = data.get("access_token")
+        creds.refresh_token = data.get("refresh_token", creds.refresh_token)
+        creds.expires_at = time.time() + int(data.get("expires_in", 3600))
+        self._persist(creds)
+        return creds.access_token
+
+    def start(self) -> None:
+        """Start the background refresher (idempotent)."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(config.STREAMER_TOKEN_CHECK_INTERVAL)
+            due = time.time() + config.STREAMER_TOKEN_REFRESH_MARGIN
+            for creds in list(self._creds.values()):
+                if creds.expires_at and creds.expires_at <= due:
+                    try:
+                        await self.refresh(creds.discord_id)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.refresh_failures += 1
+                        print(f"⚠️ Streamer token refresh for {creds.discord_id} failed: {e}")
+
+    # ---------- user-token Helix calls ----------
+
+    async def request(self, discord_id, method: str, path: str, *, params=None, json=None):
+        """Call Helix with a streamer's user token; returns (status, parsed JSON or None).
+
+        A 401 triggers one refresh and retry.
+        """
+        token = await self.get_access_token(discord_id)
+        if token is None:
+            return 401, None
+        for attempt in range(2):
+            headers = {"Client-ID": config.TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
+            async with helix.session().request(
+                method, f"{HELIX_BASE_URL}/{path}", params=params, json=json, headers=headers
+            ) as resp:
+                if resp.status == 401 and attempt == 0:
+                    token = await self.refresh(discord_id, rejected_token=token)
+                    if token is None:
+                        return 401, None
+                    continue
+                try:
+                    data = await resp.json(content_type=None)
+                except Exception:
+                    data = None
+                return resp.status, data
+
+    def stats(self) -> dict:
+        return {
+            "streamers": len(self._creds),
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "local_cache": self._fernet is not None,
+        }
+
+
+streamer_tokens = StreamerTokenManager()
+metrics.register("streamer_tokens", streamer_tokens.stats)
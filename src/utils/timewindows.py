@@ -0,0 +1,132 @@
+import math
+from collections import OrderedDict, deque
+
+
+class SlidingWindowCounter:
+    """Per-key sliding-window event counter with bounded memory.
+
+    Each key keeps a deque of event timestamps, trimmed from the left as
+    events fall out of the window, so a hit costs O(1) amortised. Keys are
+    kept in least-recently-hit order: `sweep` evicts idle keys from the front
+    without scanning the rest, and `max_keys` is a hard cap enforced by
+    evicting the least recently active key.
+    """
+
+    def __init__(self, max_keys: int, max_events_per_key: int):
+        self.max_keys = max_keys
+        self.max_events_per_key = max_events_per_key
+        self._events: OrderedDict = OrderedDict()
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def hit(self, key, now: float, window: float) -> int:
+        """Record an event for key and return how many fall within the last `window` seconds."""
+        events = self._events.get(key)
+        if events is None:
+            if len(self._events) >= self.max_keys:
+                self._events.popitem(last=False)
+                self.evictions += 1
+            events = self._events[key] = deque(maxlen=self.max_events_per_key)
+        else:
+            self._events.move_to_end(key)
+        events.append(now)
+        cutoff = now - window
+        while events and events[0] <= cutoff:
+            events.popleft()
+        return len(events)
+
+    def sweep(self, now: float, idle: float) -> int:
+        """Drop keys with no event in the last `idle` seconds; returns how many were removed."""
+        removed = 0
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if events and now - events[-1] < idle:
+                break
+            del self._events[key]
+            removed += 1
+        self.evictions += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {"keys": len(self._events), "evictions": self.evictions}
+
+
+class ExpiringDict:
+    """Mapping whose entries expire `ttl` seconds after they were set.
+
+    Insertion times are kept in a deque, which is ordered by construction, so
+    expiry only ever looks at the oldest entries. Expired entries are dropped
+    on every `set`/`pop`, and `max_size` caps memory even if the clock stalls.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._order = deque()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def set(self, key, value, now: float) -> None:
+        self.expire(now)
+        self._data[key] = (now, value)
+        self._order.append((now, key))
+        while len(self._order) > self.max_size:
+            self._drop_oldest()
+
+    def pop(self, key, now: float, default=None):
+        """Remove key and return its value, or `default` if missing or expired."""
+        self.expire(now)
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def expire(self, now: float) -> None:
+        cutoff = now - self.ttl
+        order = self._order
+        while order and order[0][0] < cutoff:
+            self._drop_oldest()
+
+    def _drop_oldest(self) -> None:
+        inserted_at, key = self._order.popleft()
+        item = self._data.get(key)
+        # Skip deque slots left behind by keys that were re-set or popped
+        if item is not None and item[0] == inserted_at:
+            del self._data[key]
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "pending_slots": len(self._order), "dropped": self.dropped}
+
+
+class EwmaRate:
+    """Exponentially weighted event rate, in events per second.
+
+    Each event adds 1 to a value that decays with the given half-life, so a
+    steady rate r settles at r * tau and `rate()` returns r. Updates are O(1)
+    and need no per-event storage; recent bursts show up immediately while
+    old traffic fades smoothly instead of dropping off a window edge.
+    """
+
+    __slots__ = ("tau", "_value", "_updated")
+
+    def __init__(self, halflife: float):
+        self.tau = halflife / math.log(2)
+        self._value = 0.0
+        self._updated = None
+
+    def _decay(self, now: float) -> None:
+        if self._updated is not None and now > self._updated:
+            self._value *= math.exp((self._updated - now) / self.tau)
+        self._updated = now
+
+    def add(self, now: float, count: int = 1) -> None:
+        self._decay(now)
+        self._value += count
+
+    def rate(self, now: float) -> float:
+        self._decay(now)
+        return self._value / self.tau
@@ -1,159 +1,145 @@
 import asyncio
-import aiohttp
+import datetime
+import re
 import time
-import requests
 import discord
 import config
 import hmac
 import hashlib
-from database import get_discord_ids_by_twitch, get_streamer, update_streamer_tokens
+from database import TWITCH_INDEX
+from async_database import get_discord_ids_by_twitch
+from utils.helix import helix
+from utils.ratelimit import AsyncTokenBucket
+from utils.ban_jobs import ban_jobs, BUSY, DUPLICATE
+from utils.streamer_tokens import streamer_tokens
+from utils import metrics
 
 # Global variables
-ban_queue = asyncio.Queue()
-TWITCH_APP_TOKEN = None
-TWITCH_APP_TOKEN_EXPIRES_AT = 0
+_ban_semaphore = asyncio.Semaphore(config.TWITCH_BAN_CONCURRENCY)
+_ban_bucket = AsyncTokenBucket(config.TWITCH_BAN_RATE, burst=config.TWITCH_BAN_CONCURRENCY)
+metrics.register("twitch_index", TWITCH_INDEX.stats)
 
 async def get_twitch_app_token():
     """Get or refresh Twitch app token."""
-    global TWITCH_APP_TOKEN, TWITCH_APP_TOKEN_EXPIRES_AT
-    
-    if TWITCH_APP_TOKEN and time.time() < TWITCH_APP_TOKEN_EXPIRES_AT - 30:
-        return TWITCH_APP_TOKEN
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            "https://id.twitch.tv/oauth2/token",
-            params={
-                "client_id": config.TWITCH_CLIENT_ID,
-                "client_secret": config.TWITCH_CLIENT_SECRET,
-                "grant_type": "client_credentials",
-            },
-        ) as resp:
-            data = await resp.json()
-    
-    if not data or "access_token" not in data:
-        raise RuntimeError(f"Failed to fetch twitch app token: {data}")
-    
-    TWITCH_APP_TOKEN = data["access_token"]
-    expires_in = int(data.get("expires_in", 3600))
-    TWITCH_APP_TOKEN_EXPIRES_AT = time.time() + expires_in
-    return TWITCH_APP_TOKEN
-
-async def handle_twitch_ban(bot, twitch_identifier: str):
-    """Handle Twitch ban event."""
-    if not twitch_identifier:
-        return
+    return await helix.app_token()
 
-    discord_ids = get_discord_ids_by_twitch(twitch_identifier)
-    if not discord_ids:
-        print(f"ℹ️ No Discord account linked for Twitch identifier '{twitch_identifier}'")
-        return
+async def _ban_in_guild(guild, discord_id: int, reason: str, failures: list, retryable: list) -> bool:
+    async with _ban_semaphore:
+        await _ban_bucket.acquire()
+        try:
+            # Banning by ID needs no member lookup, and the ban endpoint is
+            # idempotent: an account that is already banned also succeeds.
+            await guild.ban(discord.Object(id=discord_id), reason=reason)
+            return True
+        except discord.Forbidden:
+            failures.append(f"missing permission to ban {discord_id} in {guild.name}")
+        except discord.NotFound:
+            failures.append(f"unknown user {discord_id} ({guild.name})")
+        except discord.HTTPException as e:
+            if e.status == 429:
+                _ban_bucket.pause(getattr(e, "retry_after", 1.0) or 1.0)
+            failures.append(f"HTTP error banning {discord_id} in {guild.name}: {e}")
+            if e.status == 429 or e.status >= 500:
+                retryable.append(guild.id)
+        except Exception as e:
+            failures.append(f"error banning {discord_id} in {guild.name}: {e}")
+            retryable.append(guild.id)
+        return False
 
-    print(f"ℹ️ Twitch identifier '{twitch_identifier}' maps to Discord IDs: {discord_ids}")
+async def handle_twitch_ban(bot, twitch_identifier: str, received_at: float = None) -> bool:
+    """Handle Twitch ban event.
+
+    Every linked Discord account is banned in every guild concurrently,
+    paced by a shared token bucket. `received_at` is the time.time() of the
+    webhook, so the summary reports end-to-end latency. Returns False when
+    a transient error means the job should be retried.
+    """
+    from utils.helpers import log_to_channel
 
-    for discord_id_str in discord_ids:
+    if not twitch_identifier:
+        return True
+    received_at = received_at or time.time()
+    # Workers start with the bot; bot.guilds is empty until it's ready
+    await bot.wait_until_ready()
+
+    # Normally a dict hit; only an unknown identity goes to the database
+    linked = TWITCH_INDEX.lookup(twitch_identifier)
+    if linked is None:
+        linked = await get_discord_ids_by_twitch(twitch_identifier)
+
+    discord_ids = []
+    for discord_id_str in linked:
         try:
-            discord_id = int(discord_id_str)
+            discord_ids.append(int(discord_id_str))
         except Exception:
             print(f"⚠️ Invalid discord id stored in DB: {discord_id_str}")
-            continue
-
-        for guild in bot.guilds:
-            try:
-                try:
-                    await guild.fetch_ban(discord_id)
-                    print(f"⚠️ Already banned {discord_id} in {guild.name} – skipping")
-                    continue
-                except discord.NotFound:
-                    pass
-                except discord.Forbidden:
-                    msg = f"❌ Missing permission to query bans in {guild.name}"
-                    print(msg)
-                    from utils.helpers import log_to_channel
-                    await log_to_channel(bot, f"[ban] {msg}")
-                    continue
-                except discord.HTTPException as e:
-                    print(f"❌ HTTP error checking bans in {guild.name} for {discord_id}: {e}")
-                    continue
-
-                member = guild.get_member(discord_id)
-                if member is None:
-                    try:
-                        member = await guild.fetch_member(discord_id)
-                    except discord.NotFound:
-                        member = discord.Object(id=discord_id)
-                    except discord.Forbidden:
-                        msg = f"❌ Missing permission to fetch members in {guild.name}"
-                        print(msg)
-                        from utils.helpers import log_to_channel
-                        await log_to_channel(bot, f"[ban] {msg}")
-                        continue
-                    except discord.HTTPException as e:
-                        print(f"❌ HTTP error fetching member {discord_id} in {guild.name}: {e}")
-                        continue
-
-                try:
-                    await guild.ban(member, reason=f"Banned on Twitch ({twitch_identifier})")
-                    msg = f"✅ Banned Discord ID {discord_id} from {guild.name} (Twitch: {twitch_identifier})"
-                    print(msg)
-                    from utils.helpers import log_to_channel
-                    await log_to_channel(bot, f"[ban] {msg}")
-                except discord.Forbidden:
-                    msg = f"❌ Missing permission to ban {discord_id} in {guild.name}"
-                    print(msg)
-                    from utils.helpers import log_to_channel
-                    await log_to_channel(bot, f"[ban] {msg}")
-                except discord.HTTPException as e:
-                    msg = f"❌ HTTP error banning {discord_id} in {guild.name}: {e}"
-                    print(msg)
-                    from utils.helpers import log_to_channel
-                    await log_to_channel(bot, f"[ban] {msg}")
-
-                await asyncio.sleep(0.6)
-
-            except Exception as e:
-                print(f"❌ Unexpected error while processing ban for {discord_id} in {guild.name}: {e}")
-                from utils.helpers import log_to_channel
-                await log_to_channel(bot, f"[ban] ERROR processing {discord_id} in {guild.name}: {e}")
-
-async def ban_worker(bot):
-    """Worker to process ban queue."""
-    while True:
-        twitch_user = await ban_queue.get()
-        await handle_twitch_ban(bot, twitch_user)
-        ban_queue.task_done()
-
-def enqueue_ban_job(twitch_identifier: str):
-    """Add ban job to queue."""
+    if not discord_ids:
+        print(f"ℹ️ No Discord account linked for Twitch identifier '{twitch_identifier}'")
+        return True
+
+    print(f"ℹ️ Twitch identifier '{twitch_identifier}' maps to Discord IDs: {discord_ids}")
+
+    reason = f"Banned on Twitch ({twitch_identifier})"
+    failures = []
+    retryable = []
+    results = await asyncio.gather(*(
+        _ban_in_guild(guild, discord_id, reason, failures, retryable)
+        for discord_id in discord_ids
+        for guild in bot.guilds
+    ))
+    latency = time.time() - received_at
+    banned = sum(1 for ok in results if ok)
+
+    msg = (f"✅ Banned {len(discord_ids)} Discord account(s) for Twitch {twitch_identifier}: "
+           f"{banned}/{len(results)} guild bans applied, {latency:.2f}s after the webhook")
+    if failures:
+        msg += f", {len(failures)} failed"
+    print(msg)
+    await log_to_channel(bot, f"[ban] {msg}")
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        shown = "\n".join(failures[:10])
+        more = f"\n… and {len(failures) - 10} more" if len(failures) > 10 else ""
+        await log_to_channel(bot, f"[ban] Failures for Twitch {twitch_identifier}:\n{shown}{more}")
+    return not retryable
+
+def enqueue_ban_job(twitch_identifier: str, message_id: str = None) -> str:
+    """Durably queue a ban job from any thread; a repeated EventSub message id is ignored.
+
+    Returns the ban_jobs.enqueue result (QUEUED, DUPLICATE or BUSY).
+    """
     if not twitch_identifier:
-        return
-    try:
-        import asyncio
-        asyncio.run_coroutine_threadsafe(ban_queue.put(twitch_identifier), asyncio.get_event_loop())
-    except Exception as e:
-        print("enqueue_ban_job error:", e)
+        return DUPLICATE
+    result = ban_jobs.enqueue(twitch_identifier, idem_key=message_id, received_at=time.time())
+    if result == DUPLICATE:
+        print(f"ℹ️ Duplicate ban event {message_id} for {twitch_identifier} ignored")
+    elif result == BUSY:
+        print(f"⚠️ Ban queue full; asking Twitch to redeliver {message_id} for {twitch_identifier}")
+    return result
 
 async def twitch_get_user_by_login(login: str):
     """Get Twitch user by login."""
     if not login:
         return None
-    token = await get_twitch_app_token()
-    headers = {"Client-ID": config.TWITCH_CLIENT_ID, "Authorization": f"Bearer {token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(
-            "https://api.twitch.tv/helix/users",
-            params={"login": login},
-            headers=headers,
-        ) as resp:
-            try:
-                data = await resp.json()
-            except Exception:
-                return None
+    _, data = await helix.get("users", params={"login": login})
     if not data or not data.get("data"):
         return None
     return data["data"][0]
 
-def verify_twitch_signature(flask_request) -> bool:
+def eventsub_message_age(timestamp: str) -> float | None:
+    """Seconds since an EventSub message timestamp (RFC 3339, up to nanosecond precision)."""
+    try:
+        # fromisoformat takes at most microseconds and, before 3.11, no "Z"
+        ts = re.sub(r"(\.\d{6})\d+", r"\1", timestamp).replace("Z", "+00:00")
+        sent = datetime.datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+    if sent.tzinfo is None:
+        sent = sent.replace(tzinfo=datetime.timezone.utc)
+    return (datetime.datetime.now(datetime.timezone.utc) - sent).total_seconds()
+
+def verify_twitch_signature(headers, body: bytes) -> bool:
     """Verify Twitch webhook signature."""
     try:
         secret = config.TWITCH_EVENTSUB_SECRET
@@ -161,10 +147,10 @@ def verify_twitch_signature(flask_request) -> bool:
             print("verify_twitch_signature: no TWITCH_EVENTSUB_SECRET configured.")
             return False
 
-        sig_header = flask_request.headers.get("Twitch-Eventsub-Message-Signature")
-        msg_id = flask_request.headers.get("Twitch-Eventsub-Message-Id")
-        msg_ts = flask_request.headers.get("Twitch-Eventsub-Message-Timestamp")
-        body = flask_request.get_data() or b""
+        sig_header = headers.get("Twitch-Eventsub-Message-Signature")
+        msg_id = headers.get("Twitch-Eventsub-Message-Id")
+        msg_ts = headers.get("Twitch-Eventsub-Message-Timestamp")
+        body = body or b""
 
         if not sig_header or not msg_id or not msg_ts:
             print("verify_twitch_signature: missing Twitch signature headers.")
@@ -193,30 +179,6 @@ def verify_twitch_signature(flask_request) -> bool:
         print("verify_twitch_signature exception:", e)
         return False
 
-def refresh_streamer_token(discord_id: str):
+async def refresh_streamer_token(discord_id: str):
     """Refresh streamer's OAuth token."""
-    streamer = get_streamer(str(discord_id))
-    if not streamer or not streamer.get("refresh_token"):
-        return None
-    
-    refresh_token = streamer["refresh_token"]
-    resp = requests.post(
-        "https://id.twitch.tv/oauth2/token",
-        params={
-            "grant_type": "refresh_token",
-            "refresh_token": refresh_token,
-            "client_id": config.TWITCH_CLIENT_ID,
-            "client_secret": config.TWITCH_CLIENT_SECRET,
-        },
-        timeout=10,
-    )
-    if resp.status_code != 200:
-        return None
-    
-    data = resp.json()
-    new_access = data.get("access_token")
-    new_refresh = data.get("refresh_token", refresh_token)
-    
-    update_streamer_tokens(str(discord_id), new_access, new_refresh)
-    
-    return new_access
\ No newline at end of file
+    return await streamer_tokens.refresh(str(discord_id))
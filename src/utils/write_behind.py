@@ -0,0 +1,376 @@
+import asyncio
+import itertools
+import json
+import sqlite3
+import threading
+import time
+import config
+from utils import metrics
+from utils.postgrest import postgrest, eq, in_
+from utils.replica import replica, REPLICATED_TABLES
+
+UPSERT = "upsert"
+UPDATE = "update"
+DELETE = "delete"
+# Delete followed by an upsert of the same row: columns the new row doesn't set must not survive
+REPLACE = "replace"
+
+# Tables that accept deferred writes, with their primary key columns
+KEY_COLUMNS = {
+    **REPLICATED_TABLES,
+    "timezone_embeds": "guild_id",
+    "birthday_embeds": "guild_id",
+    "birthday_channels": "guild_id",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_writes (
+    tbl TEXT NOT NULL,
+    pk TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT,
+    seq INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    PRIMARY KEY (tbl, pk)
+) WITHOUT ROWID;
+"""
+
+
+def _coalesce(prev_op, prev_data, op, data):
+    """Fold a new write into the one already pending for the same row."""
+    if prev_op is None:
+        return op, data
+    if op == DELETE:
+        return DELETE, None
+    if prev_op == DELETE:
+        # Updating a deleted row changes nothing; an upsert recreates it from scratch
+        return (REPLACE, data) if op == UPSERT else (DELETE, None)
+    merged = {**prev_data, **data}
+    if prev_op == UPDATE and op == UPSERT:
+        return UPSERT, merged
+    return prev_op, merged
+
+
+class _PendingWrite:
+    __slots__ = ("table", "pk", "op", "data", "seq")
+
+    def __init__(self, table: str, pk: str, op: str, data: dict | None, seq: int):
+        self.table = table
+        self.pk = pk
+        self.op = op
+        self.data = data
+        self.seq = seq
+
+
+class WriteBehindQueue:
+    """Deferred Supabase writes, journaled to local SQLite and flushed in batches.
+
+    A write is acknowledged once it is in the journal (and, for replicated
+    tables, in the local replica), so commands don't wait on Supabase.
+    Writes to the same row coalesce into one pending entry: ten page flips
+    on an embed become a single PATCH. Every WRITE_BEHIND_FLUSH_INTERVAL
+    seconds, or as soon as WRITE_BEHIND_MAX_BATCH rows are waiting, the
+    journal is flushed with one bulk upsert per table and column set and one
+    `in.(...)` delete per table; plain updates are sent concurrently.
+
+    An entry leaves the journal only after Supabase accepted it, and only if
+    no newer write to the row arrived meanwhile, so a crash or outage
+    replays it later. Failed rows back off exponentially and are parked
+    after WRITE_BEHIND_MAX_ATTEMPTS; their replica rows are then re-read
+    from Supabase so the local copy doesn't keep a write that never landed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._seq = None
+        self._pending = {}   # table -> set of pks in the journal
+        self._wakeup = None
+        self._flush_lock = None
+        self._task = None
+        self.enqueued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.requests = 0
+        self.failures = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            (last,) = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM pending_writes").fetchone()
+            self._seq = itertools.count(last + 1)
+            # Parked rows aren't pending: the replica may sync over them
+            for table, pk in conn.execute(
+                "SELECT tbl, pk FROM pending_writes WHERE attempts < ?", (config.WRITE_BEHIND_MAX_ATTEMPTS,)
+            ):
+                self._pending.setdefault(table, set()).add(pk)
+            self._conn = conn
+        return self._conn
+
+    def open(self) -> None:
+        with self._lock:
+            self._db()
+
+    def pending_keys(self, table: str) -> frozenset:
+        """Primary keys of `table` with writes Supabase hasn't received yet."""
+        with self._lock:
+            return frozenset(self._pending.get(table, ()))
+
+    def pending_rows(self, table: str) -> dict:
+        """Queued writes to `table` as pk -> (op, data), for readers that bypass the replica.
+
+        Parked rows are left out: Supabase's copy is what stands for them.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT pk, op, data FROM pending_writes WHERE tbl = ? AND attempts < ?",
+                (table, config.WRITE_BEHIND_MAX_ATTEMPTS),
+            ).fetchall()
+        return {pk: (op, json.loads(d) if d else None) for pk, op, d in rows}
+
+    def overlay(self, table: str, rows: list, before: dict, pk=None) -> list:
+        """Apply queued writes to rows just read from Supabase.
+
+        `before` is `pending_rows` taken ahead of the read, so a write flushed
+        while the read was in flight still shows; pass `pk` when the read was
+        for a single row.
+        """
+        key = KEY_COLUMNS[table]
+        pending = {**before, **self.pending_rows(table)}
+        if pk is not None:
+            pending = {str(pk): pending[str(pk)]} if str(pk) in pending else {}
+        if not pending:
+            return rows
+        merged = {str(r[key]): r for r in rows}
+        for row_pk, (op, data) in pending.items():
+            if op == DELETE:
+                merged.pop(row_pk, None)
+            elif op == REPLACE:
+                merged[row_pk] = data
+            elif op == UPSERT:
+                merged[row_pk] = {**merged.get(row_pk, {}), **data}
+            elif row_pk in merged:
+                merged[row_pk] = {**merged[row_pk], **data}
+        return list(merged.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(pks) for pks in self._pending.values())
+
+    # ---- journal ----
+
+    def _journal(self, table: str, pk: str, op: str, data: dict | None) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                row = db.execute(
+                    "SELECT op, data FROM pending_writes WHERE tbl = ? AND pk = ?", (table, pk)
+                ).fetchone()
+                prev_op, prev_data = (row[0], json.loads(row[1]) if row[1] else None) if row else (None, None)
+                op, data = _coalesce(prev_op, prev_data, op, data)
+                db.execute(
+                    "INSERT OR REPLACE INTO pending_writes (tbl, pk, op, data, seq) VALUES (?, ?, ?, ?, ?)",
+                    (table, pk, op, json.dumps(data) if data is not None else None, next(self._seq)),
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            self._pending.setdefault(table, set()).add(pk)
+        self.enqueued += 1
+        if row:
+            self.coalesced += 1
+
+    async def _submit(self, table: str, pk, op: str, data: dict | None) -> None:
+        pk = str(pk)
+        await asyncio.to_thread(self._journal, table, pk, op, data)
+        if op == DELETE:
+            await replica.remove(table, [pk])
+        elif op == UPDATE:
+            await replica.patch(table, [data])
+        else:
+            await replica.put(table, [data])
+        if self._wakeup is not None and len(self) >= config.WRITE_BEHIND_MAX_BATCH:
+            self._wakeup.set()
+
+    async def upsert(self, table: str, row: dict) -> None:
+        """Queue an insert-or-merge of a row (which must include its primary key)."""
+        await self._submit(table, row[KEY_COLUMNS[table]], UPSERT, dict(row))
+
+    async def update(self, table: str, pk, values: dict) -> None:
+        """Queue an update of an existing row; a missing row stays missing."""
+        await self._submit(table, pk, UPDATE, {KEY_COLUMNS[table]: str(pk), **values})
+
+    async def delete(self, table: str, pk) -> None:
+        await self._submit(table, pk, DELETE, None)
+
+    # ---- flush ----
+
+    def _due(self, now: float) -> list:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT tbl, pk, op, data, seq FROM pending_writes "
+                "WHERE attempts < ? AND next_attempt_at <= ? ORDER BY seq",
+                (config.WRITE_BEHIND_MAX_ATTEMPTS, now),
+            ).fetchall()
+        return [_PendingWrite(t, pk, op, json.loads(d) if d else None, seq) for t, pk, op, d, seq in rows]
+
+    def _settle(self, done: list, failed: list) -> list:
+        """Record a flush's outcome; returns the writes that were just parked."""
+        now = time.time()
+        parked = []
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            try:
+                for w in done:
+                    # A newer write to the row (higher seq) stays queued
+                    if db.execute(
+                        "DELETE FROM pending_writes WHERE tbl = ? AND pk = ? AND seq = ?", (w.table, w.pk, w.seq)
+                    ).rowcount:
+                        self._pending.get(w.table, set()).discard(w.pk)
+                for w, error in failed:
+                    db.execute(
+                        "UPDATE pending_writes SET attempts = attempts + 1, last_error = ?, "
+                        "next_attempt_at = ? + ? * (1 << attempts) WHERE tbl = ? AND pk = ? AND seq = ?",
+                        (error[:500], now, config.WRITE_BEHIND_RETRY_BASE, w.table, w.pk, w.seq),
+                    )
+                    row = db.execute(
+                        "SELECT attempts FROM pending_writes WHERE tbl = ? AND pk = ? AND seq = ?", (w.table, w.pk, w.seq)
+                    ).fetchone()
+                    if row and row[0] >= config.WRITE_BEHIND_MAX_ATTEMPTS:
+                        parked.append(w)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            for w in parked:
+                self._pending.get(w.table, set()).discard(w.pk)
+        return parked
+
+    async def _resync_parked(self, parked: list) -> None:
+        """Put Supabase's copy of parked rows back in the replica, which had the write that never landed."""
+        by_table = {}
+        for w in parked:
+            by_table.setdefault(w.table, []).append(w.pk)
+        for table, pks in by_table.items():
+            print(f"⚠️ Write-behind gave up on {len(pks)} {table} row(s) after "
+                  f"{config.WRITE_BEHIND_MAX_ATTEMPTS} attempts; they stay parked in the journal")
+            try:
+                await replica.resync(table, pks)
+            except Exception as e:
+                print(f"⚠️ Re-syncing parked {table} rows failed, the next full sync will: {e}")
+
+    async def _send(self, table: str, op: str, writes: list) -> None:
+        key = KEY_COLUMNS[table]
+        if op in (DELETE, REPLACE):
+            for i in range(0, len(writes), 100):
+                self.requests += 1
+                await postgrest.delete(table, {key: in_([w.pk for w in writes[i:i + 100]])})
+        if op in (UPSERT, REPLACE):
+            for i in range(0, len(writes), 500):
+                self.requests += 1
+                await postgrest.upsert(table, [w.data for w in writes[i:i + 500]])
+        if op == UPDATE:
+            for w in writes:
+                self.requests += 1
+                values = {c: v for c, v in w.data.items() if c != key}
+                await postgrest.update(table, values, {key: eq(w.pk)})
+
+    async def flush(self) -> int:
+        """Send everything that is due; returns how many rows Supabase accepted."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            writes = await asyncio.to_thread(self._due, time.time())
+            if not writes:
+                return 0
+
+            # Bulk upserts need every row to have the same columns;
+            # PostgREST has no bulk PATCH, so each update is its own group
+            groups = {}
+            for w in writes:
+                if w.op == UPDATE:
+                    shape = w.pk
+                elif w.op == DELETE:
+                    shape = None
+                else:
+                    shape = tuple(sorted(w.data))
+                groups.setdefault((w.table, w.op, shape), []).append(w)
+
+            done, failed = [], []
+
+            async def send(table, op, group):
+                try:
+                    await self._send(table, op, group)
+                    done.extend(group)
+                except Exception as e:
+                    failed.extend((w, str(e)) for w in group)
+
+            await asyncio.gather(*(send(table, op, group) for (table, op, _), group in groups.items()))
+            parked = await asyncio.to_thread(self._settle, done, failed)
+            self.flushed += len(done)
+            if failed:
+                self.failures += len(failed)
+                print(f"⚠️ Write-behind flush: {len(done)} row(s) written, {len(failed)} failed "
+                      f"(e.g. {failed[0][0].table}: {failed[0][1]})")
+            if parked:
+                await self._resync_parked(parked)
+            return len(done)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Write-behind flush failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.WRITE_BEHIND_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """Start the flusher (idempotent); anything left in the journal is sent first."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the flusher and make a final attempt to send what is queued."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"⚠️ Final write-behind flush failed, rows stay in the journal: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            (parked,) = self._db().execute(
+                "SELECT COUNT(*) FROM pending_writes WHERE attempts >= ?", (config.WRITE_BEHIND_MAX_ATTEMPTS,)
+            ).fetchone()
+        return {
+            "pending": len(self),
+            "parked": parked,
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+write_behind = WriteBehindQueue(config.WRITE_BEHIND_DB_PATH)
+replica.pending_keys = write_behind.pending_keys
+metrics.register("write_behind", write_behind.stats)
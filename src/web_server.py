@@ -1,29 +1,60 @@
 # ========== web_server.py ==========
-from flask import Flask, request
-import threading
-import requests
+import asyncio
+import json
 import os
+import time
+import aiohttp
+from aiohttp import web
 import config
-from database import upsert_user, upsert_streamer
-from utils.twitch_utils import enqueue_ban_job, verify_twitch_signature
-
-app = Flask(__name__)
-
-@app.route("/")
-def index():
-    return "OAuth2 Server Running!"
-
-@app.route("/callback")
-def callback():
+from async_database import upsert_user, upsert_streamer
+from utils.helix import helix
+from utils.streamer_tokens import streamer_tokens
+from utils.twitch_utils import enqueue_ban_job, verify_twitch_signature, eventsub_message_age
+from utils.ban_jobs import BUSY
+from utils.lru import LRUCache
+from utils import metrics
+
+# OAuth round trips share the pooled Helix session; they are plain HTTPS calls
+http = helix.session
+
+routes = web.RouteTableDef()
+
+# EventSub message ids that were already acknowledged
+replay_cache = LRUCache(config.EVENTSUB_REPLAY_CACHE_SIZE)
+eventsub_counters = {"received": 0, "replays_dropped": 0, "stale_rejected": 0, "ack_ms_max": 0.0}
+
+def eventsub_stats() -> dict:
+    return {**eventsub_counters, "replay_cache": len(replay_cache)}
+
+metrics.register("eventsub", eventsub_stats)
+
+class OAuthError(Exception):
+    def __init__(self, status: int, text: str):
+        super().__init__(f"{status} {text}")
+        self.status = status
+        self.text = text
+
+async def _fetch_json(method: str, url: str, **kwargs):
+    async with http().request(method, url, **kwargs) as resp:
+        if resp.status >= 400:
+            raise OAuthError(resp.status, await resp.text())
+        return await resp.json(content_type=None)
+
+@routes.get("/")
+async def index(request):
+    return web.Response(text="OAuth2 Server Running!")
+
+@routes.get("/callback")
+async def callback(request):
     """Discord OAuth callback for linking Twitch/YouTube accounts."""
     try:
-        code = request.args.get("code")
-        state = request.args.get("state")
+        code = request.query.get("code")
+        state = request.query.get("state")
         if not code:
-            return "No code provided", 400
+            return web.Response(text="No code provided", status=400)
 
         if not config.CLIENT_ID or not config.CLIENT_SECRET or not config.REDIRECT_URI or str(config.REDIRECT_URI).strip().lower() in {"none", "null", ""}:
-            return "OAuth not configured on server.", 400
+            return web.Response(text="OAuth not configured on server.", status=400)
 
         data = {
             "client_id": config.CLIENT_ID,
@@ -32,19 +63,15 @@ def callback():
             "code": code,
             "redirect_uri": config.REDIRECT_URI
         }
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-        token_res = requests.post("https://discord.com/api/oauth2/token", data=data, headers=headers, timeout=10)
-        token_res.raise_for_status()
-        access_token = token_res.json().get("access_token")
-
-        user_res = requests.get("https://discord.com/api/users/@me", headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
-        user_res.raise_for_status()
-        user_data = user_res.json()
-        discord_id = user_data["id"]
+        token_data = await _fetch_json("POST", "https://discord.com/api/oauth2/token", data=data)
+        access_token = token_data.get("access_token")
 
-        conn_res = requests.get("https://discord.com/api/users/@me/connections", headers={"Authorization": f"Bearer {access_token}"}, timeout=10)
-        conn_res.raise_for_status()
-        connections = conn_res.json()
+        auth = {"Authorization": f"Bearer {access_token}"}
+        user_data, connections = await asyncio.gather(
+            _fetch_json("GET", "https://discord.com/api/users/@me", headers=auth),
+            _fetch_json("GET", "https://discord.com/api/users/@me/connections", headers=auth),
+        )
+        discord_id = user_data["id"]
 
         twitch_name = None
         youtube_name = None
@@ -55,31 +82,31 @@ def callback():
                 youtube_name = c.get("name")
 
         # Upsert user with Supabase
-        upsert_user(discord_id, twitch_username=twitch_name, youtube_channel=youtube_name)
+        await upsert_user(discord_id, twitch_username=twitch_name, youtube_channel=youtube_name)
 
         if state == "youtube":
-            return f"✅ Linked successfully! YouTube: {youtube_name}"
-        return f"✅ Linked successfully! Twitch: {twitch_name}"
-
-    except requests.HTTPError as e:
-        try:
-            return f"OAuth error: {e.response.status_code} {e.response.text}", 400
-        except Exception:
-            return f"OAuth HTTP error: {e}", 400
+            return web.Response(text=f"✅ Linked successfully! YouTube: {youtube_name}")
+        return web.Response(text=f"✅ Linked successfully! Twitch: {twitch_name}")
+
+    except OAuthError as e:
+        return web.Response(text=f"OAuth error: {e.status} {e.text}", status=400)
+    except aiohttp.ClientError as e:
+        return web.Response(text=f"OAuth HTTP error: {e}", status=400)
     except Exception as e:
-        return f"Unexpected error: {e}", 500
+        return web.Response(text=f"Unexpected error: {e}", status=500)
 
-@app.route("/twitch/streamer/callback")
-def twitch_streamer_callback():
+@routes.get("/twitch/streamer/callback")
+async def twitch_streamer_callback(request):
     """Twitch OAuth callback for streamers."""
     try:
-        code = request.args.get("code")
-        state = request.args.get("state")  # this is ctx.author.id passed in the link
+        code = request.query.get("code")
+        state = request.query.get("state")  # this is ctx.author.id passed in the link
 
         if not code or not state:
-            return "Missing code or state", 400
+            return web.Response(text="Missing code or state", status=400)
 
-        token_res = requests.post(
+        token_data = await _fetch_json(
+            "POST",
             "https://id.twitch.tv/oauth2/token",
             params={
                 "client_id": config.TWITCH_CLIENT_ID,
@@ -88,81 +115,117 @@ def twitch_streamer_callback():
                 "grant_type": "authorization_code",
                 "redirect_uri": config.TWITCH_STREAMER_REDIRECT_URI,
             },
-            timeout=10,
         )
-        token_res.raise_for_status()
-        token_data = token_res.json()
 
         access_token = token_data.get("access_token")
         refresh_token = token_data.get("refresh_token")
 
         if not access_token:
-            return f"Failed to get access token: {token_data}", 400
+            return web.Response(text=f"Failed to get access token: {token_data}", status=400)
 
         headers = {
             "Client-ID": config.TWITCH_CLIENT_ID,
             "Authorization": f"Bearer {access_token}"
         }
-        user_res = requests.get("https://api.twitch.tv/helix/users", headers=headers, timeout=10)
-        user_res.raise_for_status()
-        user_data = user_res.json().get("data", [])
+        user_res = await _fetch_json("GET", "https://api.twitch.tv/helix/users", headers=headers)
+        user_data = user_res.get("data", [])
         if not user_data:
-            return "Failed to fetch Twitch user info", 400
+            return web.Response(text="Failed to fetch Twitch user info", status=400)
 
         user = user_data[0]
         twitch_id = user["id"]
         twitch_login = user["login"]
 
         # Upsert streamer with Supabase
-        upsert_streamer(str(state), twitch_id, twitch_login, access_token, refresh_token)
+        await upsert_streamer(str(state), twitch_id, twitch_login, access_token, refresh_token)
+        streamer_tokens.store(str(state), twitch_id, access_token, refresh_token, token_data.get("expires_in"))
 
         # Also update users table
-        upsert_user(str(state), twitch_username=twitch_login)
+        await upsert_user(str(state), twitch_username=twitch_login)
 
-        return f"✅ Successfully linked Twitch streamer account <b>{twitch_login}</b> (ID: {twitch_id}). You can close this page."
+        return web.Response(
+            text=f"✅ Successfully linked Twitch streamer account <b>{twitch_login}</b> (ID: {twitch_id}). You can close this page.",
+            content_type="text/html",
+        )
 
-    except requests.HTTPError as e:
-        try:
-            return f"OAuth error: {e.response.status_code} {e.response.text}", 400
-        except Exception:
-            return f"OAuth HTTP error: {e}", 400
+    except OAuthError as e:
+        return web.Response(text=f"OAuth error: {e.status} {e.text}", status=400)
+    except aiohttp.ClientError as e:
+        return web.Response(text=f"OAuth HTTP error: {e}", status=400)
     except Exception as e:
-        return f"Unexpected error: {e}", 500
-
-@app.route("/twitch/events", methods=["POST"])
-def twitch_events():
-    """Handle Twitch EventSub webhooks."""
-    if not verify_twitch_signature(request):
-        return "❌ Invalid signature", 403
+        return web.Response(text=f"Unexpected error: {e}", status=500)
+
+@routes.post("/twitch/events")
+async def twitch_events(request):
+    """Handle Twitch EventSub webhooks.
+
+    Only verification and a durable enqueue happen before the response;
+    the ban itself is processed by the ban job workers, so Twitch gets its
+    2xx within milliseconds and never retries because of slow handling.
+    """
+    started = time.perf_counter()
+    body = await request.read()
+    if not verify_twitch_signature(request.headers, body):
+        return web.Response(text="❌ Invalid signature", status=403)
+
+    eventsub_counters["received"] += 1
+    message_id = request.headers.get("Twitch-Eventsub-Message-Id")
+    age = eventsub_message_age(request.headers.get("Twitch-Eventsub-Message-Timestamp"))
+    if age is None or abs(age) > config.EVENTSUB_MAX_MESSAGE_AGE:
+        eventsub_counters["stale_rejected"] += 1
+        return web.Response(text="Stale message", status=403)
+    if replay_cache.get(message_id) is not None:
+        # Already acknowledged: answer 2xx so Twitch stops redelivering
+        eventsub_counters["replays_dropped"] += 1
+        return web.Response(status=204)
 
-    payload = request.json or {}
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        payload = {}
     
     # Handle webhook verification challenge
     if "challenge" in payload:
-        return payload["challenge"], 200
-
-    subscription_type = payload.get("subscription", {}).get("type")
-    event = payload.get("event", {}) or {}
-
-    if subscription_type == "channel.ban":
-        user_id = event.get("user_id")
-        user_login = event.get("user_login")
-        if user_id:
-            enqueue_ban_job(user_id)
-            print(f"📩 channel.ban event received for user_id {user_id}")
-        elif user_login:
-            enqueue_ban_job(user_login.lower())
-            print(f"📩 channel.ban event received for login {user_login}")
-    
-    return "", 200
-
-def start_flask_server():
-    """Start Flask server in a separate thread."""
+        return web.Response(text=payload["challenge"])
+
+    message_type = request.headers.get("Twitch-Eventsub-Message-Type")
+    subscription = payload.get("subscription", {}) or {}
+    if message_type == "revocation":
+        print(f"⚠️ EventSub subscription {subscription.get('id')} revoked: {subscription.get('status')}")
+    elif subscription.get("type") == "channel.ban":
+        event = payload.get("event", {}) or {}
+        identifier = event.get("user_id") or (event.get("user_login") or "").lower()
+        if identifier:
+            try:
+                result = await asyncio.to_thread(enqueue_ban_job, identifier, message_id)
+            except Exception as e:
+                print("enqueue_ban_job error:", e)
+                return web.Response(text="Failed to queue event", status=500)
+            if result == BUSY:
+                # Non-2xx makes Twitch redeliver later instead of us dropping the event
+                return web.Response(text="Busy", status=503)
+            print(f"📩 channel.ban event received for {identifier}")
+
+    replay_cache.set(message_id, True)
+    ack_ms = (time.perf_counter() - started) * 1000
+    eventsub_counters["ack_ms_max"] = max(eventsub_counters["ack_ms_max"], round(ack_ms, 2))
+    return web.Response(status=204)
+
+app = web.Application()
+app.add_routes(routes)
+_runner = None
+
+async def start_web_server():
+    """Serve the OAuth callbacks and EventSub webhook on the bot's event loop."""
+    global _runner
     port = int(os.environ.get("PORT", getattr(config, "FLASK_PORT", 5000)))
-    
-    def run_flask():
-        app.run(host="0.0.0.0", port=port)
-    
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    print(f"Flask server started on port {port}")
\ No newline at end of file
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host="0.0.0.0", port=port).start()
+    print(f"Web server started on port {port}")
+
+async def stop_web_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None